@@ -0,0 +1,137 @@
+"""Micro-benchmark del análisis de descriptores OVF
+
+Compara el parser actual de ovf.py (iterparse en una sola pasada) con el
+anterior (quitar namespaces con una regex, construir el árbol completo y
+recorrerlo con findall) sobre descriptores sintéticos con muchas máquinas.
+
+Uso: python bench_ovf.py [máquinas ...]
+"""
+import io
+import re
+import sys
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from ovf import extraer_ovf
+
+def analizar_ovf_anterior(content):
+    """Parser de OVF anterior (árbol completo + regex) para comparar
+    
+    Es el cuerpo del analizar_ovf original, salvo que recibe el texto en lugar de leer
+    el archivo y usa el `re` del módulo en vez de importarlo dentro de la función.
+    """
+    metadata = {}
+    
+    try:
+        # Limpiar namespaces para facilitar el parsing
+        content_clean = re.sub(r'xmlns="[^"]+"', '', content)
+        
+        try:
+            root = ET.fromstring(content_clean)
+            
+            # Información básica
+            name_elem = root.find('.//Name')
+            if name_elem is not None and name_elem.text:
+                metadata['vm_name'] = name_elem.text
+            
+            # Sistema operativo
+            os_elem = root.find('.//OperatingSystemSection')
+            if os_elem is not None:
+                os_type = os_elem.get('{http://schemas.dmtf.org/ovf/envelope/1}id', '')
+                if os_type:
+                    metadata['os_type'] = os_type
+            
+            # Hardware
+            virtual_system = root.find('.//VirtualSystem')
+            if virtual_system is not None:
+                system_type = virtual_system.get('{http://schemas.dmtf.org/ovf/envelope/1}id', '')
+                if system_type:
+                    metadata['system_type'] = system_type
+            
+            # Memoria
+            namespaces = {'rasd': 'http://schemas.dmtf.org/wbem/wscim/1/cim-schema/2/CIM_ResourceAllocationSettingData'}
+            
+            for elem in root.findall('.//'):
+                if 'Memory' in elem.tag or 'RAM' in elem.tag:
+                    for child in elem:
+                        if 'VirtualQuantity' in child.tag:
+                            try:
+                                memory_mb = int(child.text) // 1024
+                                metadata['memory_mb'] = memory_mb
+                            except:
+                                pass
+            
+            # Discos
+            disk_elements = root.findall('.//rasd:HostResource', namespaces=namespaces)
+            if disk_elements:
+                metadata['disks'] = len(disk_elements)
+            
+            # Redes
+            network_elements = root.findall('.//NetworkSection/Network')
+            if network_elements:
+                metadata['networks'] = len(network_elements)
+                
+        except ET.ParseError:
+            # Intentar extraer información de forma básica
+            if 'VirtualBox' in content:
+                metadata['created_with'] = 'VirtualBox'
+            elif 'VMware' in content:
+                metadata['created_with'] = 'VMware'
+    
+    except Exception as e:
+        print(f"Error analizando OVF: {e}")
+    
+    return metadata
+
+def generar_ovf(maquinas, items_por_maquina=40):
+    """Descriptor OVF con una VirtualSystemCollection de `maquinas` máquinas"""
+    partes = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Envelope ovf:version="1.0" xmlns="http://schemas.dmtf.org/ovf/envelope/1" '
+        'xmlns:ovf="http://schemas.dmtf.org/ovf/envelope/1" '
+        'xmlns:rasd="http://schemas.dmtf.org/wbem/wscim/1/cim-schema/2/CIM_ResourceAllocationSettingData">\n'
+        '<References>'
+    ]
+    partes += [f'<File ovf:href="disk{i}.vmdk" ovf:id="file{i}"/>' for i in range(maquinas)]
+    partes.append('</References>\n<DiskSection><Info>Discos</Info>')
+    partes += [f'<Disk ovf:capacity="20" ovf:capacityAllocationUnits="byte * 2^30" ovf:diskId="vmdisk{i}" '
+               f'ovf:fileRef="file{i}"/>' for i in range(maquinas)]
+    partes.append('</DiskSection>\n<NetworkSection><Info>Redes</Info><Network ovf:name="NAT"/></NetworkSection>\n'
+                  '<VirtualSystemCollection ovf:id="coleccion"><Info>Varias máquinas</Info>\n')
+    for i in range(maquinas):
+        partes.append(f'<VirtualSystem ovf:id="vm{i}"><Info>Máquina</Info><Name>vm{i}</Name>'
+                      '<OperatingSystemSection ovf:id="96"><Info>SO</Info><Description>Debian_64</Description>'
+                      '</OperatingSystemSection><VirtualHardwareSection><Info>Hardware</Info>'
+                      '<Item><rasd:ResourceType>3</rasd:ResourceType><rasd:VirtualQuantity>2</rasd:VirtualQuantity></Item>'
+                      '<Item><rasd:AllocationUnits>byte * 2^20</rasd:AllocationUnits><rasd:ResourceType>4</rasd:ResourceType>'
+                      '<rasd:VirtualQuantity>2048</rasd:VirtualQuantity></Item>'
+                      f'<Item><rasd:HostResource>ovf:/disk/vmdisk{i}</rasd:HostResource><rasd:ResourceType>17</rasd:ResourceType></Item>')
+        partes += [f'<Item><rasd:ElementName>dispositivo {j}</rasd:ElementName><rasd:InstanceID>{j}</rasd:InstanceID>'
+                   f'<rasd:ResourceType>1</rasd:ResourceType></Item>' for j in range(items_por_maquina)]
+        partes.append('</VirtualHardwareSection></VirtualSystem>\n')
+    partes.append('</VirtualSystemCollection>\n</Envelope>\n')
+    return ''.join(partes).encode('utf-8')
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo por llamada (s) y pico de memoria (bytes) de funcion()"""
+    tiempo = min(timeit.repeat(funcion, number=repeticiones, repeat=3)) / repeticiones
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tiempo, pico
+
+def main():
+    tamaños = [int(n) for n in sys.argv[1:]] or [1, 10, 100, 1000]
+    print(f"{'máquinas':>9} {'KB':>8} {'anterior ms':>12} {'iterparse ms':>13} {'x':>6} {'mem ant. KB':>12} {'mem iter. KB':>13}")
+    for maquinas in tamaños:
+        datos = generar_ovf(maquinas)
+        repeticiones = max(1, 200 // maquinas)
+        t_anterior, m_anterior = medir(lambda: analizar_ovf_anterior(datos.decode('utf-8', errors='ignore')), repeticiones)
+        t_nuevo, m_nuevo = medir(lambda: extraer_ovf(io.BytesIO(datos)), repeticiones)
+        print(f"{maquinas:>9} {len(datos) // 1024:>8} {t_anterior * 1000:>12.2f} {t_nuevo * 1000:>13.2f} "
+              f"{t_anterior / t_nuevo:>6.1f} {m_anterior // 1024:>12} {m_nuevo // 1024:>13}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Lectura de descriptores OVF (máquinas virtuales)
+
+Separado de server.py para poder usarlo sin arrancar nada: importar server.py crea
+las carpetas de subidas y abre el catálogo y las cachés del directorio actual.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+# Namespaces del estándar OVF (1.x y 2.x) y de las extensiones de cada fabricante
+OVF_NAMESPACES = ('http://schemas.dmtf.org/ovf/envelope/1', 'http://schemas.dmtf.org/ovf/envelope/2')
+OVF_FABRICANTES = {
+    'http://www.virtualbox.org/ovf/machine': 'VirtualBox',
+    'http://www.vmware.com/schema/ovf': 'VMware',
+}
+# Elementos con los recursos de hardware de una máquina (OVF 1.x usa Item para todos)
+OVF_ITEMS = ('Item', 'StorageItem', 'EthernetPortItem')
+# Elementos que se procesan al cerrarse
+OVF_ELEMENTOS = frozenset(OVF_ITEMS + ('OperatingSystemSection', 'System', 'VirtualSystem', 'Disk', 'Network'))
+
+def nombre_local(tag):
+    """Nombre de un elemento sin su namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+def atributo_ovf(elem, nombre):
+    """Atributo ovf:nombre de un elemento, sea cual sea la versión del namespace"""
+    for ns in OVF_NAMESPACES:
+        valor = elem.get(f'{{{ns}}}{nombre}')
+        if valor is not None:
+            return valor
+    return elem.get(nombre)
+
+def bytes_ovf(cantidad, unidades):
+    """Convierte una cantidad OVF con sus unidades ('byte * 2^20', 'MegaBytes'...) a bytes"""
+    cantidad = int(cantidad)
+    unidades = (unidades or 'byte').strip()
+    potencia = re.fullmatch(r'byte\s*\*\s*2\s*\^\s*(\d+)', unidades)
+    if potencia:
+        return cantidad * 2 ** int(potencia.group(1))
+    multiplicadores = {'kilobytes': 2 ** 10, 'kb': 2 ** 10, 'megabytes': 2 ** 20, 'mb': 2 ** 20,
+                       'gigabytes': 2 ** 30, 'gb': 2 ** 30, 'terabytes': 2 ** 40, 'tb': 2 ** 40}
+    return cantidad * multiplicadores.get(unidades.lower(), 1)
+
+def extraer_ovf(origen):
+    """Extrae de un descriptor OVF (archivo binario) nombre, SO, CPUs, memoria, discos y redes
+    
+    Una sola pasada con iterparse: cada sección se procesa al cerrarse y se libera, así
+    que la memoria no crece con el tamaño del descriptor. Si hay varias máquinas (una
+    VirtualSystemCollection) la primera se usa para los campos principales y todas
+    se devuelven en 'virtual_machines'.
+    """
+    metadata = {}
+    maquinas = []
+    maquina = {}  # Datos de la máquina cuyo VirtualSystem aún no se ha cerrado
+    capacidades = []
+    redes = 0
+    locales = {}  # Caché de tag con namespace -> nombre local (None si no interesa)
+    propiedades = {}  # Igual para las propiedades de los Item
+    
+    try:
+        for evento, dato in ET.iterparse(origen, events=('end', 'start-ns')):
+            if evento == 'start-ns':
+                fabricante = OVF_FABRICANTES.get(dato[1])
+                if fabricante:
+                    metadata['created_with'] = fabricante
+                continue
+            
+            local = locales.get(dato.tag, '')
+            if local == '':
+                local = nombre_local(dato.tag)
+                local = locales[dato.tag] = local if local in OVF_ELEMENTOS else None
+            if local is None:
+                # La mayoría de elementos solo se leen al cerrarse su sección
+                continue
+            
+            if local in OVF_ITEMS:
+                # Propiedades rasd/sasd/epasd de un recurso de hardware
+                item = {}
+                for hijo in dato:
+                    propiedad = propiedades.get(hijo.tag)
+                    if propiedad is None:
+                        propiedad = propiedades[hijo.tag] = nombre_local(hijo.tag)
+                    item[propiedad] = hijo.text
+                tipo = (item.get('ResourceType') or '').strip()
+                try:
+                    if tipo == '3' and item.get('VirtualQuantity'):
+                        maquina['cpus'] = int(item['VirtualQuantity'])
+                    elif tipo == '4' and item.get('VirtualQuantity'):
+                        # Sin AllocationUnits se asume MB, lo habitual en OVF 1.x
+                        memoria = bytes_ovf(item['VirtualQuantity'], item.get('AllocationUnits') or 'byte * 2^20')
+                        maquina['memory_mb'] = memoria // 2 ** 20
+                    elif tipo == '17' or '/disk/' in (item.get('HostResource') or ''):
+                        maquina['disks'] = maquina.get('disks', 0) + 1
+                    elif tipo == '10':
+                        maquina['network_adapters'] = maquina.get('network_adapters', 0) + 1
+                except ValueError:
+                    pass
+                dato.clear()
+            elif local == 'OperatingSystemSection':
+                if atributo_ovf(dato, 'id'):
+                    maquina['os_type'] = atributo_ovf(dato, 'id')
+                for hijo in dato:
+                    if nombre_local(hijo.tag) in ('Description', 'OSType') and hijo.text and hijo.text.strip():
+                        maquina.setdefault('os_description', hijo.text.strip())
+                dato.clear()
+            elif local == 'System':
+                # VirtualBox no incluye <Name>: el nombre va en la sección System
+                for hijo in dato:
+                    if nombre_local(hijo.tag) == 'VirtualSystemIdentifier' and hijo.text and hijo.text.strip():
+                        maquina['system_identifier'] = hijo.text.strip()
+                dato.clear()
+            elif local == 'VirtualSystem':
+                if atributo_ovf(dato, 'id'):
+                    maquina['system_type'] = atributo_ovf(dato, 'id')
+                for hijo in dato:
+                    if nombre_local(hijo.tag) == 'Name' and hijo.text and hijo.text.strip():
+                        maquina['vm_name'] = hijo.text.strip()
+                identificador = maquina.pop('system_identifier', None)
+                if identificador:
+                    maquina.setdefault('vm_name', identificador)
+                maquinas.append(maquina)
+                maquina = {}
+                dato.clear()
+            elif local == 'Disk':
+                capacidad = atributo_ovf(dato, 'capacity')
+                if capacidad and capacidad.isdigit():
+                    capacidades.append(bytes_ovf(capacidad, atributo_ovf(dato, 'capacityAllocationUnits')))
+                dato.clear()
+            elif local == 'Network':
+                redes += 1
+                dato.clear()
+    except ET.ParseError as e:
+        # Conservar lo leído hasta el error
+        metadata['ovf_error'] = f'Descriptor OVF mal formado: {e}'
+        maquina.pop('system_identifier', None)
+        if maquina:
+            maquinas.append(maquina)
+    
+    if maquinas:
+        metadata.update(maquinas[0])
+    if len(maquinas) > 1:
+        metadata['virtual_machines'] = maquinas
+    if capacidades:
+        metadata['disks'] = len(capacidades)
+        metadata['disk_capacity'] = sum(capacidades)
+    if redes:
+        metadata['networks'] = redes
+    return metadata
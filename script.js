@@ -222,97 +222,293 @@ async function initializeExampleContent() {
     } catch (error) {
         console.log('Servidor no disponible, mostrando contenido de ejemplo');
         mostrarContenidoEjemplo();
+        return;
     }
+    
+    // Mantener la lista al día con los cambios que publique el servidor
+    seguirCambios();
+    configurarBuscador();
+    configurarCargarMas();
+}
+
+// Elementos pedidos al servidor por página
+const ARCHIVOS_POR_PAGINA = 500;
+
+// Catálogo mostrado (nombre -> archivo) y versión del servidor a la que corresponde
+const catalogo = new Map();
+const estadoCatalogo = { arranque: null, version: null };
+let feedActivo = false;
+// Texto buscado ahora mismo (vacío: se muestra el catálogo entero)
+let busquedaActual = '';
+// Cursor de la siguiente página (null: ya está todo cargado) y último nombre recibido
+const paginacion = { cursor: null, ultimo: null, cargando: false };
+
+// Versión actual del catálogo en el servidor (null si no tiene feed de cambios)
+async function consultarVersion() {
+    try {
+        const response = await fetch('/cambios');
+        if (!response.ok) return null;
+        return await response.json();
+    } catch (error) {
+        return null;
+    }
+}
+
+// Pide una página del listado ordenado por nombre
+async function pedirPagina(cursor) {
+    const params = new URLSearchParams({ limit: ARCHIVOS_POR_PAGINA, orden: 'nombre' });
+    if (cursor) params.set('cursor', cursor);
+    
+    const response = await fetch(`/files?${params}`);
+    const pagina = await response.json();
+    if (!response.ok) {
+        throw new Error(pagina.error || 'Error al cargar archivos');
+    }
+    return pagina;
+}
+
+// Guarda en el catálogo una página recién llegada y el cursor de la siguiente
+function registrarPagina(pagina) {
+    pagina.archivos.forEach(archivo => catalogo.set(archivo.nombre, archivo));
+    if (pagina.archivos.length > 0) {
+        paginacion.ultimo = pagina.archivos[pagina.archivos.length - 1].nombre.toLowerCase();
+    }
+    paginacion.cursor = pagina.siguiente;
+    actualizarBotonMas();
 }
 
-// Función para cargar archivos del servidor
+// Función para cargar archivos del servidor (solo la primera página; el resto, a demanda)
 async function cargarArchivos() {
     try {
-        const response = await fetch('/files');
-        const archivos = await response.json();
-        mostrarArchivos(archivos);
-        return archivos;
+        // La versión se toma antes del listado: los cambios que se crucen llegarán
+        // también por el feed y aplicarlos dos veces no cambia nada
+        const estado = await consultarVersion();
+        const pagina = await pedirPagina(null);
+        
+        catalogo.clear();
+        paginacion.ultimo = null;
+        registrarPagina(pagina);
+        if (!busquedaActual) mostrarArchivos(pagina.archivos);
+        if (estado) {
+            estadoCatalogo.arranque = estado.arranque;
+            estadoCatalogo.version = estado.version;
+        }
+        return pagina.archivos;
     } catch (error) {
         console.error('Error al cargar archivos:', error);
         throw error;
     }
 }
 
-// Mostrar archivos en la nube
-function mostrarArchivos(archivos) {
-    const cloudContainer = document.querySelector('.cloud-container');
-    if (!cloudContainer) return;
+// Trae la siguiente página y añade solo sus elementos a la lista
+async function cargarMas() {
+    if (!paginacion.cursor || paginacion.cargando || busquedaActual) return;
+    paginacion.cargando = true;
+    try {
+        const pagina = await pedirPagina(paginacion.cursor);
+        registrarPagina(pagina);
+        agregarArchivos(pagina.archivos);
+    } catch (error) {
+        console.error('Error al cargar más archivos:', error);
+    } finally {
+        paginacion.cargando = false;
+    }
+}
+
+// El botón de "cargar más" solo se ve si quedan páginas y no hay búsqueda activa
+function actualizarBotonMas() {
+    const boton = document.getElementById('btnCargarMas');
+    if (boton) boton.hidden = !paginacion.cursor || Boolean(busquedaActual);
+}
+
+// Carga la siguiente página al pulsar el botón o al llegar a él con el scroll
+function configurarCargarMas() {
+    const boton = document.getElementById('btnCargarMas');
+    if (!boton) return;
+    boton.addEventListener('click', cargarMas);
     
-    // Agrupar por tipo de archivo
-    const agrupados = {};
+    if ('IntersectionObserver' in window) {
+        const observador = new IntersectionObserver(entradas => {
+            if (entradas.some(entrada => entrada.isIntersecting)) cargarMas();
+        }, { root: document.getElementById('lista'), rootMargin: '200px' });
+        observador.observe(boton);
+    }
+}
+
+const esperar = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+// Pide al servidor los cambios del catálogo (long-poll) y los aplica a la lista
+async function seguirCambios() {
+    if (feedActivo || estadoCatalogo.version === null) return;
+    feedActivo = true;
     
-    archivos.forEach(archivo => {
-        const tipo = archivo.tipo || obtenerTipoArchivo(archivo.extension || archivo.nombre.split('.').pop().toLowerCase());
-        if (!agrupados[tipo]) {
-            agrupados[tipo] = [];
+    while (true) {
+        try {
+            const params = new URLSearchParams({
+                desde: estadoCatalogo.version,
+                arranque: estadoCatalogo.arranque
+            });
+            const response = await fetch(`/cambios?${params}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const datos = await response.json();
+            
+            if (datos.reiniciar) {
+                await cargarArchivos();
+                continue;
+            }
+            if (datos.cambios.length > 0) {
+                aplicarCambios(datos.cambios);
+            }
+            estadoCatalogo.version = datos.version;
+            if (datos.reintentar) {
+                await esperar(datos.reintentar * 1000);
+            }
+        } catch (error) {
+            console.error('Error siguiendo los cambios del catálogo:', error);
+            await esperar(5000);
+        }
+    }
+}
+
+// Aplica altas, cambios y bajas a la lista sin volver a pedirla entera
+function aplicarCambios(cambios) {
+    cambios.forEach(cambio => {
+        if (cambio.tipo === 'eliminado') {
+            catalogo.delete(cambio.nombre);
+        } else if (!paginacion.cursor || cambio.nombre.toLowerCase() <= paginacion.ultimo) {
+            // Lo que cae más allá de las páginas ya cargadas llegará con ellas
+            catalogo.set(cambio.nombre, cambio.archivo);
         }
-        agrupados[tipo].push(archivo);
     });
     
-    let html = '';
-    
-    // Mostrar primero los tipos especiales, luego los normales
-    const tiposEspeciales = ['imagen_disco', 'maquina_virtual'];
-    const otrosTipos = Object.keys(agrupados).filter(tipo => !tiposEspeciales.includes(tipo));
+    // Mientras se muestran resultados de búsqueda la lista no se repinta
+    if (!busquedaActual) mostrarCatalogo();
+}
+
+// Muestra la parte ya cargada del catálogo, ordenada por nombre
+function mostrarCatalogo() {
+    const archivos = Array.from(catalogo.values());
+    archivos.sort((a, b) => {
+        const nombreA = a.nombre.toLowerCase();
+        const nombreB = b.nombre.toLowerCase();
+        return nombreA < nombreB ? -1 : nombreA > nombreB ? 1 : 0;
+    });
+    mostrarArchivos(archivos);
+}
+
+function configurarBuscador() {
+    const buscador = document.getElementById('buscador');
+    if (!buscador) return;
+    buscador.addEventListener('input', debounce(() => buscarArchivos(buscador.value.trim()), 250));
+}
+
+// Busca en el servidor (nombre, metadatos y contenido) y muestra los resultados por relevancia
+async function buscarArchivos(texto) {
+    busquedaActual = texto;
+    actualizarBotonMas();
+    if (!texto) {
+        mostrarCatalogo();
+        return;
+    }
     
-    // Mostrar tipos especiales primero
-    tiposEspeciales.forEach(tipo => {
-        if (agrupados[tipo] && agrupados[tipo].length > 0) {
-            const nombreCategoria = tipo === 'imagen_disco' ? '💿 Imágenes de Disco' : '🖥️ Máquinas Virtuales';
-            html += `<div class="categoria">${nombreCategoria}</div>`;
-            
-            agrupados[tipo].forEach(archivo => {
-                html += createCloudItem(archivo);
-            });
+    try {
+        const params = new URLSearchParams({ q: texto, limit: 100 });
+        const response = await fetch(`/search?${params}`);
+        const datos = await response.json();
+        if (!response.ok) {
+            throw new Error(datos.error || 'Error al buscar');
         }
-    });
+        // Una respuesta que llega tarde no pisa la de una búsqueda más reciente
+        if (texto !== busquedaActual) return;
+        mostrarArchivos(datos.resultados.map(resultado => resultado.archivo));
+    } catch (error) {
+        console.error('Error al buscar:', error);
+    }
+}
+
+// Nombres de las categorías de la lista
+const TIPOS_ESPECIALES = ['imagen_disco', 'maquina_virtual'];
+const NOMBRES_TIPO = {
+    'imagen_disco': '💿 Imágenes de Disco',
+    'maquina_virtual': '🖥️ Máquinas Virtuales',
+    'documento': '📝 Documentos',
+    'imagen': '🖼️ Imágenes',
+    'comprimido': '📦 Archivos Comprimidos',
+    'hoja_calculo': '📊 Hojas de Cálculo',
+    'presentacion': '📽️ Presentaciones'
+};
+
+// Último elemento de cada categoría en la lista (tipo -> elemento), para añadir detrás
+const finCategoria = new Map();
+
+// Mostrar archivos en la nube (sustituye lo que hubiera)
+function mostrarArchivos(archivos) {
+    const cloudContainer = document.querySelector('.cloud-container');
+    if (!cloudContainer) return;
     
-    // Mostrar otros tipos
-    otrosTipos.forEach(tipo => {
-        const nombresTipo = {
-            'documento': '📝 Documentos',
-            'imagen': '🖼️ Imágenes',
-            'comprimido': '📦 Archivos Comprimidos',
-            'hoja_calculo': '📊 Hojas de Cálculo',
-            'presentacion': '📽️ Presentaciones'
-        };
-        
-        html += `<div class="categoria">${nombresTipo[tipo] || '📁 Archivos'}</div>`;
+    cloudContainer.innerHTML = '';
+    finCategoria.clear();
+    agregarArchivos(archivos);
+}
+
+// Añade archivos a la lista, cada uno al final de su categoría, sin repintar lo demás
+function agregarArchivos(archivos) {
+    const cloudContainer = document.querySelector('.cloud-container');
+    if (!cloudContainer) return;
+    
+    archivos.forEach(archivo => {
+        const tipo = archivo.tipo || obtenerTipoArchivo(archivo.extension || archivo.nombre.split('.').pop().toLowerCase());
+        const fin = finCategoria.get(tipo) || crearCategoria(cloudContainer, tipo);
         
-        agrupados[tipo].forEach(archivo => {
-            html += createCloudItem(archivo);
-        });
+        fin.insertAdjacentHTML('afterend', createCloudItem(archivo));
+        const item = fin.nextElementSibling;
+        prepararElemento(item);
+        finCategoria.set(tipo, item);
     });
+}
+
+// Crea la cabecera de una categoría: los tipos especiales van primero, los demás al final
+function crearCategoria(cloudContainer, tipo) {
+    const cabecera = document.createElement('div');
+    cabecera.className = 'categoria';
+    cabecera.textContent = NOMBRES_TIPO[tipo] || '📁 Archivos';
     
-    cloudContainer.innerHTML = html;
-    
-    // Añadir interactividad a los elementos de la nube
-    const cloudItems = document.querySelectorAll('.cloud-item');
-    cloudItems.forEach(item => {
-        item.addEventListener('click', function(e) {
-            if (!e.target.classList.contains('cloud-checkbox')) {
-                // Seleccionar/deseleccionar el checkbox
-                const checkbox = this.querySelector('.cloud-checkbox');
-                checkbox.checked = !checkbox.checked;
-                this.classList.toggle('selected', checkbox.checked);
-            }
-        });
-        
-        // Hacer clic en el icono para visualizar
-        const icon = item.querySelector('.pdf-icon');
-        if (icon) {
-            icon.addEventListener('click', function(e) {
-                e.stopPropagation();
-                const nombreArchivo = item.getAttribute('data-nombre');
-                visualizarArchivo(nombreArchivo);
-            });
+    const posicion = TIPOS_ESPECIALES.indexOf(tipo);
+    if (posicion === -1) {
+        cloudContainer.appendChild(cabecera);
+    } else {
+        // Detrás de la última categoría especial anterior que ya exista
+        const anterior = TIPOS_ESPECIALES.slice(0, posicion).reverse()
+            .map(especial => finCategoria.get(especial)).find(Boolean);
+        if (anterior) {
+            anterior.after(cabecera);
+        } else {
+            cloudContainer.prepend(cabecera);
+        }
+    }
+    return cabecera;
+}
+
+// Añadir interactividad a un elemento de la nube
+function prepararElemento(item) {
+    item.addEventListener('click', function(e) {
+        if (!e.target.classList.contains('cloud-checkbox')) {
+            // Seleccionar/deseleccionar el checkbox
+            const checkbox = this.querySelector('.cloud-checkbox');
+            checkbox.checked = !checkbox.checked;
+            this.classList.toggle('selected', checkbox.checked);
         }
     });
+    
+    // Hacer clic en el icono para visualizar
+    const icon = item.querySelector('.pdf-icon');
+    if (icon) {
+        icon.addEventListener('click', function(e) {
+            e.stopPropagation();
+            const nombreArchivo = item.getAttribute('data-nombre');
+            visualizarArchivo(nombreArchivo);
+        });
+    }
 }
 
 
@@ -457,13 +653,231 @@ if (downloadButton) {
     });
 }
 
+// Subida por trozos (reanudable) para archivos grandes
+const TAMAÑO_SUBIDA_POR_TROZOS = 100 * 1024 * 1024;
+const SUBIDAS_PARALELAS = 3;
+const REINTENTOS_TROZO = 5;
+
+async function subirTrozo(sesion, archivo, indice) {
+    const inicio = indice * sesion.chunk_size;
+    const trozo = archivo.slice(inicio, inicio + sesion.chunk_size);
+    
+    for (let intento = 1; ; intento++) {
+        try {
+            const response = await fetch(`/upload/sesion/${sesion.id}/${indice}`, {
+                method: 'PUT',
+                body: trozo
+            });
+            if (response.ok) return;
+            if (response.status < 500) {
+                const error = await response.json();
+                throw new Error(error.error || 'Error al subir trozo');
+            }
+        } catch (error) {
+            if (intento >= REINTENTOS_TROZO) throw error;
+        }
+        // Esperar un poco más en cada reintento
+        await new Promise(resolve => setTimeout(resolve, 1000 * intento));
+    }
+}
+
+async function subirPorTrozos(archivo) {
+    const response = await fetch('/upload/sesion', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nombre: archivo.name, tamaño: archivo.size })
+    });
+    const sesion = await response.json();
+    if (!response.ok) {
+        throw new Error(sesion.error || 'Error al iniciar la subida');
+    }
+    
+    // Varios trozos en paralelo, cada trabajador toma el siguiente pendiente
+    const pendientes = [...sesion.faltan];
+    const trabajador = async () => {
+        while (pendientes.length > 0) {
+            await subirTrozo(sesion, archivo, pendientes.shift());
+        }
+    };
+    await Promise.all(Array.from({ length: SUBIDAS_PARALELAS }, trabajador));
+    
+    const final = await fetch(`/upload/sesion/${sesion.id}/finalizar`, { method: 'POST' });
+    const data = await final.json();
+    if (!final.ok) {
+        throw new Error(data.error || 'Error al finalizar la subida');
+    }
+    return data;
+}
+
+// SHA-256 incremental (crypto.subtle no permite calcularlo por partes)
+const SHA256_K = new Int32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+class Sha256 {
+    constructor() {
+        this.h = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.w = new Int32Array(64);
+        this.bloque = new Uint8Array(64);
+        this.pendientes = 0;
+        this.longitud = 0;
+    }
+    
+    procesar(datos, inicio) {
+        const w = this.w, h = this.h;
+        for (let i = 0; i < 16; i++) {
+            const j = inicio + i * 4;
+            w[i] = (datos[j] << 24) | (datos[j + 1] << 16) | (datos[j + 2] << 8) | datos[j + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const a = w[i - 15], b = w[i - 2];
+            const s0 = ((a >>> 7) | (a << 25)) ^ ((a >>> 18) | (a << 14)) ^ (a >>> 3);
+            const s1 = ((b >>> 17) | (b << 15)) ^ ((b >>> 19) | (b << 13)) ^ (b >>> 10);
+            w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+        }
+        let a = h[0], b = h[1], c = h[2], d = h[3], e = h[4], f = h[5], g = h[6], k = h[7];
+        for (let i = 0; i < 64; i++) {
+            const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const t1 = (k + S1 + ((e & f) ^ (~e & g)) + SHA256_K[i] + w[i]) | 0;
+            const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const t2 = (S0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+            k = g; g = f; f = e; e = (d + t1) | 0;
+            d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        h[0] += a; h[1] += b; h[2] += c; h[3] += d;
+        h[4] += e; h[5] += f; h[6] += g; h[7] += k;
+    }
+    
+    actualizar(datos) {
+        let i = 0;
+        this.longitud += datos.length;
+        // Completar el bloque que quedó a medias
+        if (this.pendientes > 0) {
+            const n = Math.min(64 - this.pendientes, datos.length);
+            this.bloque.set(datos.subarray(0, n), this.pendientes);
+            this.pendientes += n;
+            i = n;
+            if (this.pendientes < 64) return;
+            this.procesar(this.bloque, 0);
+            this.pendientes = 0;
+        }
+        for (; i + 64 <= datos.length; i += 64) {
+            this.procesar(datos, i);
+        }
+        this.bloque.set(datos.subarray(i), 0);
+        this.pendientes = datos.length - i;
+    }
+    
+    hex() {
+        const bits = this.longitud * 8;
+        const relleno = new Uint8Array((this.pendientes < 56 ? 56 : 120) - this.pendientes + 8);
+        relleno[0] = 0x80;
+        const vista = new DataView(relleno.buffer);
+        vista.setUint32(relleno.length - 8, Math.floor(bits / 0x100000000));
+        vista.setUint32(relleno.length - 4, bits >>> 0);
+        this.actualizar(relleno);
+        return Array.from(this.h, x => x.toString(16).padStart(8, '0')).join('');
+    }
+}
+
+const BLOQUE_HASH = 4 * 1024 * 1024;
+
+async function calcularSha256(archivo) {
+    const sha = new Sha256();
+    for (let inicio = 0; inicio < archivo.size; inicio += BLOQUE_HASH) {
+        const datos = await archivo.slice(inicio, inicio + BLOQUE_HASH).arrayBuffer();
+        sha.actualizar(new Uint8Array(datos));
+    }
+    return sha.hex();
+}
+
+// Pregunta al servidor qué archivos ya tiene (por hash y tamaño)
+async function comprobarHashes(archivos, hashes) {
+    try {
+        const response = await fetch('/upload/comprobar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                archivos: archivos.map((archivo, i) => ({ hash_sha256: hashes[i], tamaño: archivo.size }))
+            })
+        });
+        if (!response.ok) return archivos.map(() => false);
+        const data = await response.json();
+        return data.resultados.map(resultado => resultado.existe);
+    } catch (error) {
+        // Si la consulta falla, se suben normalmente
+        return archivos.map(() => false);
+    }
+}
+
+// Crea la entrada con el contenido que ya está en el servidor; false si ya no está
+async function crearDesdeHash(archivo, hash) {
+    const response = await fetch('/upload/referencia', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nombre: archivo.name, hash_sha256: hash, tamaño: archivo.size })
+    });
+    if (response.status === 404) return false;
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Error al crear el archivo');
+    }
+    return true;
+}
+
+// Subida en lote: los archivos pequeños se agrupan y se envían varios por petición
+const ARCHIVOS_POR_LOTE = 50;
+const TAMAÑO_MAXIMO_LOTE = 50 * 1024 * 1024;
+
+function agruparEnLotes(archivos) {
+    const lotes = [];
+    let lote = [];
+    let tamaño = 0;
+    for (const archivo of archivos) {
+        if (lote.length > 0 && (lote.length >= ARCHIVOS_POR_LOTE || tamaño + archivo.size > TAMAÑO_MAXIMO_LOTE)) {
+            lotes.push(lote);
+            lote = [];
+            tamaño = 0;
+        }
+        lote.push(archivo);
+        tamaño += archivo.size;
+    }
+    if (lote.length > 0) lotes.push(lote);
+    return lotes;
+}
+
+async function subirLote(archivos) {
+    const formData = new FormData();
+    for (const archivo of archivos) {
+        formData.append('file', archivo);
+    }
+    
+    const response = await fetch('/upload/lote', {
+        method: 'POST',
+        body: formData
+    });
+    const data = await response.json();
+    if (!response.ok && !data.errores) {
+        throw new Error(data.error || 'Error al subir archivos');
+    }
+    return data;
+}
+
 // Manejo de subida de archivos
 if (fileInput) {
     fileInput.addEventListener('change', async function(e) {
         if (!this.files || this.files.length === 0) return;
         
-        const archivo = this.files[0];
-        const extension = archivo.name.split('.').pop().toLowerCase();
+        const archivos = Array.from(this.files);
         
         // Extensiones permitidas (AÑADIDO .iso, .ova, .ovf)
         const extensionesPermitidas = [
@@ -476,48 +890,74 @@ if (fileInput) {
             'json', 'xml', 'html', 'htm', 'js', 'css', 'py', 'java', 'c', 'cpp'
         ];
         
-        if (!extensionesPermitidas.includes(extension)) {
-            alert(`Tipo de archivo no permitido: .${extension}\n\nSolo se permiten: ${extensionesPermitidas.join(', ')}`);
+        const noPermitidos = archivos.filter(archivo =>
+            !extensionesPermitidas.includes(archivo.name.split('.').pop().toLowerCase()));
+        if (noPermitidos.length > 0) {
+            alert(`Tipo de archivo no permitido: ${noPermitidos.map(a => a.name).join(', ')}\n\nSolo se permiten: ${extensionesPermitidas.join(', ')}`);
             this.value = '';
             return;
         }
         
         // Verificar tamaño para archivos grandes
-        if (archivo.size > 100 * 1024 * 1024) { // Más de 100MB
-            const tamañoMB = Math.round(archivo.size / (1024 * 1024));
-            const confirmar = confirm(`Archivo grande detectado:\n\n${archivo.name}\n${tamañoMB} MB\n\n¿Continuar con la subida?`);
+        const grandes = archivos.filter(archivo => archivo.size > 100 * 1024 * 1024); // Más de 100MB
+        if (grandes.length > 0) {
+            const lista = grandes.map(a => `${a.name} (${Math.round(a.size / (1024 * 1024))} MB)`).join('\n');
+            const confirmar = confirm(`Archivo grande detectado:\n\n${lista}\n\n¿Continuar con la subida?`);
             if (!confirmar) {
                 this.value = '';
                 return;
             }
         }
         
-        // Subir archivo
-        const formData = new FormData();
-        formData.append('file', archivo);
-        
         try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
+            const errores = [];
+            let subidos = 0;
             
-            if (!response.ok) {
-                const error = await response.json();
-                throw new Error(error.error || 'Error al subir archivo');
+            // Los archivos grandes se suben por trozos para poder reintentar sin empezar de cero,
+            // salvo si el servidor ya tiene su contenido: entonces basta con crear la entrada
+            const grandesASubir = archivos.filter(a => a.size > TAMAÑO_SUBIDA_POR_TROZOS);
+            const hashes = [];
+            for (const archivo of grandesASubir) {
+                hashes.push(await calcularSha256(archivo));
+            }
+            const existentes = grandesASubir.length > 0 ? await comprobarHashes(grandesASubir, hashes) : [];
+            for (let i = 0; i < grandesASubir.length; i++) {
+                if (!existentes[i] || !await crearDesdeHash(grandesASubir[i], hashes[i])) {
+                    await subirPorTrozos(grandesASubir[i]);
+                }
+                subidos++;
             }
             
-            const data = await response.json();
-            alert(`Archivo "${archivo.name}" subido correctamente`);
+            // El resto va en lotes, varios a la vez
+            const lotes = agruparEnLotes(archivos.filter(a => a.size <= TAMAÑO_SUBIDA_POR_TROZOS));
+            const trabajador = async () => {
+                while (lotes.length > 0) {
+                    const data = await subirLote(lotes.shift());
+                    subidos += data.subidos ? data.subidos.length : 0;
+                    for (const error of data.errores || []) {
+                        errores.push(`${error.nombre}: ${error.error}`);
+                    }
+                }
+            };
+            await Promise.all(Array.from({ length: SUBIDAS_PARALELAS }, trabajador));
+            
+            if (errores.length > 0) {
+                alert(`${subidos} archivos subidos. No se pudieron subir:\n\n${errores.join('\n')}`);
+            } else if (archivos.length === 1) {
+                alert(`Archivo "${archivos[0].name}" subido correctamente`);
+            } else {
+                alert(`${subidos} archivos subidos correctamente`);
+            }
             this.value = '';
             
-            // Recargar lista de archivos
-            await cargarArchivos();
+            // Con el feed de cambios la lista ya se actualiza sola
+            if (!feedActivo) await cargarArchivos();
             
         } catch (error) {
             console.error('Error al subir archivo:', error);
             alert(`Error al subir archivo: ${error.message}`);
             this.value = '';
+            if (!feedActivo) await cargarArchivos();
         }
     });
 }
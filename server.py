@@ -1,20 +1,58 @@
 import http.server
-import socketserver
+import socket
 import os
 import json
 import sys
-from urllib.parse import unquote
+import signal
+from urllib.parse import quote, unquote, urlsplit, parse_qs
 import mimetypes
-import subprocess
-import shutil
 import tarfile
-import xml.etree.ElementTree as ET
-from datetime import datetime
+import zipfile
+import gzip
+import zlib
+import tempfile
+import re
+import hashlib
+import threading
+import uuid
+import time
+import sqlite3
+import base64
+import bisect
+import stat
+import struct
+import ctypes
+import ctypes.util
+from collections import namedtuple, deque
+from itertools import islice
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+from ovf import extraer_ovf
+
+try:
+    import xxhash  # Opcional: digests xxh64/xxh3_64 muy rápidos
+except ImportError:
+    xxhash = None
+
+try:
+    import zstandard  # Opcional: compresión zstd además de gzip
+except ImportError:
+    zstandard = None
 
 PORT = 8000
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 BIBLIOTECA_JSON = os.path.join(BASE_DIR, "biblioteca.json")
+BIBLIOTECA_DB = os.path.join(BASE_DIR, "biblioteca.sqlite3")
+ANALISIS_DB = os.path.join(BASE_DIR, "analisis.sqlite3")
+BUSQUEDA_DB = os.path.join(BASE_DIR, "busqueda.sqlite3")
+
+# Almacenamiento del catálogo: 'json' (biblioteca.json completo en cada guardado)
+# o 'sqlite' (solo se escriben las entradas cambiadas; migra biblioteca.json la primera vez)
+ALMACEN_CATALOGO = 'json'
 
 # Tipos de archivos permitidos 
 ALLOWED_EXTENSIONS = {
@@ -95,8 +133,120 @@ MAX_FILE_SIZES = {
     '.vhdx': 20 * 1024 * 1024 * 1024,  # 20 GB para VHDX
 }
 
+# Tamaño máximo general de una petición de subida
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024 * 1024  # 20GB máximo general
+
+# Tamaño de los bloques leídos del socket al recibir subidas
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Digests calculados mientras se recibe cada subida (sha256 siempre se calcula)
+# Otros valores posibles: 'blake2b', 'sha1', 'md5', 'xxh64', 'xxh3_64' (requieren xxhash)
+UPLOAD_DIGESTS = ['sha256']
+
+# Archivos que se aceptan como máximo en una misma subida en lote (/upload/lote)
+LOTE_MAX_ARCHIVOS = 1000
+
+# Tamaño del buffer de descarga cuando no se puede usar sendfile
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+# Subidas por trozos (reanudables): sesiones guardadas dentro de UPLOAD_DIR
+SESIONES_DIR = os.path.join(UPLOAD_DIR, '.sesiones')
+SESION_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB por defecto
+SESION_CHUNK_MIN = 1024 * 1024  # 1 MB
+SESION_CHUNK_MAX = 64 * 1024 * 1024  # 64 MB
+SESION_EXPIRACION = 24 * 60 * 60  # Sesiones sin actividad durante 24h se eliminan
+
+# Almacén por contenido: cada contenido distinto se guarda una vez en OBJETOS_DIR con su
+# SHA256 como nombre, y los archivos de UPLOAD_DIR son enlaces duros a él
+ALMACEN_POR_CONTENIDO = True
+OBJETOS_DIR = os.path.join(UPLOAD_DIR, '.objetos')
+# Hashes que se aceptan como máximo en una consulta a /upload/comprobar
+COMPROBAR_MAX_HASHES = 1000
+
+# Rangos máximos atendidos en una misma petición Range (si hay más se envía el archivo entero)
+MAX_RANGOS = 16
+
+# Compresión según Accept-Encoding (gzip, y zstd si está instalado zstandard)
+COMPRESION_MIN_BYTES = 1024  # Las respuestas más pequeñas se envían tal cual
+COMPRESION_NIVEL = 6  # Respuestas generadas en cada petición (JSON)
+COMPRESION_NIVEL_VARIANTES = 9  # Variantes guardadas de estáticos y subidas, se comprimen una vez
+# Subidas de texto que se descargan comprimidas; la variante se guarda junto a su objeto
+EXTENSIONES_COMPRIMIBLES = ('.txt', '.csv', '.rtf', '.svg', '.json', '.xml', '.html', '.htm',
+                            '.js', '.css', '.py', '.java', '.c', '.cpp', '.ovf')
+VARIANTES_MAX_BYTES = 512 * 1024 * 1024
+# Hilos que crean en segundo plano las variantes comprimidas de las subidas
+VARIANTES_WORKERS = 1
+
+# Archivos estáticos del frontend guardados en memoria (los mayores se leen en cada petición)
+ESTATICOS_MAX_BYTES = 4 * 1024 * 1024
+
+# Listado paginado de /files
+FILES_LIMITE = 100  # Elementos por página por defecto
+FILES_LIMITE_MAX = 1000
+
+# Sin inotify, cada cuántos segundos se revisa UPLOAD_DIR para refrescar la caché de atributos
+CACHE_STAT_INTERVALO = 5
+
+# Resultados de /file-info guardados (hash y análisis); al superar el máximo se
+# descartan los menos consultados recientemente
+CACHE_ANALISIS_MAX = 5000
+# Subir al cambiar lo que devuelve el análisis, para descartar los resultados guardados
+VERSION_ANALISIS = 7
+
+# Archivos cuyo contenido se puede explorar y descargar miembro a miembro (/contenido)
+EXTENSIONES_NAVEGABLES = ('.zip', '.tar', '.gz', '.ova', '.iso')
+# Miembros anotados como máximo por archivo y devueltos por página al listarlos
+CONTENIDO_MAX_MIEMBROS = 100000
+CONTENIDO_LIMITE = 200
+CONTENIDO_LIMITE_MAX = 1000
+
+# Hilos que analizan en segundo plano los archivos recién subidos
+ANALISIS_WORKERS = 2
+# Trabajos terminados que se recuerdan para consultar su estado
+ANALISIS_TRABAJOS_MAX = 1000
+
+# Escritura diferida del catálogo: se guarda tras GUARDADO_RETARDO segundos sin
+# cambios, y como mucho GUARDADO_MAXIMO segundos después del primer cambio
+GUARDADO_RETARDO = 1.0
+GUARDADO_MAXIMO = 5.0
+
+# Feed de cambios del catálogo (/cambios): cambios recordados para los clientes que se
+# ponen al día, segundos que espera una consulta sin novedades y consultas esperando a
+# la vez (cada una ocupa un hilo; las que sobran responden al momento)
+CAMBIOS_MAX = 10000
+CAMBIOS_ESPERA = 25
+CAMBIOS_ESPERA_MAX = 60
+CAMBIOS_MAX_ESPERANDO = 16
+
+# Búsqueda de texto completo (/search) sobre el catálogo y el contenido de las subidas de texto
+# Subir al cambiar lo que se indexa, para reconstruir el índice
+VERSION_BUSQUEDA = 1
+# Campos de cada entrada que se indexan (además del nombre); incluye los del análisis
+CAMPOS_BUSQUEDA = ('categoria', 'tags', 'descripcion', 'tipo', 'vm_name', 'os_type', 'os_description',
+                   'system_type', 'created_with', 'networks', 'virtual_machines', 'volume_label',
+                   'publisher', 'application', 'system_id', 'file_system', 'architecture', 'format')
+# Subidas cuyo contenido se indexa, y bytes leídos como máximo de cada una
+EXTENSIONES_TEXTO = ('.txt', '.csv', '.xml', '.json', '.html', '.htm', '.js', '.css',
+                     '.py', '.java', '.c', '.cpp', '.ovf')
+BUSQUEDA_TEXTO_MAX = 1024 * 1024
+BUSQUEDA_LIMITE = 20
+BUSQUEDA_LIMITE_MAX = 100
+
+# Servidor concurrente: hilos que atienden conexiones a la vez
+MAX_WORKERS = 32
+# Segundos de inactividad de un cliente antes de cortar su conexión
+SOCKET_TIMEOUT = 120
+
+# Permisos de los archivos que se escriben vía temporal: mkstemp los crea en 0600 y
+# se dejan como los dejaría open(), según la umask del proceso (solo se puede leer cambiándola)
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+MODO_ARCHIVOS = 0o666 & ~UMASK
+
 # Crear estructura de carpetas
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(SESIONES_DIR, exist_ok=True)
+os.makedirs(OBJETOS_DIR, exist_ok=True)
 
 # ------------------ Funciones ------------------
 def cargar_metadata():
@@ -105,12 +255,33 @@ def cargar_metadata():
     try:
         with open(BIBLIOTECA_JSON, 'r', encoding='utf-8') as f:
             return json.load(f)
-    except:
+    except ValueError as e:
+        # No sobrescribir un catálogo dañado con uno vacío: se aparta para recuperarlo a mano
+        copia = f"{BIBLIOTECA_JSON}.corrupto-{int(time.time())}"
+        os.replace(BIBLIOTECA_JSON, copia)
+        print(f"⚠️  biblioteca.json no es JSON válido ({e}); guardado como {copia}", file=sys.stderr)
         return []
 
 def guardar_metadata(data):
-    with open(BIBLIOTECA_JSON, 'w', encoding='utf-8') as f:
+    # Escribir en un temporal y renombrar para que los lectores nunca vean un JSON a medias
+    tmp_path = BIBLIOTECA_JSON + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, BIBLIOTECA_JSON)
+
+def fecha_entrada(item):
+    """Fecha de subida de una entrada del catálogo como timestamp (0 si no se conoce)"""
+    if isinstance(item.get('fecha_timestamp'), (int, float)):
+        return float(item['fecha_timestamp'])
+    fecha = item.get('fecha')
+    if isinstance(fecha, (int, float)):
+        return float(fecha)
+    try:
+        return datetime.fromisoformat(fecha).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
 
 def es_extension_permitida(filename):
     """Verifica si la extensión del archivo está permitida"""
@@ -201,8 +372,333 @@ def obtener_metadata_archivo(filepath, filename, file_size):
     
     return metadata
 
+# ------------------ Cabeceras de imágenes y discos ------------------
+SECTOR_ISO = 2048
+
+def leer_en(f, offset, n):
+    """Lee n bytes desde offset (menos si el archivo se acaba antes)"""
+    f.seek(offset)
+    return f.read(n)
+
+def texto_iso(datos):
+    """Campo de texto de un descriptor ISO9660 (relleno con espacios)"""
+    return datos.decode('latin-1').strip(' \x00') or None
+
+def fecha_iso(datos):
+    """Fecha de un descriptor de volumen ISO9660 ('YYYYMMDDHHMMSScc' + zona) en ISO 8601"""
+    texto = datos[:14].decode('latin-1')
+    if not texto.isdigit() or texto == '0' * 14:
+        return None
+    try:
+        return datetime.strptime(texto, '%Y%m%d%H%M%S').isoformat()
+    except ValueError:
+        return None
+
+def dstring_udf(datos):
+    """Cadena 'dstring' de UDF: byte de compresión, caracteres y longitud en el último byte"""
+    longitud = datos[-1]
+    if not longitud or datos[0] not in (8, 16):
+        return None
+    contenido = datos[1:longitud]
+    texto = contenido.decode('latin-1') if datos[0] == 8 else contenido.decode('utf-16-be', errors='replace')
+    return texto.strip() or None
+
+# Plataformas de los catálogos de arranque El Torito
+PLATAFORMAS_EL_TORITO = {0x00: 'BIOS', 0x01: 'PowerPC', 0x02: 'Mac', 0xEF: 'UEFI'}
+
+def leer_catalogo_el_torito(f, sector):
+    """Entradas de arranque del catálogo El Torito: (plataformas, tipo de emulación)"""
+    catalogo = leer_en(f, sector * SECTOR_ISO, SECTOR_ISO)
+    # Entrada de validación: cabecera 0x01 y clave 55 AA
+    if len(catalogo) < 64 or catalogo[0] != 0x01 or catalogo[30:32] != b'\x55\xaa':
+        return [], None
+    
+    plataformas = []
+    emulacion = None
+    plataforma = catalogo[1]
+    for posicion in range(32, len(catalogo), 32):
+        entrada = catalogo[posicion:posicion + 32]
+        indicador = entrada[0]
+        if indicador in (0x90, 0x91):
+            # Cabecera de sección: las entradas siguientes son de otra plataforma
+            plataforma = entrada[1]
+        elif indicador == 0x88:
+            nombre = PLATAFORMAS_EL_TORITO.get(plataforma, f'0x{plataforma:02x}')
+            if nombre not in plataformas:
+                plataformas.append(nombre)
+            if emulacion is None:
+                emulacion = {0: 'no emulation', 1: 'floppy 1.2M', 2: 'floppy 1.44M',
+                             3: 'floppy 2.88M', 4: 'hard disk'}.get(entrada[1] & 0x0F)
+        elif not any(entrada):
+            break
+    return plataformas, emulacion
+
+def leer_cabecera_iso(f):
+    """Descriptores de volumen ISO9660 (PVD y El Torito) y reconocimiento UDF; None si no es ISO ni UDF"""
+    info = {}
+    udf = False
+    sector_udf_anchor = None
+    
+    for sector in range(16, 16 + 64):
+        descriptor = leer_en(f, sector * SECTOR_ISO, SECTOR_ISO)
+        if len(descriptor) < SECTOR_ISO:
+            break
+        identificador = descriptor[1:6]
+        
+        if identificador == b'CD001':
+            tipo = descriptor[0]
+            if tipo == 1 and 'volume_label' not in info:
+                info['file_system'] = 'ISO9660'
+                info['system_id'] = texto_iso(descriptor[8:40])
+                info['volume_label'] = texto_iso(descriptor[40:72])
+                tamaño_bloque = struct.unpack_from('<H', descriptor, 128)[0]
+                info['volume_size'] = struct.unpack_from('<I', descriptor, 80)[0] * tamaño_bloque
+                info['publisher'] = texto_iso(descriptor[318:446])
+                info['application'] = texto_iso(descriptor[574:702])
+                info['created'] = fecha_iso(descriptor[813:830])
+            elif tipo == 0 and descriptor[7:30] == b'EL TORITO SPECIFICATION':
+                sector_catalogo = struct.unpack_from('<I', descriptor, 71)[0]
+                plataformas, emulacion = leer_catalogo_el_torito(f, sector_catalogo)
+                info['el_torito'] = True
+                info['boot_platforms'] = plataformas
+                if emulacion:
+                    info['boot_emulation'] = emulacion
+            elif tipo == 2 and descriptor[88:91] in (b'%/@', b'%/C', b'%/E'):
+                info['joliet'] = True
+            elif tipo == 255:
+                continue
+        elif identificador in (b'NSR02', b'NSR03'):
+            udf = True
+            sector_udf_anchor = 256
+        elif identificador not in (b'BEA01', b'TEA01', b'BOOT2', b'CDW02'):
+            break
+    
+    if udf:
+        info['file_system'] = 'ISO9660/UDF' if info.get('file_system') else 'UDF'
+        etiqueta = leer_volumen_udf(f, sector_udf_anchor)
+        if etiqueta and not info.get('volume_label'):
+            info['volume_label'] = etiqueta
+    
+    if not info.get('file_system'):
+        return None
+    return {clave: valor for clave, valor in info.items() if valor is not None}
+
+def leer_volumen_udf(f, sector_anchor):
+    """Identificador de volumen del descriptor primario UDF, siguiendo el Anchor Volume Descriptor Pointer"""
+    anchor = leer_en(f, sector_anchor * SECTOR_ISO, 512)
+    if len(anchor) < 24 or struct.unpack_from('<H', anchor, 0)[0] != 2:
+        return None
+    longitud, ubicacion = struct.unpack_from('<II', anchor, 16)
+    for i in range(min(longitud // SECTOR_ISO, 32)):
+        descriptor = leer_en(f, (ubicacion + i) * SECTOR_ISO, 512)
+        if len(descriptor) < 56:
+            break
+        etiqueta = struct.unpack_from('<H', descriptor, 0)[0]
+        if etiqueta == 1:
+            # Primary Volume Descriptor: Volume Identifier (dstring de 32 bytes) en el byte 24
+            return dstring_udf(descriptor[24:56])
+        if etiqueta == 8:
+            # Terminating Descriptor
+            break
+    return None
+
+# Tipos de partición MBR más habituales
+TIPOS_PARTICION_MBR = {
+    0x01: 'FAT12', 0x04: 'FAT16', 0x06: 'FAT16', 0x07: 'NTFS/exFAT', 0x0B: 'FAT32', 0x0C: 'FAT32',
+    0x0E: 'FAT16', 0x82: 'Linux swap', 0x83: 'Linux', 0x8E: 'Linux LVM', 0xA5: 'FreeBSD',
+    0xAF: 'HFS+', 0xEE: 'GPT', 0xEF: 'EFI System',
+}
+
+def leer_cabecera_disco(f, file_size):
+    """Sistema de archivos o tabla de particiones de una imagen de disco en bruto (IMG/BIN)"""
+    info = {}
+    sector0 = leer_en(f, 0, 512)
+    if len(sector0) < 512:
+        return info
+    
+    # Sistemas de archivos directamente en la imagen (sin tabla de particiones)
+    if sector0[3:11] == b'NTFS    ':
+        info['file_system'] = 'NTFS'
+    elif sector0[82:87] == b'FAT32':
+        info['file_system'] = 'FAT32'
+        info['volume_label'] = texto_iso(sector0[71:82])
+    elif sector0[54:59] in (b'FAT12', b'FAT16'):
+        info['file_system'] = sector0[54:59].decode()
+        info['volume_label'] = texto_iso(sector0[43:54])
+    elif sector0[3:11] == b'EXFAT   ':
+        info['file_system'] = 'exFAT'
+    else:
+        superbloque = leer_en(f, 1024, 136)
+        if len(superbloque) >= 136 and superbloque[56:58] == b'\x53\xef':
+            info['file_system'] = 'ext'
+            info['volume_label'] = superbloque[120:136].split(b'\x00')[0].decode('utf-8', errors='replace') or None
+    
+    if 'file_system' not in info and sector0[510:512] == b'\x55\xaa':
+        particiones = []
+        activa = False
+        for i in range(4):
+            entrada = sector0[446 + i * 16:462 + i * 16]
+            tipo = entrada[4]
+            if tipo == 0:
+                continue
+            activa = activa or entrada[0] == 0x80
+            sectores = struct.unpack_from('<I', entrada, 12)[0]
+            particiones.append({
+                'type': TIPOS_PARTICION_MBR.get(tipo, f'0x{tipo:02x}'),
+                'size': sectores * 512,
+                'bootable': entrada[0] == 0x80
+            })
+        if particiones:
+            gpt = any(p['type'] == 'GPT' for p in particiones) and leer_en(f, 512, 8) == b'EFI PART'
+            info['partition_table'] = 'GPT' if gpt else 'MBR'
+            info['partitions'] = particiones
+            info['bootable'] = activa or gpt
+    
+    return {clave: valor for clave, valor in info.items() if valor is not None}
+
+def leer_cabecera_dmg(f, file_size):
+    """Trailer 'koly' de una imagen UDIF de macOS (DMG)"""
+    if file_size < 512:
+        return None
+    trailer = leer_en(f, file_size - 512, 512)
+    if trailer[:4] != b'koly':
+        return None
+    sectores = struct.unpack_from('>Q', trailer, 492)[0]
+    return {'file_system': 'UDIF', 'virtual_size': sectores * 512}
+
+def leer_cabecera_vhd(f, file_size):
+    """Pie (footer) de un VHD: tamaño virtual, tipo de asignación y creador"""
+    pie = leer_en(f, file_size - 512, 512) if file_size >= 512 else b''
+    if pie[:8] != b'conectix':
+        # Los VHD dinámicos llevan también una copia al principio
+        pie = leer_en(f, 0, 512)
+        if pie[:8] != b'conectix':
+            return None
+    
+    tipo = struct.unpack_from('>I', pie, 60)[0]
+    cilindros, cabezas, sectores = struct.unpack_from('>HBB', pie, 56)
+    return {
+        'virtual_size': struct.unpack_from('>Q', pie, 48)[0],
+        'allocation': {2: 'fixed', 3: 'dynamic', 4: 'differencing'}.get(tipo, 'unknown'),
+        'creator': pie[28:32].decode('latin-1').strip(' \x00'),
+        'creator_os': {b'Wi2k': 'Windows', b'Mac ': 'macOS'}.get(pie[36:40], pie[36:40].decode('latin-1').strip(' \x00')),
+        'geometry': {'cylinders': cilindros, 'heads': cabezas, 'sectors': sectores},
+        # Segundos desde el 1 de enero de 2000 (UTC)
+        'created': datetime.fromtimestamp(946684800 + struct.unpack_from('>I', pie, 24)[0], tz=timezone.utc).isoformat(),
+        'uuid': str(uuid.UUID(bytes=pie[68:84])),
+    }
+
+# GUIDs de la región de metadatos de VHDX y de sus elementos
+VHDX_REGION_METADATOS = uuid.UUID('8B7CA206-4790-4B9A-B8FE-575F050F886E')
+VHDX_PARAMETROS = uuid.UUID('CAA16737-FA36-4D43-B3B6-33F0AA44E76B')
+VHDX_TAMAÑO_VIRTUAL = uuid.UUID('2FA54224-CD1B-4876-B211-5DBED83BF4B8')
+VHDX_SECTOR_LOGICO = uuid.UUID('8141BF1D-A96F-4709-BA47-F233A8FAAB5F')
+VHDX_SECTOR_FISICO = uuid.UUID('CDA348C7-445D-4471-9CC9-E9885251C556')
+# Bytes que se leen de cada elemento usado (la longitud declarada en el archivo no es de fiar)
+VHDX_ELEMENTOS = {VHDX_TAMAÑO_VIRTUAL: 8, VHDX_PARAMETROS: 8, VHDX_SECTOR_LOGICO: 4, VHDX_SECTOR_FISICO: 4}
+
+def leer_cabecera_vhdx(f, file_size):
+    """Identificador y metadatos de un VHDX: tamaño virtual, tamaño de bloque y tipo de asignación"""
+    identificador = leer_en(f, 0, 520)
+    if identificador[:8] != b'vhdxfile':
+        return None
+    info = {'creator': identificador[8:520].decode('utf-16-le', errors='replace').split('\x00')[0] or None}
+    
+    # Dos copias de la tabla de regiones (192 KB y 256 KB)
+    for offset_tabla in (192 * 1024, 256 * 1024):
+        tabla = leer_en(f, offset_tabla, 64 * 1024)
+        if tabla[:4] == b'regi':
+            break
+    else:
+        return info
+    
+    offset_metadatos = None
+    entradas = struct.unpack_from('<I', tabla, 8)[0]
+    for i in range(min(entradas, 2047)):
+        guid = uuid.UUID(bytes_le=tabla[16 + i * 32:32 + i * 32])
+        if guid == VHDX_REGION_METADATOS:
+            offset_metadatos = struct.unpack_from('<Q', tabla, 32 + i * 32)[0]
+            break
+    if offset_metadatos is None:
+        return info
+    
+    metadatos = leer_en(f, offset_metadatos, 64 * 1024)
+    if metadatos[:8] != b'metadata':
+        return info
+    elementos = {}
+    for i in range(min(struct.unpack_from('<H', metadatos, 10)[0], 2047)):
+        entrada = 32 + i * 32
+        guid = uuid.UUID(bytes_le=metadatos[entrada:entrada + 16])
+        necesarios = VHDX_ELEMENTOS.get(guid)
+        if necesarios is None or guid in elementos:
+            continue
+        offset, longitud = struct.unpack_from('<II', metadatos, entrada + 16)
+        if longitud < necesarios:
+            continue
+        datos = leer_en(f, offset_metadatos + offset, necesarios)
+        if len(datos) == necesarios:
+            elementos[guid] = datos
+    
+    if VHDX_TAMAÑO_VIRTUAL in elementos:
+        info['virtual_size'] = struct.unpack_from('<Q', elementos[VHDX_TAMAÑO_VIRTUAL])[0]
+    if VHDX_PARAMETROS in elementos:
+        tamaño_bloque, flags = struct.unpack_from('<II', elementos[VHDX_PARAMETROS])
+        info['block_size'] = tamaño_bloque
+        info['allocation'] = 'differencing' if flags & 2 else 'fixed' if flags & 1 else 'dynamic'
+    if VHDX_SECTOR_LOGICO in elementos:
+        info['logical_sector_size'] = struct.unpack_from('<I', elementos[VHDX_SECTOR_LOGICO])[0]
+    if VHDX_SECTOR_FISICO in elementos:
+        info['physical_sector_size'] = struct.unpack_from('<I', elementos[VHDX_SECTOR_FISICO])[0]
+    return {clave: valor for clave, valor in info.items() if valor is not None}
+
+VDI_FIRMA = 0xBEDA107F
+
+def leer_cabecera_vdi(f, file_size):
+    """Cabecera de un VDI de VirtualBox: tamaño virtual, bloques asignados y tipo de imagen"""
+    cabecera = leer_en(f, 0, 0x1C8)
+    if len(cabecera) < 0x1C8 or struct.unpack_from('<I', cabecera, 0x40)[0] != VDI_FIRMA:
+        return None
+    
+    version_mayor = struct.unpack_from('<H', cabecera, 0x46)[0]
+    if version_mayor != 1:
+        return {'version': f'{version_mayor}.{struct.unpack_from("<H", cabecera, 0x44)[0]}'}
+    
+    tipo = struct.unpack_from('<I', cabecera, 0x4C)[0]
+    tamaño_bloque, _, bloques, asignados = struct.unpack_from('<IIII', cabecera, 0x178)
+    return {
+        'virtual_size': struct.unpack_from('<Q', cabecera, 0x170)[0],
+        'allocation': {1: 'dynamic', 2: 'fixed', 3: 'undo', 4: 'differencing'}.get(tipo, 'unknown'),
+        'block_size': tamaño_bloque,
+        'blocks': bloques,
+        'blocks_allocated': asignados,
+        'description': cabecera[0x54:0x154].split(b'\x00')[0].decode('utf-8', errors='replace') or None,
+        'uuid': str(uuid.UUID(bytes_le=cabecera[0x188:0x198])),
+    }
+
+def deducir_sistema(*textos):
+    """Sistema operativo y arquitectura probables a partir de etiquetas e identificadores"""
+    texto = ' '.join(t for t in textos if t).lower()
+    info = {}
+    if any(p in texto for p in ('windows', 'win10', 'win11', 'cccoma', 'ccsa', 'cena_', 'cpba', 'ir5_', 'grmc')):
+        info['os_type'] = 'Windows'
+    elif any(p in texto for p in ('ubuntu', 'debian', 'fedora', 'centos', 'rhel', 'rocky', 'alma', 'arch',
+                                  'mint', 'opensuse', 'kali', 'manjaro', 'linux', 'alpine')):
+        info['os_type'] = 'Linux'
+    elif any(p in texto for p in ('mac os', 'macos', 'os x', 'osx', 'apple')):
+        info['os_type'] = 'macOS'
+    elif 'freebsd' in texto:
+        info['os_type'] = 'FreeBSD'
+    
+    if any(p in texto for p in ('x64', 'amd64', 'x86_64')):
+        info['architecture'] = 'x86_64'
+    elif any(p in texto for p in ('arm64', 'aarch64')):
+        info['architecture'] = 'arm64'
+    elif any(p in texto for p in ('i386', 'i686', 'x86')):
+        info['architecture'] = 'x86'
+    return info
+
 def analizar_imagen_disco(filepath):
-    """Analiza una imagen de disco (ISO/IMG/DMG)"""
+    """Analiza una imagen de disco (ISO/IMG/DMG) leyendo solo sus cabeceras"""
     metadata = {
         'type': 'disk_image',
         'bootable': False,
@@ -211,47 +707,53 @@ def analizar_imagen_disco(filepath):
     }
     
     try:
-        # Usar file command para obtener información básica
-        if shutil.which('file'):
-            result = subprocess.run(['file', filepath], capture_output=True, text=True)
-            if result.returncode == 0:
-                file_info = result.stdout.lower()
-                
-                # Detectar sistema operativo
-                if 'windows' in file_info:
-                    metadata['os_type'] = 'Windows'
-                    metadata['architecture'] = 'x86/x64'
-                elif 'linux' in file_info:
-                    metadata['os_type'] = 'Linux'
-                elif 'mac' in file_info or 'darwin' in file_info:
-                    metadata['os_type'] = 'macOS'
-                
-                # Detectar si es booteable
-                if 'boot' in file_info or 'bootable' in file_info:
-                    metadata['bootable'] = True
-                
-                # Detectar sistema de archivos
-                if 'iso9660' in file_info:
-                    metadata['file_system'] = 'ISO9660'
-                elif 'udf' in file_info:
-                    metadata['file_system'] = 'UDF'
-                elif 'fat' in file_info:
-                    metadata['file_system'] = 'FAT'
-                elif 'ntfs' in file_info:
-                    metadata['file_system'] = 'NTFS'
-                elif 'ext' in file_info:
-                    metadata['file_system'] = 'ext'
-        
-        # Para ISOs, intentar obtener más información
-        if filepath.lower().endswith('.iso'):
-            metadata['iso_type'] = 'CD/DVD Image'
-            metadata['standard'] = 'ISO9660/UDF'
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            # Muchas .img/.bin son en realidad ISOs: probar ISO9660/UDF primero
+            info = leer_cabecera_iso(f)
+            if info is not None:
+                metadata['iso_type'] = 'CD/DVD Image'
+                metadata['standard'] = info['file_system']
+                metadata['bootable'] = bool(info.get('boot_platforms'))
+            else:
+                info = leer_cabecera_dmg(f, file_size) or leer_cabecera_disco(f, file_size)
+            metadata.update(info)
+        
+        metadata.update(deducir_sistema(metadata.get('volume_label'), metadata.get('system_id'),
+                                        metadata.get('application'), metadata.get('publisher')))
             
     except Exception as e:
         print(f"Error analizando imagen de disco: {e}")
     
     return metadata
 
+# Extensiones de los discos que puede contener un OVA
+EXTENSIONES_DISCO_OVA = ('.vmdk', '.vhd', '.vhdx', '.vdi', '.img', '.raw', '.qcow2', '.iso')
+# Límites al inspeccionar un OVA: tamaño del descriptor OVF y miembros recorridos
+OVF_MAX_BYTES = 16 * 1024 * 1024
+OVA_MAX_MIEMBROS = 1000
+
+def inspeccionar_ova(filepath):
+    """Recorre las cabeceras de un OVA sin extraer nada: (metadatos del OVF, miembros)
+    
+    El estándar pone el descriptor .ovf el primero, así que se analiza en cuanto aparece
+    leyéndolo directamente del tar; del resto solo se anotan nombre, tamaño y posición
+    de sus datos dentro del OVA.
+    """
+    metadata_ovf = None
+    miembros = []
+    with tarfile.open(filepath, 'r:') as tar:
+        for _ in range(OVA_MAX_MIEMBROS):
+            miembro = tar.next()
+            if miembro is None:
+                break
+            if not miembro.isfile():
+                continue
+            if metadata_ovf is None and miembro.name.lower().endswith('.ovf') and miembro.size <= OVF_MAX_BYTES:
+                metadata_ovf = extraer_ovf(tar.extractfile(miembro))
+            miembros.append({'name': miembro.name, 'size': miembro.size, 'offset': miembro.offset_data})
+    return metadata_ovf, miembros
+
 def analizar_maquina_virtual(filepath):
     """Analiza una máquina virtual (OVA/OVF)"""
     metadata = {
@@ -265,31 +767,17 @@ def analizar_maquina_virtual(filepath):
             metadata['format'] = 'OVA (Open Virtualization Format Archive)'
             
             try:
-                with tarfile.open(filepath, 'r') as tar:
-                    # Buscar archivo OVF dentro del OVA
-                    ovf_files = [member for member in tar.getmembers() 
-                               if member.name.lower().endswith('.ovf')]
-                    
-                    if ovf_files:
-                        # Extraer el primer OVF temporalmente
-                        ovf_file = ovf_files[0]
-                        temp_dir = '/tmp/vm_analysis'
-                        os.makedirs(temp_dir, exist_ok=True)
-                        
-                        tar.extract(ovf_file, path=temp_dir)
-                        ovf_path = os.path.join(temp_dir, ovf_file.name)
-                        
-                        # Analizar OVF
-                        ovf_metadata = analizar_ovf(ovf_path)
-                        metadata.update(ovf_metadata)
-                        
-                        # Limpiar
-                        try:
-                            shutil.rmtree(temp_dir)
-                        except:
-                            pass
-            except:
-                pass
+                metadata_ovf, miembros = inspeccionar_ova(filepath)
+                if metadata_ovf is not None:
+                    metadata.update(metadata_ovf)
+                
+                # Posición de cada disco dentro del OVA, para poder leerlos sin extraerlos
+                discos = [m for m in miembros if m['name'].lower().endswith(EXTENSIONES_DISCO_OVA)]
+                if discos:
+                    metadata['disk_files'] = discos
+                metadata['manifest'] = any(m['name'].lower().endswith('.mf') for m in miembros)
+            except (tarfile.TarError, OSError) as e:
+                metadata['analysis_error'] = f'OVA no válido: {e}'
                 
         elif filepath.lower().endswith('.ovf'):
             metadata['format'] = 'OVF (Open Virtualization Format)'
@@ -303,73 +791,12 @@ def analizar_maquina_virtual(filepath):
 
 def analizar_ovf(ovf_path):
     """Analiza un archivo OVF"""
-    metadata = {}
-    
     try:
-        with open(ovf_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Limpiar namespaces para facilitar el parsing
-        import re
-        content_clean = re.sub(r'xmlns="[^"]+"', '', content)
-        
-        try:
-            root = ET.fromstring(content_clean)
-            
-            # Información básica
-            name_elem = root.find('.//Name')
-            if name_elem is not None and name_elem.text:
-                metadata['vm_name'] = name_elem.text
-            
-            # Sistema operativo
-            os_elem = root.find('.//OperatingSystemSection')
-            if os_elem is not None:
-                os_type = os_elem.get('{http://schemas.dmtf.org/ovf/envelope/1}id', '')
-                if os_type:
-                    metadata['os_type'] = os_type
-            
-            # Hardware
-            virtual_system = root.find('.//VirtualSystem')
-            if virtual_system is not None:
-                system_type = virtual_system.get('{http://schemas.dmtf.org/ovf/envelope/1}id', '')
-                if system_type:
-                    metadata['system_type'] = system_type
-            
-            # Memoria
-            import xml.etree.ElementTree as ET
-            namespaces = {'rasd': 'http://schemas.dmtf.org/wbem/wscim/1/cim-schema/2/CIM_ResourceAllocationSettingData'}
-            
-            for elem in root.findall('.//'):
-                if 'Memory' in elem.tag or 'RAM' in elem.tag:
-                    for child in elem:
-                        if 'VirtualQuantity' in child.tag:
-                            try:
-                                memory_mb = int(child.text) // 1024
-                                metadata['memory_mb'] = memory_mb
-                            except:
-                                pass
-            
-            # Discos
-            disk_elements = root.findall('.//rasd:HostResource', namespaces=namespaces)
-            if disk_elements:
-                metadata['disks'] = len(disk_elements)
-            
-            # Redes
-            network_elements = root.findall('.//NetworkSection/Network')
-            if network_elements:
-                metadata['networks'] = len(network_elements)
-                
-        except ET.ParseError:
-            # Intentar extraer información de forma básica
-            if 'VirtualBox' in content:
-                metadata['created_with'] = 'VirtualBox'
-            elif 'VMware' in content:
-                metadata['created_with'] = 'VMware'
-    
+        with open(ovf_path, 'rb') as f:
+            return extraer_ovf(f)
     except Exception as e:
         print(f"Error analizando OVF: {e}")
-    
-    return metadata
+        return {}
 
 def analizar_disco_virtual(filepath):
     """Analiza un disco virtual (VDI/VHD/VHDX)"""
@@ -383,12 +810,27 @@ def analizar_disco_virtual(filepath):
         if filepath.lower().endswith('.vdi'):
             metadata['format'] = 'VDI (VirtualBox Disk Image)'
             metadata['compatible_with'] = 'VirtualBox'
+            lector = leer_cabecera_vdi
         elif filepath.lower().endswith('.vhd'):
             metadata['format'] = 'VHD (Virtual Hard Disk)'
             metadata['compatible_with'] = 'VirtualBox, Hyper-V, VMware'
+            lector = leer_cabecera_vhd
         elif filepath.lower().endswith('.vhdx'):
             metadata['format'] = 'VHDX (Virtual Hard Disk v2)'
             metadata['compatible_with'] = 'Hyper-V, VirtualBox 6+'
+            lector = leer_cabecera_vhdx
+        else:
+            return metadata
+        
+        # Datos de la cabecera del propio formato
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            info = lector(f, file_size)
+        if info is None:
+            metadata['valid_header'] = False
+        else:
+            metadata.update(info)
+            metadata['allocated_size'] = file_size
     
     except Exception as e:
         print(f"Error analizando disco virtual: {e}")
@@ -410,310 +852,3454 @@ def obtener_hash_archivo(filepath):
     except:
         return None
 
-# ------------------ Handler ------------------
-class FileHandler(http.server.SimpleHTTPRequestHandler):
+def error_tamaño_maximo(ext, max_size):
+    """Construye la respuesta de error para un archivo que supera su tamaño máximo"""
+    if max_size > 1024 * 1024 * 1024:
+        detalle = f'Máximo permitido: {max_size / (1024 * 1024 * 1024):.1f} GB'
+    else:
+        detalle = f'Máximo permitido: {max_size / (1024 * 1024):.0f} MB'
+    return {
+        'error': f'Archivo demasiado grande para tipo {ext}',
+        'detalle': detalle
+    }
+
+def error_extension_no_permitida():
+    """Construye la respuesta de error para una extensión no permitida"""
+    extensiones_permitidas = ', '.join(sorted(ALLOWED_EXTENSIONS.keys()))
+    return {
+        'error': f'Tipo de archivo no permitido',
+        'detalle': f'Extensiones permitidas: {extensiones_permitidas}'
+    }
+
+def es_nombre_valido(filename):
+    """Comprueba que un nombre recibido en la URL apunta a un archivo de UPLOAD_DIR"""
+    # Los nombres ocultos son temporales y sesiones de subida internas
+    return bool(filename) and '..' not in filename and '/' not in filename and not filename.startswith('.')
+
+def colocar_subida(tmp_path, filename, file_size, hashes):
+    """Mueve un temporal ya validado a UPLOAD_DIR y prepara su entrada del catálogo y su respuesta"""
+    # Evitar duplicados: el nombre queda reservado con un archivo vacío
+    original_filename = filename
+    filename = nombres.reservar(filename)
     
-    def _send_response(self, data, status=200, content_type='application/json'):
-        self.send_response(status)
-        self.send_header('Content-Type', content_type)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        if isinstance(data, str):
-            data = data.encode('utf-8')
-        elif not isinstance(data, bytes):
-            data = json.dumps(data).encode('utf-8')
-        self.wfile.write(data)
+    if original_filename != filename:
+        print(f"⚠️  Archivo renombrado: {original_filename} → {filename}")
     
-    # GET: /files, /uploads/*, /file-info/*, archivos estáticos
-    def do_GET(self):
-        try:
-            # Listar archivos
-            if self.path == '/files':
-                metadata = cargar_metadata()
-                
-                # Añadir información adicional para cada archivo
-                for item in metadata:
-                    filepath = os.path.join(UPLOAD_DIR, item['nombre'])
-                    if os.path.exists(filepath):
-                        # Añadir tamaño real
-                        item['tamaño_real'] = os.path.getsize(filepath)
-                        
-                        # Añadir tipo basado en extensión si no existe
-                        if 'tipo' not in item:
-                            _, ext = os.path.splitext(item['nombre'].lower())
-                            item['tipo'] = obtener_tipo_archivo(ext)
-                
-                self._send_response(metadata)
-                return
+    # Dar al temporal su nombre definitivo (enlazándolo al almacén por contenido)
+    filepath = os.path.join(UPLOAD_DIR, filename)
+    try:
+        deduplicado = guardar_objeto(tmp_path, hashes['sha256'], filepath)
+    except BaseException:
+        eliminar_silencioso(filepath)
+        raise
+    atributos.invalidar(filename)
+    
+    # Obtener tipo de archivo para categorización
+    _, ext = os.path.splitext(filename.lower())
+    tipo_archivo = obtener_tipo_archivo(ext)
+    
+    # Actualizar metadata
+    file_metadata = {
+        'nombre': filename,
+        'tipo': tipo_archivo,
+        'extension': ext,
+        'categoria': 'Sin categoría',
+        'scroll': 0,
+        'tamaño': file_size,
+        'tamaño_mb': round(file_size / (1024 * 1024), 2),
+        'tamaño_gb': round(file_size / (1024 * 1024 * 1024), 2),
+        'fecha': datetime.now().isoformat(),
+        'fecha_timestamp': datetime.now().timestamp(),
+        'mime_type': obtener_tipo_mime(filename),
+        'hash_sha256': hashes['sha256'],
+        'analisis': 'pendiente'
+    }
+    
+    # Digests adicionales calculados durante la subida
+    for algoritmo, digest in hashes.items():
+        if algoritmo != 'sha256':
+            file_metadata[f'hash_{algoritmo}'] = digest
+    
+    # Respuesta con información completa
+    response_data = {
+        'mensaje': 'Archivo subido correctamente',
+        'nombre': filename,
+        'nombre_original': original_filename,
+        'tipo': tipo_archivo,
+        'tamaño': file_size,
+        'tamaño_mb': round(file_size / (1024 * 1024), 2),
+        'tamaño_gb': round(file_size / (1024 * 1024 * 1024), 2),
+        'hash_sha256': hashes['sha256'],
+        'analisis': 'pendiente'
+    }
+    
+    if original_filename != filename:
+        response_data['renombrado'] = True
+        response_data['nombre_original'] = original_filename
+    if deduplicado:
+        # El contenido ya estaba guardado: no ocupa espacio adicional
+        response_data['deduplicado'] = True
+    
+    return file_metadata, response_data
+
+def registrar_subidas(subidas):
+    """Coloca varios temporales (tmp_path, filename, file_size, hashes) y los añade al catálogo de una vez"""
+    colocadas = [colocar_subida(*subida) for subida in subidas]
+    indice.agregar_varios([file_metadata for file_metadata, _ in colocadas])
+    
+    # Los metadatos específicos se obtienen en segundo plano y se añaden después al catálogo
+    respuestas = []
+    for file_metadata, response_data in colocadas:
+        trabajo = cola_analisis.encolar(file_metadata['nombre'], file_metadata['hash_sha256'])
+        response_data['trabajo_analisis'] = trabajo['id']
+        respuestas.append(response_data)
+    return respuestas
+
+def registrar_subida(tmp_path, filename, file_size, hashes):
+    """Mueve un temporal ya validado a UPLOAD_DIR, lo añade al catálogo y encola su análisis"""
+    return registrar_subidas([(tmp_path, filename, file_size, hashes)])[0]
+
+# ------------------ Catálogo ------------------
+class AlmacenJSON:
+    """Guarda el catálogo completo en biblioteca.json"""
+    
+    escritura_completa = True
+    
+    def cargar(self):
+        return cargar_metadata()
+    
+    def guardar(self, modificadas, eliminadas, todas):
+        guardar_metadata(todas)
+
+class AlmacenSQLite:
+    """Guarda el catálogo en SQLite escribiendo solo las entradas que cambian"""
+    
+    escritura_completa = False
+    
+    def __init__(self, ruta, ruta_json=None):
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conexion:
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute('PRAGMA synchronous=NORMAL')
+            self._conexion.executescript('''
+                CREATE TABLE IF NOT EXISTS archivos (
+                    nombre TEXT PRIMARY KEY,
+                    tipo TEXT,
+                    extension TEXT,
+                    categoria TEXT,
+                    fecha REAL,
+                    tamaño INTEGER,
+                    hash_sha256 TEXT,
+                    datos TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_archivos_tipo ON archivos (tipo);
+                CREATE INDEX IF NOT EXISTS idx_archivos_categoria ON archivos (categoria);
+                CREATE INDEX IF NOT EXISTS idx_archivos_extension ON archivos (extension);
+                CREATE INDEX IF NOT EXISTS idx_archivos_fecha ON archivos (fecha);
+                CREATE INDEX IF NOT EXISTS idx_archivos_hash ON archivos (hash_sha256);
+                CREATE TABLE IF NOT EXISTS ajustes (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+            ''')
+        if ruta_json:
+            self._migrar_desde_json(ruta_json)
+    
+    def _migrar_desde_json(self, ruta_json):
+        """Importa biblioteca.json una sola vez (biblioteca.json queda intacto)"""
+        with self._lock:
+            migrado = self._conexion.execute(
+                "SELECT valor FROM ajustes WHERE clave = 'migrado_desde_json'").fetchone()
+        if migrado or not os.path.exists(ruta_json):
+            return
+        
+        entradas = [item for item in cargar_metadata() if isinstance(item, dict) and 'nombre' in item]
+        self.guardar({item['nombre']: item for item in entradas}, set(), None)
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO ajustes (clave, valor) VALUES ('migrado_desde_json', ?)",
+                (datetime.now().isoformat(),))
+        print(f"📦 Catálogo migrado a SQLite: {len(entradas)} archivos")
+    
+    def cargar(self):
+        with self._lock:
+            filas = self._conexion.execute('SELECT datos FROM archivos ORDER BY rowid').fetchall()
+        return [json.loads(datos) for (datos,) in filas]
+    
+    def guardar(self, modificadas, eliminadas, todas):
+        filas = [(
+            nombre,
+            item.get('tipo'),
+            item.get('extension'),
+            item.get('categoria'),
+            fecha_entrada(item),
+            item.get('tamaño'),
+            item.get('hash_sha256'),
+            json.dumps(item, ensure_ascii=False)
+        ) for nombre, item in modificadas.items()]
+        
+        # Todos los cambios del lote en una única transacción
+        with self._lock, self._conexion:
+            self._conexion.executemany('DELETE FROM archivos WHERE nombre = ?',
+                                       [(nombre,) for nombre in eliminadas])
+            self._conexion.executemany('''
+                INSERT INTO archivos (nombre, tipo, extension, categoria, fecha, tamaño, hash_sha256, datos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (nombre) DO UPDATE SET
+                    tipo = excluded.tipo, extension = excluded.extension,
+                    categoria = excluded.categoria, fecha = excluded.fecha,
+                    tamaño = excluded.tamaño, hash_sha256 = excluded.hash_sha256,
+                    datos = excluded.datos
+            ''', filas)
+
+def crear_almacen():
+    """Crea el almacenamiento del catálogo configurado en ALMACEN_CATALOGO"""
+    if ALMACEN_CATALOGO == 'sqlite':
+        return AlmacenSQLite(BIBLIOTECA_DB, BIBLIOTECA_JSON)
+    return AlmacenJSON()
+
+# Campos con índice por valor (filtros de igualdad) y campos por los que se puede ordenar
+CAMPOS_FILTRO = ('tipo', 'categoria', 'extension')
+CAMPOS_ORDEN = ('nombre', 'fecha', 'tamaño')
+
+def claves_indice(item):
+    """Valores de una entrada para los índices secundarios del catálogo"""
+    nombre = item['nombre']
+    _, extension = os.path.splitext(nombre.lower())
+    tamaño = item.get('tamaño')
+    if not isinstance(tamaño, (int, float)):
+        tamaño = 0
+    return {
+        'tipo': item.get('tipo') or obtener_tipo_archivo(extension),
+        'categoria': item.get('categoria', 'Sin categoría'),
+        'extension': extension,
+        # Las claves de orden llevan el nombre al final para ser únicas
+        'nombre': (nombre.lower(), nombre),
+        'fecha': (fecha_entrada(item), nombre),
+        'tamaño': (tamaño, nombre)
+    }
+
+def codificar_cursor(clave):
+    return base64.urlsafe_b64encode(json.dumps(list(clave)).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor):
+    """Clave de orden del último elemento de la página anterior; ValueError si no es válido"""
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(clave, list) or len(clave) != 2:
+        raise ValueError('Cursor inválido')
+    return tuple(clave)
+
+class IndiceBiblioteca:
+    """Catálogo residente en memoria indexado por nombre, con guardado diferido en disco
+    
+    El almacenamiento (biblioteca.json o SQLite) pasa a ser un punto de control: se
+    lee una vez al arrancar y recibe los cambios por lotes cuando dejan de llegar.
+    """
+    
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self.version = 0
+        self._entradas = {}  # nombre -> entrada, en el orden del catálogo
+        self._lock = threading.RLock()
+        self._guardado_lock = threading.Lock()
+        self._sucio = False
+        # Nombres pendientes de escribir o borrar en el almacenamiento
+        self._modificadas = set()
+        self._eliminadas = set()
+        self._cambios = threading.Event()
+        self._hilo = None
+        # Diario de cambios para /cambios: (versión, nombre, tipo), versiones consecutivas
+        self._diario = deque(maxlen=CAMBIOS_MAX)
+        self._nueva_version = threading.Condition(self._lock)
+        self._cerrando = False
+        # Índices secundarios: valor -> nombres, y listas ordenadas de (clave, nombre)
+        self._por_valor = {campo: {} for campo in CAMPOS_FILTRO}
+        self._ordenadas = {campo: [] for campo in CAMPOS_ORDEN}
+        self._claves = {}  # nombre -> claves con las que está indexado
+    
+    def cargar(self):
+        """Carga el catálogo desde disco"""
+        entradas = {}
+        for item in self.almacen.cargar():
+            if isinstance(item, dict) and 'nombre' in item:
+                entradas[item['nombre']] = item
+        with self._lock:
+            self._entradas = entradas
+            self._sucio = False
+            self._modificadas.clear()
+            self._eliminadas.clear()
+            self._reconstruir_indices()
+            self.version += 1
+            # Los clientes tendrán que recargar el listado entero
+            self._diario.clear()
+            self._nueva_version.notify_all()
+    
+    def _reconstruir_indices(self):
+        self._por_valor = {campo: {} for campo in CAMPOS_FILTRO}
+        self._claves = {nombre: claves_indice(item) for nombre, item in self._entradas.items()}
+        for nombre, claves in self._claves.items():
+            for campo in CAMPOS_FILTRO:
+                self._por_valor[campo].setdefault(claves[campo], set()).add(nombre)
+        self._ordenadas = {campo: sorted(claves[campo] for claves in self._claves.values())
+                           for campo in CAMPOS_ORDEN}
+    
+    def _indexar(self, nombre):
+        claves = claves_indice(self._entradas[nombre])
+        self._claves[nombre] = claves
+        for campo in CAMPOS_FILTRO:
+            self._por_valor[campo].setdefault(claves[campo], set()).add(nombre)
+        for campo in CAMPOS_ORDEN:
+            bisect.insort(self._ordenadas[campo], claves[campo])
+    
+    def _desindexar(self, nombre):
+        claves = self._claves.pop(nombre, None)
+        if claves is None:
+            return
+        for campo in CAMPOS_FILTRO:
+            nombres = self._por_valor[campo].get(claves[campo])
+            if nombres is not None:
+                nombres.discard(nombre)
+                if not nombres:
+                    del self._por_valor[campo][claves[campo]]
+        for campo in CAMPOS_ORDEN:
+            lista = self._ordenadas[campo]
+            posicion = bisect.bisect_left(lista, claves[campo])
+            if posicion < len(lista) and lista[posicion] == claves[campo]:
+                del lista[posicion]
+    
+    def iniciar(self):
+        """Arranca el hilo de guardado diferido; sin él cada cambio se guarda al momento"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle_guardado, name='guardado-catalogo', daemon=True)
+            self._hilo.start()
+    
+    def __len__(self):
+        return len(self._entradas)
+    
+    def __contains__(self, nombre):
+        return nombre in self._entradas
+    
+    def listar(self):
+        """Copia de todas las entradas, en orden"""
+        with self._lock:
+            return [dict(item) for item in self._entradas.values()]
+    
+    def obtener(self, nombre):
+        """Copia de la entrada indicada o None"""
+        with self._lock:
+            item = self._entradas.get(nombre)
+            return dict(item) if item is not None else None
+    
+    def agregar(self, entrada):
+        """Añade (o reemplaza) la entrada de un archivo"""
+        self.agregar_varios([entrada])
+    
+    def agregar_varios(self, entradas):
+        """Añade (o reemplaza) varias entradas; se guardan juntas en el mismo lote"""
+        with self._lock:
+            for entrada in entradas:
+                tipo = 'actualizado' if entrada['nombre'] in self._entradas else 'añadido'
+                self._desindexar(entrada['nombre'])
+                self._entradas[entrada['nombre']] = entrada
+                self._indexar(entrada['nombre'])
+                self._marcar_cambio(entrada['nombre'], tipo)
+    
+    def actualizar(self, nombre, cambios):
+        """Aplica cambios a una entrada existente; False si no existe"""
+        with self._lock:
+            item = self._entradas.get(nombre)
+            if item is None:
+                return False
+            self._desindexar(nombre)
+            item.update(cambios)
+            self._indexar(nombre)
+            self._marcar_cambio(nombre, 'actualizado')
+            return True
+    
+    def eliminar(self, nombre):
+        """Quita una entrada del catálogo; False si no existía"""
+        with self._lock:
+            if nombre not in self._entradas:
+                return False
+            self._desindexar(nombre)
+            del self._entradas[nombre]
+            self._marcar_cambio(nombre, 'eliminado')
+            return True
+    
+    def consultar(self, filtros=None, rangos=None, orden='fecha', descendente=False,
+                  limite=FILES_LIMITE, cursor=None):
+        """Devuelve una página del catálogo filtrada y ordenada usando los índices secundarios
+        
+        filtros: campo de CAMPOS_FILTRO -> lista de valores aceptados.
+        rangos: 'tamaño' o 'fecha' -> (mínimo, máximo), cualquiera de los dos puede ser None.
+        Devuelve (entradas, cursor de la página siguiente o None, total o None si no se
+        puede saber sin recorrer todo el catálogo).
+        """
+        filtros = filtros or {}
+        rangos = {campo: limites for campo, limites in (rangos or {}).items()
+                  if limites[0] is not None or limites[1] is not None}
+        
+        with self._lock:
+            # Filtros de igualdad: intersección de los conjuntos del índice por valor
+            candidatos = None
+            for campo, valores in sorted(filtros.items(), key=lambda f: len(f[1])):
+                conjunto = set()
+                for valor in valores:
+                    conjunto |= self._por_valor[campo].get(valor, set())
+                candidatos = conjunto if candidatos is None else candidatos & conjunto
             
-            # Información detallada de un archivo
-            elif self.path.startswith('/file-info/'):
-                filename = unquote(self.path[11:])
-                if '..' in filename or '/' in filename:
-                    self._send_response({'error': 'Ruta inválida'}, 400)
-                    return
-                
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                if not os.path.exists(filepath):
-                    self._send_response({'error': 'Archivo no encontrado'}, 404)
-                    return
-                
-                # Obtener metadatos del archivo
-                file_size = os.path.getsize(filepath)
-                _, ext = os.path.splitext(filename.lower())
-                
-                metadata = {
-                    'filename': filename,
-                    'size': file_size,
-                    'size_mb': round(file_size / (1024 * 1024), 2),
-                    'size_gb': round(file_size / (1024 * 1024 * 1024), 2),
-                    'extension': ext,
-                    'type': obtener_tipo_archivo(ext),
-                    'upload_date': datetime.fromtimestamp(os.path.getctime(filepath)).isoformat(),
-                    'last_modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat(),
-                    'hash_sha256': obtener_hash_archivo(filepath)
-                }
-                
-                # Añadir metadatos específicos según tipo
-                specific_metadata = obtener_metadata_archivo(filepath, filename, file_size)
-                metadata.update(specific_metadata)
-                
-                self._send_response(metadata)
-                return
-                
-            # Descargar archivo
-            elif self.path.startswith('/uploads/'):
-                filename = unquote(self.path[9:])
-                if '..' in filename or '/' in filename:
-                    self._send_response({'error': 'Ruta inválida'}, 400)
-                    return
-                    
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                if not os.path.exists(filepath):
-                    self._send_response({'error': 'Archivo no encontrado'}, 404)
-                    return
-                
-                # Determinar tipo MIME
-                mime_type = obtener_tipo_mime(filename)
-                
-                # Para archivos grandes, usar streaming
-                file_size = os.path.getsize(filepath)
-                
-                self.send_response(200)
-                self.send_header('Content-Type', mime_type)
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-                self.send_header('Content-Length', str(file_size))
-                
-                # Cache headers para archivos grandes
-                if file_size > 100 * 1024 * 1024:  # > 100MB
-                    self.send_header('Cache-Control', 'public, max-age=3600')
-                
-                self.end_headers()
-                
-                # Enviar archivo en chunks
-                with open(filepath, 'rb') as f:
-                    chunk_size = 8192
-                    while True:
-                        chunk = f.read(chunk_size)
-                        if not chunk:
-                            break
-                        self.wfile.write(chunk)
-                return
-                
+            def en_rango(nombre, campos):
+                for campo in campos:
+                    minimo, maximo = rangos[campo]
+                    valor = self._claves[nombre][campo][0]
+                    if (minimo is not None and valor < minimo) or (maximo is not None and valor > maximo):
+                        return False
+                return True
+            
+            if candidatos is not None and len(candidatos) * 8 <= len(self._entradas):
+                # Pocos candidatos: se ordenan directamente
+                lista = sorted(self._claves[nombre][orden] for nombre in candidatos
+                               if en_rango(nombre, rangos))
+                inicio, fin = 0, len(lista)
+                aceptar = None
+                total = len(lista)
             else:
-                # Servir archivos estáticos (HTML, CSS, JS)
-                if self.path == '/':
-                    self.path = '/index.html'
-                
-                # Permitir solo archivos dentro del directorio base
-                filepath = os.path.join(BASE_DIR, self.path.lstrip('/'))
-                if not os.path.exists(filepath) or not filepath.startswith(BASE_DIR):
-                    self._send_response({'error': 'Archivo no encontrado'}, 404)
+                # Recorrer la lista ordenada global; el rango del campo de orden se acota con bisect
+                lista = self._ordenadas[orden]
+                inicio, fin = 0, len(lista)
+                if orden in rangos:
+                    minimo, maximo = rangos[orden]
+                    if minimo is not None:
+                        inicio = bisect.bisect_left(lista, minimo, key=itemgetter(0))
+                    if maximo is not None:
+                        fin = bisect.bisect_right(lista, maximo, key=itemgetter(0))
+                otros_rangos = [campo for campo in rangos if campo != orden]
+                if candidatos is None and not otros_rangos:
+                    aceptar = None
+                    total = max(fin - inicio, 0)
+                else:
+                    def aceptar(nombre):
+                        return ((candidatos is None or nombre in candidatos)
+                                and en_rango(nombre, otros_rangos))
+                    total = len(candidatos) if candidatos is not None and not rangos else None
+            
+            # Posición de partida según el cursor
+            if descendente:
+                posicion = fin - 1
+                if cursor is not None:
+                    posicion = min(posicion, bisect.bisect_left(lista, cursor) - 1)
+                paso, dentro = -1, lambda p: p >= inicio
+            else:
+                posicion = inicio
+                if cursor is not None:
+                    posicion = max(posicion, bisect.bisect_right(lista, cursor))
+                paso, dentro = 1, lambda p: p < fin
+            
+            pagina = []
+            siguiente = None
+            while dentro(posicion):
+                clave = lista[posicion]
+                posicion += paso
+                if aceptar is not None and not aceptar(clave[-1]):
+                    continue
+                if len(pagina) == limite:
+                    siguiente = codificar_cursor(pagina[-1][0])
+                    break
+                pagina.append((clave, dict(self._entradas[clave[-1]])))
+            
+            return [item for _, item in pagina], siguiente, total
+    
+    def cambios_desde(self, version, espera=0):
+        """Cambios posteriores a version: (versión actual, [(tipo, nombre, entrada o None)])
+        
+        Si no hay ninguno espera hasta espera segundos a que llegue alguno. Cada nombre
+        aparece una vez, con su último cambio. Devuelve None como lista si el diario ya
+        no llega hasta version y el cliente debe recargar el catálogo entero.
+        """
+        with self._nueva_version:
+            if espera > 0:
+                self._nueva_version.wait_for(lambda: self.version != version or self._cerrando, espera)
+            if version == self.version:
+                return self.version, []
+            if version > self.version or not self._diario or self._diario[0][0] > version + 1:
+                return self.version, None
+            
+            ultimos = {}
+            for version_cambio, nombre, tipo in reversed(self._diario):
+                if version_cambio <= version:
+                    break
+                ultimos.setdefault(nombre, tipo)
+            cambios = []
+            for nombre, tipo in ultimos.items():
+                entrada = self._entradas.get(nombre)
+                if tipo == 'eliminado' or entrada is None:
+                    cambios.append(('eliminado', nombre, None))
+                else:
+                    cambios.append((tipo, nombre, dict(entrada)))
+            return self.version, cambios
+    
+    def liberar_esperas(self):
+        """Despierta a las consultas de /cambios que esperan (al detener el servidor)"""
+        with self._nueva_version:
+            self._cerrando = True
+            self._nueva_version.notify_all()
+    
+    def _marcar_cambio(self, nombre, tipo):
+        self.version += 1
+        self._diario.append((self.version, nombre, tipo))
+        self._nueva_version.notify_all()
+        self._sucio = True
+        if tipo == 'eliminado':
+            self._modificadas.discard(nombre)
+            self._eliminadas.add(nombre)
+        else:
+            self._eliminadas.discard(nombre)
+            self._modificadas.add(nombre)
+        if self._hilo is None:
+            self.guardar()
+        else:
+            self._cambios.set()
+    
+    def guardar(self):
+        """Escribe en el almacenamiento los cambios pendientes"""
+        with self._guardado_lock:
+            with self._lock:
+                if not self._sucio:
                     return
-                
-                # Determinar tipo de contenido usando mimetypes
-                mime_type, _ = mimetypes.guess_type(filepath)
-                if not mime_type:
-                    mime_type = 'text/plain'
-                
-                self.send_response(200)
-                self.send_header('Content-Type', mime_type)
-                self.end_headers()
-                
-                with open(filepath, 'rb') as f:
-                    self.wfile.write(f.read())
-                    
-        except Exception as e:
-            print(f"Error en GET: {e}", file=sys.stderr)
-            self._send_response({'error': str(e)}, 500)
+                modificadas = {nombre: dict(self._entradas[nombre]) for nombre in self._modificadas}
+                eliminadas = set(self._eliminadas)
+                todas = None
+                if self.almacen.escritura_completa:
+                    todas = [dict(item) for item in self._entradas.values()]
+                self._modificadas.clear()
+                self._eliminadas.clear()
+                self._sucio = False
+            try:
+                self.almacen.guardar(modificadas, eliminadas, todas)
+            except:
+                # Devolver los cambios a la cola salvo los que ya se hayan vuelto a tocar
+                with self._lock:
+                    for nombre in modificadas:
+                        if nombre not in self._eliminadas:
+                            self._modificadas.add(nombre)
+                    for nombre in eliminadas:
+                        if nombre not in self._modificadas:
+                            self._eliminadas.add(nombre)
+                    self._sucio = True
+                raise
     
-    # POST: /upload
-    def do_POST(self):
-        if self.path == '/upload':
+    def _bucle_guardado(self):
+        while True:
+            self._cambios.wait()
+            # Agrupar ráfagas de cambios en una sola escritura
+            limite = time.monotonic() + GUARDADO_MAXIMO
+            while True:
+                self._cambios.clear()
+                restante = limite - time.monotonic()
+                if restante <= 0 or not self._cambios.wait(min(GUARDADO_RETARDO, restante)):
+                    break
             try:
-                content_type = self.headers.get('Content-Type', '')
-                
-                if 'multipart/form-data' not in content_type:
-                    self._send_response({'error': 'Formato inválido'}, 400)
-                    return
-                
-                # Leer todo el contenido
-                content_length = int(self.headers.get('Content-Length', 0))
-                if content_length == 0:
-                    self._send_response({'error': 'No se recibió archivo'}, 400)
-                    return
-                
-                # Verificar tamaño máximo general
-                MAX_UPLOAD_SIZE = 20 * 1024 * 1024 * 1024  # 20GB máximo general
-                if content_length > MAX_UPLOAD_SIZE:
-                    max_gb = MAX_UPLOAD_SIZE / (1024 * 1024 * 1024)
-                    self._send_response({
-                        'error': f'Archivo demasiado grande',
-                        'detalle': f'Máximo permitido: {max_gb:.1f} GB'
-                    }, 400)
+                self.guardar()
+            except Exception as e:
+                print(f"Error guardando el catálogo: {e}", file=sys.stderr)
+                time.sleep(GUARDADO_RETARDO)
+                self._cambios.set()
+
+indice = IndiceBiblioteca(crear_almacen())
+indice.cargar()
+
+# ------------------ Atributos de archivos ------------------
+# Eventos de inotify (ver inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+class VigilanteDirectorio:
+    """Avisa de cambios en un directorio: con inotify en Linux, con sondeo periódico si no
+    
+    al_cambiar(nombre) recibe el nombre del archivo afectado, o None cuando hay que
+    revisarlo todo (desbordamiento de la cola de inotify o cada vuelta del sondeo).
+    """
+    
+    MASCARA = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+               | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    
+    def __init__(self, directorio, al_cambiar, intervalo=CACHE_STAT_INTERVALO):
+        self.directorio = directorio
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self.inotify = False
+    
+    def iniciar(self):
+        fd = self._abrir_inotify()
+        self.inotify = fd is not None
+        objetivo = self._bucle_inotify if self.inotify else self._bucle_sondeo
+        args = (fd,) if self.inotify else ()
+        threading.Thread(target=objetivo, args=args, name='vigilante', daemon=True).start()
+    
+    def _abrir_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, os.fsencode(self.directorio), self.MASCARA) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            # Sistema sin inotify (Windows, macOS...)
+            return None
+    
+    def _bucle_inotify(self, fd):
+        cabecera = struct.calcsize('iIII')
+        while True:
+            try:
+                datos = os.read(fd, 64 * 1024)
+            except OSError as e:
+                print(f"inotify no disponible ({e}); se revisará {self.directorio} periódicamente", file=sys.stderr)
+                break
+            
+            posicion = 0
+            while posicion < len(datos):
+                _, mascara, _, longitud = struct.unpack_from('iIII', datos, posicion)
+                nombre = datos[posicion + cabecera:posicion + cabecera + longitud].rstrip(b'\0')
+                posicion += cabecera + longitud
+                
+                if mascara & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    # El directorio vigilado ha desaparecido: pasar a sondeo
+                    os.close(fd)
+                    self.inotify = False
+                    self.al_cambiar(None)
+                    self._bucle_sondeo()
+                    return
+                if mascara & IN_Q_OVERFLOW or not nombre:
+                    self.al_cambiar(None)
+                else:
+                    self.al_cambiar(os.fsdecode(nombre))
+        
+        os.close(fd)
+        self.inotify = False
+        self._bucle_sondeo()
+    
+    def _bucle_sondeo(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.al_cambiar(None)
+            except Exception as e:
+                print(f"Error revisando {self.directorio}: {e}", file=sys.stderr)
+
+Atributos = namedtuple('Atributos', 'tamaño mtime ctime inodo')
+
+class CacheAtributos:
+    """Caché de tamaño, fechas e inodo de los archivos de UPLOAD_DIR
+    
+    Con el vigilante en marcha, los listados y descargas no tocan el disco mientras
+    los archivos no cambien; sin él, cada consulta hace su propio stat.
+    """
+    
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._atributos = {}  # nombre -> Atributos, o None si no es un archivo
+        self._lock = threading.Lock()
+        # Cambia con cada invalidación: un stat que se cruce con un cambio no se guarda
+        self._generacion = 0
+        self._vigilante = None
+    
+    def iniciar(self):
+        """Precarga los atributos y empieza a vigilar el directorio"""
+        self._vigilante = VigilanteDirectorio(self.directorio, self._al_cambiar)
+        self._vigilante.iniciar()
+        self._recargar()
+    
+    @property
+    def generacion(self):
+        """Contador que avanza con cada cambio detectado en el directorio"""
+        return self._generacion
+    
+    @property
+    def modo(self):
+        if self._vigilante is None:
+            return 'sin caché'
+        return 'inotify' if self._vigilante.inotify else f'sondeo cada {CACHE_STAT_INTERVALO}s'
+    
+    def _leer(self, nombre):
+        try:
+            st = os.stat(os.path.join(self.directorio, nombre))
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return Atributos(st.st_size, st.st_mtime, st.st_ctime, st.st_ino)
+    
+    def obtener(self, nombre):
+        """Atributos de un archivo de UPLOAD_DIR, o None si no existe o no es un archivo"""
+        if self._vigilante is None:
+            return self._leer(nombre)
+        
+        with self._lock:
+            if nombre in self._atributos:
+                return self._atributos[nombre]
+            generacion = self._generacion
+        
+        atributos = self._leer(nombre)
+        with self._lock:
+            if generacion == self._generacion:
+                self._atributos[nombre] = atributos
+        return atributos
+    
+    def invalidar(self, nombre=None):
+        """Olvida los atributos de un archivo (o de todos)"""
+        with self._lock:
+            self._generacion += 1
+            if nombre is None:
+                self._atributos.clear()
+            else:
+                self._atributos.pop(nombre, None)
+    
+    def _recargar(self):
+        """Vuelve a leer todo el directorio de una pasada
+        
+        La generación solo avanza si algo cambió: con sondeo se llama cada
+        CACHE_STAT_INTERVALO segundos y de ella depende la ETag del listado.
+        """
+        with self._lock:
+            generacion = self._generacion
+        
+        nuevos = {}
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith('.'):
+                    continue
+                try:
+                    st = entrada.stat()
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    nuevos[entrada.name] = Atributos(st.st_size, st.st_mtime, st.st_ctime, st.st_ino)
+        
+        with self._lock:
+            if generacion != self._generacion:
+                # Hubo cambios durante la lectura: mejor no fiarse de ella
+                self._atributos.clear()
+            elif nuevos != {nombre: attrs for nombre, attrs in self._atributos.items() if attrs is not None}:
+                self._generacion += 1
+                self._atributos = nuevos
+    
+    def _al_cambiar(self, nombre):
+        if nombre is None:
+            if self._vigilante.inotify:
+                self.invalidar()
+            else:
+                self._recargar()
+        elif not nombre.startswith('.'):
+            self.invalidar(nombre)
+
+atributos = CacheAtributos(UPLOAD_DIR)
+
+# ------------------ Contenido de archivos comprimidos ------------------
+# Un miembro de un archivo: ruta interna, tamaño descomprimido, posición de sus datos,
+# tamaño comprimido y cómo se lee ('directo' = bytes tal cual en el archivo)
+Miembro = namedtuple('Miembro', 'ruta tamaño offset comprimido metodo')
+
+def indexar_zip(f):
+    """Miembros de un zip a partir de su directorio central, sin descomprimir nada"""
+    with zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            cifrado = info.flag_bits & 0x1
+            if info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) and not cifrado:
+                # Los datos empiezan tras la cabecera local, cuyo campo extra puede
+                # no coincidir con el del directorio central
+                cabecera = leer_en(f, info.header_offset, 30)
+                if len(cabecera) < 30 or cabecera[:4] != b'PK\x03\x04':
+                    raise zipfile.BadZipFile(f'Cabecera local dañada: {info.filename}')
+                largo_nombre, largo_extra = struct.unpack_from('<HH', cabecera, 26)
+                offset = info.header_offset + 30 + largo_nombre + largo_extra
+                metodo = 'directo' if info.compress_type == zipfile.ZIP_STORED else 'deflate'
+                yield Miembro(info.filename, info.file_size, offset, info.compress_size, metodo)
+            else:
+                # Otros métodos (bzip2, lzma, cifrado) se leen con zipfile
+                yield Miembro(info.filename, info.file_size, info.header_offset, info.compress_size, 'zip')
+
+def indexar_tar(f):
+    """Miembros de un tar (o OVA) recorriendo solo sus cabeceras"""
+    with tarfile.open(fileobj=f, mode='r:') as tar:
+        while True:
+            miembro = tar.next()
+            if miembro is None:
+                break
+            if miembro.isfile() and not miembro.issparse():
+                yield Miembro(miembro.name, miembro.size, miembro.offset_data, miembro.size, 'directo')
+
+def indexar_gzip(f, filename):
+    """Miembros de un .gz: los de un tar.gz o, si no es un tar, el archivo descomprimido
+    
+    No hay índice que permita saltar dentro de un gzip, así que se recorre entero una
+    vez; la posición anotada es la del flujo descomprimido.
+    """
+    try:
+        with tarfile.open(fileobj=f, mode='r|gz') as tar:
+            miembros = [Miembro(m.name, m.size, m.offset_data, None, 'tar_gz')
+                        for m in tar if m.isfile() and not m.issparse()]
+        return miembros
+    except tarfile.ReadError:
+        f.seek(0)
+    
+    # Un solo archivo: el nombre original va en la cabecera (FNAME) si se guardó
+    cabecera = f.read(10)
+    if len(cabecera) < 10 or cabecera[:2] != b'\x1f\x8b':
+        raise ValueError('No es un archivo gzip')
+    nombre = None
+    if cabecera[3] & 0x08:
+        if cabecera[3] & 0x04:
+            extra = struct.unpack('<H', f.read(2))[0]
+            f.seek(extra, os.SEEK_CUR)
+        nombre = b''
+        while len(nombre) < 1024:
+            byte = f.read(1)
+            if byte in (b'', b'\x00'):
+                break
+            nombre += byte
+        nombre = os.path.basename(nombre.decode('latin-1')) or None
+    if not nombre:
+        nombre = filename[:-3] if filename.lower().endswith('.gz') else filename
+    
+    f.seek(0)
+    tamaño = 0
+    with gzip.GzipFile(fileobj=f) as gz:
+        while True:
+            leidos = len(gz.read(DOWNLOAD_BUFFER_SIZE))
+            if not leidos:
+                break
+            tamaño += leidos
+    return [Miembro(nombre, tamaño, 0, None, 'gzip')]
+
+def raiz_iso(f):
+    """Registro del directorio raíz de una ISO 9660 (del volumen Joliet si existe) y si es Joliet"""
+    raiz, joliet = None, False
+    for sector in range(16, 16 + 64):
+        descriptor = leer_en(f, sector * SECTOR_ISO, SECTOR_ISO)
+        if len(descriptor) < SECTOR_ISO or descriptor[1:6] != b'CD001' or descriptor[0] == 255:
+            break
+        if descriptor[0] == 1 and raiz is None:
+            raiz = descriptor[156:190]
+        elif descriptor[0] == 2 and descriptor[88:90] == b'%/' and descriptor[90] in b'@CE':
+            # Las secuencias de escape %/@, %/C y %/E identifican el volumen Joliet (UCS-2)
+            raiz, joliet = descriptor[156:190], True
+    return raiz, joliet
+
+def indexar_iso(f):
+    """Archivos de una ISO 9660 recorriendo sus directorios; cada archivo es un extent contiguo
+    
+    Las imágenes solo UDF (sin ISO 9660) no se pueden explorar.
+    """
+    raiz, joliet = raiz_iso(f)
+    if raiz is None:
+        raise ValueError('Sin sistema de archivos ISO 9660')
+    
+    pendientes = [('', *struct.unpack_from('<I4xI', raiz, 2))]
+    visitados = set()
+    while pendientes:
+        directorio, extent, longitud = pendientes.pop()
+        if extent in visitados:
+            continue
+        visitados.add(extent)
+        datos = leer_en(f, extent * SECTOR_ISO, min(longitud, 16 * 1024 * 1024))
+        anterior = None
+        pos = 0
+        while pos < len(datos):
+            largo = datos[pos]
+            if largo == 0:
+                # Los registros no cruzan sectores: el resto del sector es relleno
+                pos = (pos // SECTOR_ISO + 1) * SECTOR_ISO
+                continue
+            registro = datos[pos:pos + largo]
+            pos += largo
+            if len(registro) < 34:
+                break
+            extent_reg, tamaño = struct.unpack_from('<I4xI', registro, 2)
+            flags = registro[25]
+            nombre = registro[33:33 + registro[32]]
+            if nombre in (b'\x00', b'\x01'):
+                continue  # "." y ".."
+            nombre = nombre.decode('utf-16-be', 'replace') if joliet else nombre.decode('latin-1')
+            nombre = nombre.split(';')[0]
+            if not joliet:
+                nombre = nombre.rstrip('.')
+            ruta = directorio + nombre
+            
+            if flags & 0x02:
+                pendientes.append((ruta + '/', extent_reg, tamaño))
+                continue
+            offset = extent_reg * SECTOR_ISO
+            if anterior is not None and anterior.ruta == ruta and anterior.offset + anterior.tamaño == offset:
+                # Archivo en varios extents contiguos (los mayores de 4 GB)
+                anterior = anterior._replace(tamaño=anterior.tamaño + tamaño, comprimido=anterior.comprimido + tamaño)
+            else:
+                if anterior is not None:
+                    yield anterior
+                anterior = Miembro(ruta, tamaño, offset, tamaño, 'directo')
+        if anterior is not None:
+            yield anterior
+
+def indexar_contenido(filepath, filename):
+    """Lista de miembros de un archivo navegable y si se ha cortado en CONTENIDO_MAX_MIEMBROS"""
+    _, ext = os.path.splitext(filename.lower())
+    with open(filepath, 'rb') as f:
+        if ext == '.zip':
+            miembros = indexar_zip(f)
+        elif ext in ('.tar', '.ova'):
+            miembros = indexar_tar(f)
+        elif ext == '.gz':
+            miembros = indexar_gzip(f, filename)
+        else:
+            miembros = indexar_iso(f)
+        miembros = list(islice(miembros, CONTENIDO_MAX_MIEMBROS + 1))
+    return miembros[:CONTENIDO_MAX_MIEMBROS], len(miembros) > CONTENIDO_MAX_MIEMBROS
+
+def es_navegable(filename):
+    _, ext = os.path.splitext(filename.lower())
+    return ext in EXTENSIONES_NAVEGABLES
+
+def leer_miembro(f, miembro):
+    """Genera el contenido de un miembro leído con su método; f es el archivo abierto"""
+    if miembro.metodo == 'directo':
+        f.seek(miembro.offset)
+        restante = miembro.tamaño
+        while restante > 0:
+            bloque = f.read(min(restante, DOWNLOAD_BUFFER_SIZE))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+    
+    elif miembro.metodo == 'deflate':
+        # Solo se leen los bytes comprimidos del miembro
+        f.seek(miembro.offset)
+        descompresor = zlib.decompressobj(-zlib.MAX_WBITS)
+        restante = miembro.comprimido
+        while restante > 0:
+            bloque = f.read(min(restante, DOWNLOAD_BUFFER_SIZE))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            datos = descompresor.decompress(bloque)
+            if datos:
+                yield datos
+        datos = descompresor.flush()
+        if datos:
+            yield datos
+    
+    elif miembro.metodo == 'zip':
+        with zipfile.ZipFile(f) as zf, zf.open(miembro.ruta) as origen:
+            yield from iter(lambda: origen.read(DOWNLOAD_BUFFER_SIZE), b'')
+    
+    else:
+        # gzip y tar.gz: se descomprime hasta la posición del miembro (seek hacia delante)
+        with gzip.GzipFile(fileobj=f) as gz:
+            gz.seek(miembro.offset)
+            restante = miembro.tamaño
+            while restante > 0:
+                bloque = gz.read(min(restante, DOWNLOAD_BUFFER_SIZE))
+                if not bloque:
+                    break
+                restante -= len(bloque)
+                yield bloque
+
+# ------------------ Caché de análisis ------------------
+def analizar_archivo(filepath, filename, file_size, hash_sha256=None):
+    """Hash SHA256 y metadatos específicos de un archivo (la parte costosa de /file-info)"""
+    analisis = obtener_metadata_archivo(filepath, filename, file_size)
+    # Tamaño y fechas salen del stat, no del análisis
+    analisis.pop('size', None)
+    analisis.pop('upload_date', None)
+    analisis['hash_sha256'] = hash_sha256 or obtener_hash_archivo(filepath)
+    return analisis
+
+class CacheAnalisis:
+    """Guarda en SQLite el análisis de cada archivo, identificado por (inodo, tamaño, mtime, extensión)
+    
+    Si el archivo se modifica cambia su mtime (o su inodo si se reemplaza) y se vuelve
+    a analizar; los renombrados conservan el inodo y siguen aprovechando la caché.
+    La extensión decide qué analizador se usa, así que un mismo contenido subido con
+    dos extensiones (un duplicado enlazado al mismo objeto) tiene un análisis por cada una.
+    """
+    
+    def __init__(self, ruta, maximo=CACHE_ANALISIS_MAX):
+        self.maximo = maximo
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Análisis en curso por clave, para no analizar dos veces el mismo archivo a la vez
+        self._en_curso = {}
+        with self._lock, self._conexion:
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute('PRAGMA synchronous=NORMAL')
+            # Con otra versión cambian los resultados y puede que el esquema: se empieza de cero
+            if self._conexion.execute('PRAGMA user_version').fetchone()[0] != VERSION_ANALISIS:
+                self._conexion.execute('DROP TABLE IF EXISTS analisis')
+                self._conexion.execute('DROP TABLE IF EXISTS miembros')
+                self._conexion.execute(f'PRAGMA user_version = {VERSION_ANALISIS}')
+            self._conexion.executescript('''
+                CREATE TABLE IF NOT EXISTS analisis (
+                    inodo INTEGER NOT NULL,
+                    tamaño INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    extension TEXT NOT NULL,
+                    datos TEXT NOT NULL,
+                    usado REAL NOT NULL,
+                    PRIMARY KEY (inodo, tamaño, mtime, extension)
+                );
+                CREATE INDEX IF NOT EXISTS idx_analisis_usado ON analisis (usado);
+                CREATE TABLE IF NOT EXISTS miembros (
+                    inodo INTEGER NOT NULL,
+                    tamaño_archivo INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    extension TEXT NOT NULL,
+                    ruta TEXT NOT NULL,
+                    tamaño INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    comprimido INTEGER,
+                    metodo TEXT NOT NULL,
+                    PRIMARY KEY (inodo, tamaño_archivo, mtime, extension, ruta)
+                ) WITHOUT ROWID;
+            ''')
+    
+    @staticmethod
+    def _clave(filename, attrs):
+        _, ext = os.path.splitext(filename.lower())
+        return (attrs.inodo, attrs.tamaño, attrs.mtime, ext)
+    
+    def obtener(self, filename, attrs):
+        """Análisis guardado para esta versión del archivo, o None"""
+        clave = self._clave(filename, attrs)
+        with self._lock, self._conexion:
+            fila = self._conexion.execute(
+                'SELECT datos FROM analisis WHERE inodo = ? AND tamaño = ? AND mtime = ? AND extension = ?',
+                clave).fetchone()
+            if fila is None:
+                return None
+            self._conexion.execute(
+                'UPDATE analisis SET usado = ? WHERE inodo = ? AND tamaño = ? AND mtime = ? AND extension = ?',
+                (time.time(),) + clave)
+        return json.loads(fila[0])
+    
+    def guardar(self, filename, attrs, analisis, miembros=None):
+        clave = self._clave(filename, attrs)
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                'INSERT OR REPLACE INTO analisis (inodo, tamaño, mtime, extension, datos, usado) VALUES (?, ?, ?, ?, ?, ?)',
+                clave + (json.dumps(analisis, ensure_ascii=False), time.time()))
+            if miembros is not None:
+                self._conexion.execute(
+                    'DELETE FROM miembros WHERE inodo = ? AND tamaño_archivo = ? AND mtime = ? AND extension = ?',
+                    clave)
+                # Una ruta repetida (posible en zip y tar) se queda con la última aparición
+                self._conexion.executemany(
+                    'INSERT OR REPLACE INTO miembros (inodo, tamaño_archivo, mtime, extension, ruta, tamaño, offset, comprimido, metodo) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (clave + tuple(miembro) for miembro in miembros))
+            total = self._conexion.execute('SELECT COUNT(*) FROM analisis').fetchone()[0]
+            if total > self.maximo:
+                # Desalojar de golpe un 10% para no hacerlo en cada inserción
+                self._conexion.execute(
+                    'DELETE FROM analisis WHERE rowid IN (SELECT rowid FROM analisis ORDER BY usado LIMIT ?)',
+                    (total - int(self.maximo * 0.9),))
+                self._conexion.execute('''
+                    DELETE FROM miembros WHERE NOT EXISTS (
+                        SELECT 1 FROM analisis a WHERE a.inodo = miembros.inodo
+                        AND a.tamaño = miembros.tamaño_archivo AND a.mtime = miembros.mtime
+                        AND a.extension = miembros.extension)''')
+    
+    def olvidar(self, attrs):
+        """Descarta los análisis de esta versión del archivo, con cualquier extensión"""
+        clave = (attrs.inodo, attrs.tamaño, attrs.mtime)
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                'DELETE FROM analisis WHERE inodo = ? AND tamaño = ? AND mtime = ?', clave)
+            self._conexion.execute(
+                'DELETE FROM miembros WHERE inodo = ? AND tamaño_archivo = ? AND mtime = ?', clave)
+    
+    def hash_conocido(self, attrs):
+        """SHA256 ya calculado para esta versión del archivo, o None (sin analizar ni marcar uso)
+        
+        El hash no depende de la extensión: sirve el de cualquier análisis del mismo contenido.
+        """
+        with self._lock:
+            fila = self._conexion.execute(
+                'SELECT datos FROM analisis WHERE inodo = ? AND tamaño = ? AND mtime = ? LIMIT 1',
+                (attrs.inodo, attrs.tamaño, attrs.mtime)).fetchone()
+        return json.loads(fila[0]).get('hash_sha256') if fila else None
+    
+    def miembro(self, filename, attrs, ruta):
+        """Miembro de un archivo navegable ya analizado, o None"""
+        with self._lock:
+            fila = self._conexion.execute(
+                'SELECT ruta, tamaño, offset, comprimido, metodo FROM miembros '
+                'WHERE inodo = ? AND tamaño_archivo = ? AND mtime = ? AND extension = ? AND ruta = ?',
+                self._clave(filename, attrs) + (ruta,)).fetchone()
+        return Miembro(*fila) if fila else None
+    
+    def listar_miembros(self, filename, attrs, prefijo='', despues=None, limite=CONTENIDO_LIMITE):
+        """Miembros en orden de ruta que empiezan por prefijo, a partir de la ruta despues"""
+        consulta = ('SELECT ruta, tamaño, offset, comprimido, metodo FROM miembros '
+                    'WHERE inodo = ? AND tamaño_archivo = ? AND mtime = ? AND extension = ?')
+        parametros = list(self._clave(filename, attrs))
+        if prefijo:
+            consulta += ' AND ruta >= ? AND ruta < ?'
+            parametros += [prefijo, prefijo + '\U0010ffff']
+        if despues is not None:
+            consulta += ' AND ruta > ?'
+            parametros.append(despues)
+        consulta += ' ORDER BY ruta LIMIT ?'
+        parametros.append(limite)
+        with self._lock:
+            return [Miembro(*fila) for fila in self._conexion.execute(consulta, parametros)]
+    
+    def analizar(self, filename, attrs, hash_sha256=None):
+        """Análisis de un archivo de UPLOAD_DIR, desde la caché o calculado y guardado
+        
+        hash_sha256 evita releer el archivo cuando el hash ya se conoce (calculado al subirlo).
+        """
+        analisis = self.obtener(filename, attrs)
+        if analisis is not None:
+            return analisis
+        
+        clave = self._clave(filename, attrs)
+        with self._lock:
+            lock_clave = self._en_curso.setdefault(clave, threading.Lock())
+        try:
+            with lock_clave:
+                # Otra petición puede haberlo terminado mientras esperábamos
+                analisis = self.obtener(filename, attrs)
+                if analisis is None:
+                    filepath = os.path.join(UPLOAD_DIR, filename)
+                    analisis = analizar_archivo(filepath, filename, attrs.tamaño, hash_sha256)
+                    miembros = None
+                    if es_navegable(filename):
+                        try:
+                            miembros, truncado = indexar_contenido(filepath, filename)
+                            analisis['members'] = len(miembros)
+                            if truncado:
+                                analisis['members_truncated'] = True
+                        except (OSError, EOFError, ValueError, struct.error, zlib.error,
+                                zipfile.BadZipFile, tarfile.TarError) as e:
+                            analisis['members_error'] = str(e)
+                    # Los errores pueden ser pasajeros: no se guardan
+                    if analisis.get('hash_sha256') and 'analysis_error' not in analisis:
+                        self.guardar(filename, attrs, analisis, miembros)
+        finally:
+            with self._lock:
+                if self._en_curso.get(clave) is lock_clave:
+                    del self._en_curso[clave]
+        return analisis
+
+analisis = CacheAnalisis(ANALISIS_DB)
+
+# ------------------ Análisis en segundo plano ------------------
+class ColaAnalisis:
+    """Analiza los archivos subidos en un grupo de hilos y añade el resultado al catálogo
+    
+    Cada archivo encolado es un trabajo con estado 'pendiente', 'analizando',
+    'completado', 'error' o 'cancelado' (el archivo se borró antes de analizarlo).
+    Cada análisis lee el archivo para el SHA256 (hashlib suelta el GIL), las cabeceras
+    de imágenes, discos y máquinas virtuales, y el índice de miembros de los navegables;
+    es casi todo E/S, así que basta con hilos.
+    """
+    
+    def __init__(self, workers=ANALISIS_WORKERS, max_terminados=ANALISIS_TRABAJOS_MAX):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analisis')
+        self._trabajos = {}  # id -> estado del trabajo (en orden de creación)
+        self._lock = threading.Lock()
+        self.max_terminados = max_terminados
+    
+    def encolar(self, nombre, hash_sha256=None):
+        """Programa el análisis de un archivo de UPLOAD_DIR; devuelve una copia del trabajo"""
+        trabajo = {
+            'id': uuid.uuid4().hex,
+            'nombre': nombre,
+            'estado': 'pendiente',
+            'creado': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._trabajos[trabajo['id']] = trabajo
+            self._podar()
+        self._executor.submit(self._ejecutar, trabajo, hash_sha256)
+        return dict(trabajo)
+    
+    def obtener(self, id_trabajo):
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            return dict(trabajo) if trabajo else None
+    
+    def activos(self):
+        """Trabajos pendientes o en curso"""
+        with self._lock:
+            return [dict(t) for t in self._trabajos.values() if t['estado'] in ('pendiente', 'analizando')]
+    
+    def _podar(self):
+        """Olvida los trabajos terminados más antiguos (llamar con el lock tomado)"""
+        terminados = [id_trabajo for id_trabajo, t in self._trabajos.items()
+                      if t['estado'] not in ('pendiente', 'analizando')]
+        for id_trabajo in terminados[:max(0, len(terminados) - self.max_terminados)]:
+            del self._trabajos[id_trabajo]
+    
+    def _cambiar_estado(self, trabajo, estado, **extra):
+        with self._lock:
+            trabajo['estado'] = estado
+            trabajo.update(extra)
+    
+    def _ejecutar(self, trabajo, hash_sha256):
+        nombre = trabajo['nombre']
+        attrs = atributos.obtener(nombre)
+        if attrs is None or nombre not in indice:
+            # Sin archivo no hay nada que analizar; no volver a intentarlo en el próximo arranque
+            indice.actualizar(nombre, {'analisis': 'cancelado'})
+            self._cambiar_estado(trabajo, 'cancelado', terminado=datetime.now().isoformat())
+            return
+        
+        self._cambiar_estado(trabajo, 'analizando', iniciado=datetime.now().isoformat())
+        try:
+            resultado = analisis.analizar(nombre, attrs, hash_sha256)
+            cambios = dict(resultado)
+            cambios['analisis'] = 'error' if 'analysis_error' in resultado else 'completado'
+            indice.actualizar(nombre, cambios)
+            extra = {'error': resultado['analysis_error']} if 'analysis_error' in resultado else {}
+            self._cambiar_estado(trabajo, cambios['analisis'], terminado=datetime.now().isoformat(), **extra)
+        except Exception as e:
+            print(f"Error analizando {nombre}: {e}", file=sys.stderr)
+            indice.actualizar(nombre, {'analisis': 'error', 'analysis_error': str(e)})
+            self._cambiar_estado(trabajo, 'error', terminado=datetime.now().isoformat(), error=str(e))
+    
+    def reanudar_pendientes(self):
+        """Vuelve a encolar los archivos que quedaron sin analizar al parar el servidor"""
+        pendientes = [item['nombre'] for item in indice.listar() if item.get('analisis') == 'pendiente']
+        for nombre in pendientes:
+            self.encolar(nombre)
+        return len(pendientes)
+    
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+cola_analisis = ColaAnalisis()
+
+# ------------------ Almacén por contenido ------------------
+# Las referencias a cada contenido son los enlaces duros del objeto: st_nlink - 1
+objetos_lock = threading.Lock()
+
+def ruta_objeto(hash_sha256):
+    return os.path.join(OBJETOS_DIR, hash_sha256[:2], hash_sha256)
+
+def guardar_objeto(tmp_path, hash_sha256, filepath):
+    """Coloca el contenido de tmp_path en filepath a través del almacén; True si ya estaba guardado
+    
+    filepath puede existir (el nombre reservado) y se sustituye de forma atómica. Si el
+    sistema de archivos no admite enlaces duros el temporal se renombra sin más.
+    """
+    if not ALMACEN_POR_CONTENIDO:
+        os.replace(tmp_path, filepath)
+        return False
+    
+    objeto = ruta_objeto(hash_sha256)
+    with objetos_lock:
+        os.makedirs(os.path.dirname(objeto), exist_ok=True)
+        try:
+            # El temporal pasa a ser el objeto
+            os.link(tmp_path, objeto)
+            existia = False
+        except FileExistsError:
+            # Contenido ya guardado: el temporal se cambia por un enlace al objeto
+            existia = True
+            os.remove(tmp_path)
+            os.link(objeto, tmp_path)
+        except OSError:
+            os.replace(tmp_path, filepath)
+            return False
+        
+        os.replace(tmp_path, filepath)
+    return existia
+
+HASH_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+def buscar_objeto(hash_sha256, tamaño=None):
+    """Ruta del objeto guardado con ese hash (y tamaño, si se indica), o None"""
+    if not ALMACEN_POR_CONTENIDO or not HASH_SHA256_RE.match(hash_sha256 or ''):
+        return None
+    objeto = ruta_objeto(hash_sha256)
+    try:
+        st = os.stat(objeto)
+    except OSError:
+        return None
+    if tamaño is not None and st.st_size != tamaño:
+        return None
+    return objeto
+
+def liberar_objeto(filepath, hash_sha256=None):
+    """Elimina un archivo de UPLOAD_DIR y su objeto si era la última referencia
+    
+    Devuelve True si se liberó el contenido (ninguna otra entrada lo usaba).
+    """
+    with objetos_lock:
+        st = os.stat(filepath)
+        os.remove(filepath)
+        if st.st_nlink == 1:
+            # No estaba en el almacén
+            if hash_sha256:
+                eliminar_variantes(hash_sha256)
+            return True
+        if st.st_nlink > 2 or not hash_sha256:
+            return False
+        
+        objeto = ruta_objeto(hash_sha256)
+        try:
+            st_objeto = os.stat(objeto)
+        except OSError:
+            return False
+        if st_objeto.st_ino == st.st_ino and st_objeto.st_nlink == 1:
+            os.remove(objeto)
+            eliminar_variantes(hash_sha256)
+            return True
+        return False
+
+def migrar_al_almacen():
+    """Pasa al almacén los archivos subidos antes de existir (o fuera de él), deduplicándolos"""
+    migrados = deduplicados = 0
+    for item in indice.listar():
+        nombre = item['nombre']
+        filepath = os.path.join(UPLOAD_DIR, nombre)
+        attrs = atributos.obtener(nombre)
+        try:
+            if attrs is None or os.stat(filepath).st_nlink > 1:
+                continue
+        except OSError:
+            continue
+        
+        # El hash del catálogo puede no corresponder si el archivo se cambió a mano
+        guardado = analisis.obtener(nombre, attrs)
+        hash_sha256 = guardado.get('hash_sha256') if guardado else obtener_hash_archivo(filepath)
+        if not hash_sha256:
+            continue
+        if hash_sha256 != item.get('hash_sha256'):
+            indice.actualizar(nombre, {'hash_sha256': hash_sha256})
+        
+        objeto = ruta_objeto(hash_sha256)
+        with objetos_lock:
+            os.makedirs(os.path.dirname(objeto), exist_ok=True)
+            try:
+                os.link(filepath, objeto)
+                migrados += 1
+            except FileExistsError:
+                # Mismo contenido ya guardado: sustituir la copia por un enlace
+                tmp_path = os.path.join(UPLOAD_DIR, f'.dedup_{uuid.uuid4().hex}')
+                os.link(objeto, tmp_path)
+                os.replace(tmp_path, filepath)
+                atributos.invalidar(nombre)
+                deduplicados += 1
+            except OSError as e:
+                print(f"⚠️  Sin enlaces duros en {UPLOAD_DIR} ({e}): no se deduplicará", file=sys.stderr)
+                return
+    
+    if migrados or deduplicados:
+        print(f"📦 Almacén por contenido: {migrados} archivos incorporados, {deduplicados} copias deduplicadas")
+
+# ------------------ Nombres de archivo ------------------
+class AsignadorNombres:
+    """Asigna nombres libres en UPLOAD_DIR sin probar name_1, name_2... uno a uno
+    
+    Guarda por cada nombre base el siguiente sufijo a usar y reserva el nombre
+    creando el archivo con O_EXCL, así dos subidas simultáneas nunca eligen el mismo.
+    """
+    
+    SUFIJO_RE = re.compile(r'^(.*)_(\d+)$')
+    
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._siguiente = {}  # (base, extensión) -> siguiente sufijo
+        self._lock = threading.Lock()
+    
+    def _anotar(self, nombre):
+        """Tiene en cuenta un nombre ya usado para los sufijos futuros (llamar con el lock tomado)"""
+        base, ext = os.path.splitext(nombre)
+        coincidencia = self.SUFIJO_RE.match(base)
+        if coincidencia:
+            clave = (coincidencia.group(1), ext)
+            sufijo = int(coincidencia.group(2)) + 1
+            if sufijo > self._siguiente.get(clave, 1):
+                self._siguiente[clave] = sufijo
+    
+    def cargar(self, nombres_existentes):
+        """Inicializa los contadores con los nombres del catálogo y del directorio"""
+        with self._lock:
+            for nombre in nombres_existentes:
+                self._anotar(nombre)
+            for nombre in os.listdir(self.directorio):
+                self._anotar(nombre)
+    
+    def _crear(self, nombre):
+        try:
+            os.close(os.open(os.path.join(self.directorio, nombre), os.O_WRONLY | os.O_CREAT | os.O_EXCL, MODO_ARCHIVOS))
+            return True
+        except FileExistsError:
+            return False
+    
+    def reservar(self, filename):
+        """Reserva filename, o el primer filename_N libre, creándolo vacío; devuelve el nombre"""
+        with self._lock:
+            # Si el nombre original está libre se usa tal cual
+            if self._crear(filename):
+                self._anotar(filename)
+                return filename
+            
+            base, ext = os.path.splitext(filename)
+            sufijo = self._siguiente.get((base, ext), 1)
+            # Solo se repite si alguien creó archivos por fuera del servidor
+            while not self._crear(f"{base}_{sufijo}{ext}"):
+                sufijo += 1
+            self._siguiente[(base, ext)] = sufijo + 1
+            return f"{base}_{sufijo}{ext}"
+
+nombres = AsignadorNombres(UPLOAD_DIR)
+
+def completar_entrada_listado(item):
+    """Añade a una entrada del listado el tamaño real en disco y su tipo si falta"""
+    attrs = atributos.obtener(item['nombre'])
+    if attrs is not None:
+        # Añadir tamaño real
+        item['tamaño_real'] = attrs.tamaño
+        
+        # Añadir tipo basado en extensión si no existe
+        if 'tipo' not in item:
+            _, ext = os.path.splitext(item['nombre'].lower())
+            item['tipo'] = obtener_tipo_archivo(ext)
+
+# ------------------ Descargas parciales ------------------
+def parsear_rangos(cabecera, file_size):
+    """Interpreta una cabecera Range 'bytes=...' y devuelve una lista de (inicio, fin) inclusivos.
+    
+    Devuelve None si la cabecera no es válida o no se soporta (se ignora y se envía
+    el archivo completo) y una lista vacía si ningún rango es satisfacible.
+    """
+    unidad, _, especificacion = cabecera.partition('=')
+    if unidad.strip().lower() != 'bytes' or not especificacion.strip():
+        return None
+    
+    rangos = []
+    for parte in especificacion.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        inicio, guion, fin = parte.partition('-')
+        inicio, fin = inicio.strip(), fin.strip()
+        if not guion or not (inicio.isdigit() or fin.isdigit()):
+            return None
+        if (inicio and not inicio.isdigit()) or (fin and not fin.isdigit()):
+            return None
+        
+        if not inicio:
+            # Sufijo: los últimos N bytes
+            sufijo = int(fin)
+            if sufijo == 0 or file_size == 0:
+                continue
+            rangos.append((max(file_size - sufijo, 0), file_size - 1))
+            continue
+        
+        inicio = int(inicio)
+        fin = int(fin) if fin else None
+        if fin is not None and fin < inicio:
+            return None
+        if inicio >= file_size:
+            continue
+        rangos.append((inicio, file_size - 1 if fin is None else min(fin, file_size - 1)))
+    
+    if len(rangos) > MAX_RANGOS:
+        return None
+    
+    # Unir rangos solapados o contiguos
+    rangos.sort()
+    unidos = []
+    for inicio, fin in rangos:
+        if unidos and inicio <= unidos[-1][1] + 1:
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fin))
+        else:
+            unidos.append((inicio, fin))
+    return unidos
+
+def disposicion_adjunto(nombre):
+    """Cabecera Content-Disposition para descargar con este nombre (RFC 6266)"""
+    ascii_nombre = nombre.encode('ascii', 'replace').decode('ascii').replace('"', '_').replace('\\', '_')
+    return f"attachment; filename=\"{ascii_nombre}\"; filename*=UTF-8''{quote(nombre, safe='')}"
+
+# ------------------ Peticiones condicionales ------------------
+# Los contadores de versión empiezan de cero en cada arranque: las ETag que se
+# derivan de ellos llevan este prefijo para no coincidir con las de otra ejecución
+ARRANQUE = format(time.time_ns(), 'x')
+
+def etag_codificado(etag, codificacion):
+    """ETag de la variante comprimida: la original con la codificación como sufijo"""
+    return f'{etag[:-1]}-{codificacion}"' if codificacion else etag
+
+def normalizar_etag(etag):
+    etag = etag.strip()
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for codificacion in ('gzip', 'zstd'):
+        if etag.endswith(f'-{codificacion}"'):
+            return etag[:-len(codificacion) - 2] + '"'
+    return etag
+
+def coincide_etag(cabecera, etag):
+    """Comparación débil de If-None-Match con una ETag (la variante comprimida cuenta como la misma)"""
+    if cabecera.strip() == '*':
+        return True
+    etag = normalizar_etag(etag)
+    return any(normalizar_etag(candidata) == etag for candidata in cabecera.split(','))
+
+def etag_archivo(attrs):
+    """ETag fuerte de un archivo subido: su inodo, tamaño y mtime
+    
+    No usa el SHA256 aunque se conozca: se calcula después de la subida y cambiar
+    de validador invalidaría las ETag ya entregadas (If-None-Match, If-Range) sin
+    que cambie el contenido.
+    """
+    return f'"{attrs.inodo:x}-{attrs.tamaño:x}-{int(attrs.mtime * 1000000):x}"'
+
+def etag_catalogo():
+    """ETag del listado: cambia con el catálogo o con los archivos del directorio"""
+    return f'"{ARRANQUE}-{indice.version}-{atributos.generacion}"'
+
+def etag_info(attrs):
+    """ETag de /file-info: depende solo del archivo y de la versión del análisis"""
+    return f'"{attrs.inodo:x}-{attrs.tamaño:x}-{int(attrs.mtime * 1000000):x}-{int(attrs.ctime * 1000000):x}-v{VERSION_ANALISIS}"'
+
+# ------------------ Compresión ------------------
+# Extensión de la variante guardada para cada codificación, por orden de preferencia
+CODIFICACIONES = {'zstd': '.zst', 'gzip': '.gz'} if zstandard is not None else {'gzip': '.gz'}
+
+def elegir_codificacion(accept_encoding):
+    """Mejor codificación soportada que acepta el cliente según Accept-Encoding, o None"""
+    if not accept_encoding:
+        return None
+    pesos = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.partition(';')
+        nombre = nombre.strip().lower()
+        peso = 1.0
+        parametro, _, valor = parametros.partition('=')
+        if parametro.strip().lower() == 'q':
+            try:
+                peso = float(valor)
+            except ValueError:
+                peso = 0.0
+        pesos[nombre] = peso
+    
+    mejor, mejor_peso = None, 0.0
+    for codificacion in CODIFICACIONES:
+        peso = pesos.get(codificacion, pesos.get('*', 0.0))
+        if peso > mejor_peso:
+            mejor, mejor_peso = codificacion, peso
+    return mejor
+
+def comprimir(datos, codificacion, nivel=COMPRESION_NIVEL):
+    if codificacion == 'zstd':
+        return zstandard.ZstdCompressor(level=min(nivel, 19)).compress(datos)
+    return gzip.compress(datos, compresslevel=nivel, mtime=0)
+
+def es_comprimible(filename):
+    _, ext = os.path.splitext(filename.lower())
+    return ext in EXTENSIONES_COMPRIMIBLES
+
+def ruta_variante(hash_sha256, codificacion):
+    return ruta_objeto(hash_sha256) + CODIFICACIONES[codificacion]
+
+def variante_comprimida(filepath, hash_sha256, codificacion):
+    """Ruta de la versión comprimida de un archivo subido, creándola la primera vez
+    
+    Se identifica por el SHA256 del contenido: los duplicados la comparten y un
+    contenido nuevo nunca ve una variante vieja. Devuelve None si el contenido se
+    borró mientras se comprimía.
+    """
+    destino = ruta_variante(hash_sha256, codificacion)
+    if os.path.exists(destino):
+        return destino
+    
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.variante_')
+    try:
+        with open(filepath, 'rb') as origen, os.fdopen(fd, 'wb') as salida:
+            os.fchmod(salida.fileno(), MODO_ARCHIVOS)
+            if codificacion == 'zstd':
+                zstandard.ZstdCompressor(level=min(COMPRESION_NIVEL_VARIANTES, 19)).copy_stream(origen, salida)
+            else:
+                with gzip.GzipFile(fileobj=salida, mode='wb', compresslevel=COMPRESION_NIVEL_VARIANTES, mtime=0) as gz:
+                    while True:
+                        bloque = origen.read(DOWNLOAD_BUFFER_SIZE)
+                        if not bloque:
+                            break
+                        gz.write(bloque)
+        with objetos_lock:
+            # El contenido pudo borrarse mientras se comprimía: no dejar una variante huérfana
+            if not os.path.exists(filepath) and not os.path.exists(ruta_objeto(hash_sha256)):
+                eliminar_silencioso(tmp)
+                return None
+            os.replace(tmp, destino)
+    except BaseException:
+        eliminar_silencioso(tmp)
+        raise
+    return destino
+
+def eliminar_variantes(hash_sha256):
+    for codificacion in CODIFICACIONES:
+        eliminar_silencioso(ruta_variante(hash_sha256, codificacion))
+
+class ColaVariantes:
+    """Crea en segundo plano las variantes comprimidas que se piden y aún no existen
+    
+    Cada (hash, codificación) se encarga una sola vez aunque lleguen muchas peticiones
+    a la vez; mientras tanto las descargas se sirven sin comprimir.
+    """
+    
+    def __init__(self, workers=VARIANTES_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='variantes')
+        self._en_curso = set()
+        self._lock = threading.Lock()
+    
+    def encargar(self, filepath, hash_sha256, codificacion):
+        clave = (hash_sha256, codificacion)
+        with self._lock:
+            if clave in self._en_curso:
+                return
+            self._en_curso.add(clave)
+        try:
+            self._executor.submit(self._crear, filepath, clave)
+        except RuntimeError:
+            # Cerrando el servidor
+            with self._lock:
+                self._en_curso.discard(clave)
+    
+    def _crear(self, filepath, clave):
+        hash_sha256, codificacion = clave
+        try:
+            variante_comprimida(filepath, hash_sha256, codificacion)
+        except OSError as e:
+            print(f"No se pudo comprimir {os.path.basename(filepath)}: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._en_curso.discard(clave)
+    
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+cola_variantes = ColaVariantes()
+
+# ------------------ Archivos estáticos ------------------
+# Un archivo del frontend en memoria; variantes guarda sus versiones comprimidas
+Estatico = namedtuple('Estatico', 'datos etag cabeceras variantes version')
+
+class CacheEstaticos:
+    """Archivos estáticos de BASE_DIR (index.html, script.js, style.css...) en memoria
+    
+    Con inotify se sirven sin tocar el disco y se descartan en cuanto cambian; con
+    sondeo se comprueba su stat en cada vuelta. Solo se guardan los archivos de la
+    raíz de BASE_DIR de hasta ESTATICOS_MAX_BYTES.
+    """
+    
+    def __init__(self, directorio, max_bytes=ESTATICOS_MAX_BYTES):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._estaticos = {}  # nombre -> Estatico
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self._vigilante = None
+    
+    def iniciar(self):
+        self._vigilante = VigilanteDirectorio(self.directorio, self._al_cambiar)
+        self._vigilante.iniciar()
+    
+    def _leer(self, nombre):
+        filepath = os.path.join(self.directorio, nombre)
+        try:
+            with open(filepath, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if not stat.S_ISREG(st.st_mode) or st.st_size > self.max_bytes:
+                    return None
+                datos = f.read()
+        except OSError:
+            return None
+        
+        mime_type, _ = mimetypes.guess_type(filepath)
+        cabeceras = [
+            ('Content-Type', mime_type or 'text/plain'),
+            ('Vary', 'Accept-Encoding'),
+            ('Cache-Control', 'no-cache'),
+            ('Last-Modified', formatdate(st.st_mtime, usegmt=True))
+        ]
+        etag = '"' + hashlib.blake2b(datos, digest_size=16).hexdigest() + '"'
+        return Estatico(datos, etag, cabeceras, {}, (st.st_mtime_ns, st.st_size, st.st_ino))
+    
+    def obtener(self, nombre):
+        """Estatico de un archivo de la raíz de BASE_DIR, o None si no existe o no se guarda en memoria"""
+        if self._vigilante is None:
+            return self._leer(nombre)
+        
+        with self._lock:
+            estatico = self._estaticos.get(nombre)
+            if estatico is not None:
+                return estatico
+            generacion = self._generacion
+        
+        estatico = self._leer(nombre)
+        with self._lock:
+            # Una lectura que se cruza con un cambio no se guarda
+            if estatico is not None and generacion == self._generacion:
+                self._estaticos[nombre] = estatico
+        return estatico
+    
+    def variante(self, estatico, codificacion):
+        """Contenido comprimido con codificacion, calculado la primera vez que se pide"""
+        comprimidos = estatico.variantes.get(codificacion)
+        if comprimidos is None:
+            comprimidos = comprimir(estatico.datos, codificacion, COMPRESION_NIVEL_VARIANTES)
+            estatico.variantes[codificacion] = comprimidos
+        return comprimidos
+    
+    def _al_cambiar(self, nombre):
+        with self._lock:
+            self._generacion += 1
+            if nombre is not None:
+                self._estaticos.pop(nombre, None)
+                return
+            if self._vigilante.inotify:
+                # Se perdieron eventos: no fiarse de nada
+                self._estaticos.clear()
+                return
+            guardados = list(self._estaticos.items())
+        
+        # Sondeo: descartar los que han cambiado desde que se leyeron
+        for nombre, estatico in guardados:
+            try:
+                st = os.stat(os.path.join(self.directorio, nombre))
+                version = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except OSError:
+                version = None
+            if version != estatico.version:
+                with self._lock:
+                    if self._estaticos.get(nombre) is estatico:
+                        del self._estaticos[nombre]
+
+estaticos = CacheEstaticos(BASE_DIR)
+
+# ------------------ Multipart en streaming ------------------
+class MultipartError(Exception):
+    """Cuerpo multipart/form-data mal formado o incompleto"""
+
+class ArchivoDemasiadoGrande(Exception):
+    """El archivo recibido supera el tamaño máximo de su tipo"""
+
+def parametro_cabecera(valor, nombre):
+    """Extrae un parámetro (name, filename...) de una cabecera como Content-Disposition"""
+    patron = r'(?:^|;)\s*' + re.escape(nombre) + r'\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;\s]*))'
+    match = re.search(patron, valor, re.IGNORECASE)
+    if not match:
+        return None
+    if match.group(1) is not None:
+        return re.sub(r'\\(.)', r'\1', match.group(1))
+    return match.group(2)
+
+class ParteMultipart:
+    """Una parte del cuerpo multipart; sus datos se consumen por bloques"""
+
+    def __init__(self, lector, cabeceras):
+        self._lector = lector
+        self._bloques = None
+        self.cabeceras = cabeceras
+        disposition = cabeceras.get('content-disposition', '')
+        self.name = parametro_cabecera(disposition, 'name')
+        self.filename = parametro_cabecera(disposition, 'filename')
+
+    def bloques(self):
+        """Genera los datos de la parte sin cargarla entera en memoria
+        
+        Si se deja a medias, volver a llamarlo continúa donde se quedó (así se
+        pueden descartar los datos que faltan y seguir con la parte siguiente).
+        """
+        if self._bloques is None:
+            self._bloques = self._lector._bloques_cuerpo()
+        return self._bloques
+
+class LectorMultipart:
+    """Parser incremental de multipart/form-data que lee rfile en bloques acotados"""
+
+    MAX_CABECERAS = 64 * 1024
+
+    def __init__(self, rfile, boundary, content_length, chunk_size=UPLOAD_CHUNK_SIZE):
+        self._rfile = rfile
+        self._restante = content_length
+        self._chunk_size = chunk_size
+        self._delimitador = b'\r\n--' + boundary
+        # El primer delimitador no va precedido de CRLF: se simula uno
+        self._buffer = bytearray(b'\r\n')
+
+    def _leer(self):
+        """Añade al buffer el siguiente bloque del socket; False si ya no quedan datos"""
+        if self._restante <= 0:
+            return False
+        datos = self._rfile.read(min(self._chunk_size, self._restante))
+        if not datos:
+            raise MultipartError('Conexión cerrada antes de completar la subida')
+        self._restante -= len(datos)
+        self._buffer += datos
+        return True
+
+    def _asegurar(self, n):
+        """Garantiza al menos n bytes en el buffer"""
+        while len(self._buffer) < n:
+            if not self._leer():
+                raise MultipartError('Cuerpo multipart incompleto')
+
+    def _bloques_cuerpo(self):
+        """Genera los datos hasta el siguiente delimitador y lo consume"""
+        n = len(self._delimitador)
+        while True:
+            pos = self._buffer.find(self._delimitador)
+            if pos != -1:
+                if pos:
+                    yield bytes(self._buffer[:pos])
+                del self._buffer[:pos + n]
+                return
+            # Conservar la cola por si el delimitador queda partido entre dos bloques
+            seguro = len(self._buffer) - (n - 1)
+            if seguro > 0:
+                yield bytes(self._buffer[:seguro])
+                del self._buffer[:seguro]
+            if not self._leer():
+                raise MultipartError('Cuerpo multipart incompleto')
+
+    def _leer_cabeceras(self):
+        """Lee el bloque de cabeceras de una parte"""
+        while True:
+            if self._buffer.startswith(b'\r\n'):
+                del self._buffer[:2]
+                return {}
+            fin = self._buffer.find(b'\r\n\r\n')
+            if fin != -1:
+                if fin > self.MAX_CABECERAS:
+                    raise MultipartError('Cabeceras de parte demasiado grandes')
+                break
+            if len(self._buffer) > self.MAX_CABECERAS:
+                raise MultipartError('Cabeceras de parte demasiado grandes')
+            if not self._leer():
+                raise MultipartError('Cuerpo multipart incompleto')
+
+        cabeceras = {}
+        for linea in bytes(self._buffer[:fin]).decode('utf-8', errors='replace').split('\r\n'):
+            if ':' in linea:
+                clave, valor = linea.split(':', 1)
+                cabeceras[clave.strip().lower()] = valor.strip()
+        del self._buffer[:fin + 4]
+        return cabeceras
+
+    def partes(self):
+        """Genera las partes del cuerpo en orden; las no consumidas se descartan"""
+        # Saltar el preámbulo hasta el primer delimitador
+        for _ in self._bloques_cuerpo():
+            pass
+
+        while True:
+            # Tras el delimitador: '--' marca el final, CRLF una parte nueva
+            self._asegurar(2)
+            marca = bytes(self._buffer[:2])
+            if marca == b'--':
+                # Descartar el epílogo
+                self._buffer.clear()
+                while self._leer():
+                    self._buffer.clear()
+                return
+            if marca != b'\r\n':
+                raise MultipartError('Delimitador multipart mal formado')
+            del self._buffer[:2]
+
+            parte = ParteMultipart(self, self._leer_cabeceras())
+            yield parte
+            for _ in parte.bloques():
+                pass
+
+def obtener_boundary(content_type):
+    """Obtiene el boundary de una cabecera Content-Type multipart"""
+    boundary = parametro_cabecera(content_type, 'boundary')
+    return boundary.encode('latin-1') if boundary else None
+
+def eliminar_silencioso(path):
+    """Elimina un archivo ignorando si ya no existe"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def crear_hashers(algoritmos=None):
+    """Crea los objetos hash de los digests de subida; los no disponibles se ignoran"""
+    hashers = {'sha256': hashlib.sha256()}
+    for algoritmo in algoritmos if algoritmos is not None else UPLOAD_DIGESTS:
+        if algoritmo in hashers:
+            continue
+        if algoritmo.startswith('xxh'):
+            if xxhash is not None and hasattr(xxhash, algoritmo):
+                hashers[algoritmo] = getattr(xxhash, algoritmo)()
+        elif algoritmo in hashlib.algorithms_available:
+            hashers[algoritmo] = hashlib.new(algoritmo)
+    return hashers
+
+def guardar_parte_en_temporal(parte, max_size):
+    """Vuelca una parte a un temporal de UPLOAD_DIR calculando sus hashes en la misma pasada"""
+    return guardar_en_temporal(parte.bloques(), max_size)
+
+def guardar_en_temporal(bloques, max_size):
+    """Vuelca bloques de datos a un temporal de UPLOAD_DIR; devuelve (tmp_path, file_size, hashes)"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.subida_', suffix='.part', dir=UPLOAD_DIR)
+    hashers = crear_hashers()
+    file_size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), MODO_ARCHIVOS)
+            for bloque in bloques:
+                file_size += len(bloque)
+                if file_size > max_size:
+                    raise ArchivoDemasiadoGrande()
+                f.write(bloque)
+                for hasher in hashers.values():
+                    hasher.update(bloque)
+    except BaseException:
+        eliminar_silencioso(tmp_path)
+        raise
+
+    hashes = {nombre: hasher.hexdigest() for nombre, hasher in hashers.items()}
+    return tmp_path, file_size, hashes
+
+class LectorLimitado:
+    """Expone como archivo de solo lectura los primeros `longitud` bytes de rfile"""
+    
+    def __init__(self, rfile, longitud):
+        self._rfile = rfile
+        self.restante = longitud
+    
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self.restante:
+            n = self.restante
+        if n <= 0:
+            return b''
+        datos = self._rfile.read(n)
+        self.restante -= len(datos)
+        return datos
+    
+    def descartar(self):
+        """Consume lo que quede del cuerpo para poder reutilizar la conexión"""
+        while self.read(UPLOAD_CHUNK_SIZE):
+            pass
+
+def validar_archivo_lote(nombre_cliente, tamaño=None):
+    """Nombre final y tamaño máximo de un archivo de un lote, o (None, error) si no se acepta"""
+    # Algunos navegadores y tars incluyen la ruta completa
+    filename = os.path.basename((nombre_cliente or '').replace('\\', '/'))
+    if not es_nombre_valido(filename):
+        return None, {'error': 'Nombre de archivo inválido'}
+    if not es_extension_permitida(filename):
+        return None, error_extension_no_permitida()
+    
+    _, ext = os.path.splitext(filename.lower())
+    max_size = MAX_FILE_SIZES.get(ext, MAX_FILE_SIZES['default'])
+    if tamaño is not None and tamaño > max_size:
+        return None, error_tamaño_maximo(ext, max_size)
+    return filename, max_size
+
+def recibir_lote_multipart(lector):
+    """Genera (filename, resultado) por cada archivo del cuerpo multipart
+    
+    resultado es (tmp_path, file_size, hashes) si el archivo se guardó, o un dict de error.
+    """
+    for parte in lector.partes():
+        if parte.filename is None:
+            continue
+        filename, max_size = validar_archivo_lote(parte.filename)
+        if filename is None:
+            yield parte.filename, max_size
+            continue
+        try:
+            yield filename, guardar_parte_en_temporal(parte, max_size)
+        except ArchivoDemasiadoGrande:
+            # partes() descarta el resto de esta parte y sigue con la siguiente
+            _, ext = os.path.splitext(filename.lower())
+            yield filename, error_tamaño_maximo(ext, max_size)
+
+def recibir_lote_tar(lector):
+    """Genera (filename, resultado) por cada archivo regular de un tar recibido en streaming"""
+    with tarfile.open(fileobj=lector, mode='r|*') as tar:
+        for miembro in tar:
+            if not miembro.isfile():
+                continue
+            filename, max_size = validar_archivo_lote(miembro.name, miembro.size)
+            if filename is None:
+                yield miembro.name, max_size
+                continue
+            datos = tar.extractfile(miembro)
+            try:
+                yield filename, guardar_en_temporal(iter(lambda: datos.read(UPLOAD_CHUNK_SIZE), b''), max_size)
+            except ArchivoDemasiadoGrande:
+                _, ext = os.path.splitext(filename.lower())
+                yield filename, error_tamaño_maximo(ext, max_size)
+
+# ------------------ Subidas por trozos ------------------
+class SesionSubida:
+    """Subida reanudable de un archivo grande enviado en trozos numerados"""
+    
+    def __init__(self, id, nombre, tamaño, chunk_size, recibidos=(), creada=None, actualizada=None):
+        self.id = id
+        self.nombre = nombre
+        self.tamaño = tamaño
+        self.chunk_size = chunk_size
+        self.recibidos = set(recibidos)
+        self.creada = creada or time.time()
+        self.actualizada = actualizada or self.creada
+        self.lock = threading.Lock()
+        self.finalizando = False
+        # Hash incremental de los trozos llegados en orden; tras un reinicio
+        # del servidor se pierde y se recalcula al finalizar
+        self.hashers = None if self.recibidos else crear_hashers()
+        self.hash_offset = 0
+        self.hasheando = False
+    
+    @property
+    def ruta_datos(self):
+        return os.path.join(SESIONES_DIR, self.id + '.part')
+    
+    @property
+    def ruta_estado(self):
+        return os.path.join(SESIONES_DIR, self.id + '.json')
+    
+    @property
+    def total_chunks(self):
+        return -(-self.tamaño // self.chunk_size)
+    
+    def longitud_chunk(self, indice):
+        """Bytes que debe tener el trozo indicado (el último puede ser menor)"""
+        return min(self.chunk_size, self.tamaño - indice * self.chunk_size)
+    
+    def faltan(self):
+        """Índices de los trozos que todavía no se han recibido"""
+        return [i for i in range(self.total_chunks) if i not in self.recibidos]
+    
+    def rangos_recibidos(self):
+        """Agrupa los trozos recibidos en rangos de bytes [inicio, fin)"""
+        rangos = []
+        for indice in sorted(self.recibidos):
+            inicio = indice * self.chunk_size
+            fin = inicio + self.longitud_chunk(indice)
+            if rangos and rangos[-1][1] == inicio:
+                rangos[-1][1] = fin
+            else:
+                rangos.append([inicio, fin])
+        return rangos
+    
+    def guardar_estado(self):
+        """Persiste la sesión para poder reanudarla tras un reinicio del servidor"""
+        estado = {
+            'id': self.id,
+            'nombre': self.nombre,
+            'tamaño': self.tamaño,
+            'chunk_size': self.chunk_size,
+            'recibidos': sorted(self.recibidos),
+            'creada': self.creada,
+            'actualizada': self.actualizada
+        }
+        tmp_path = self.ruta_estado + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False)
+        os.replace(tmp_path, self.ruta_estado)
+    
+    def estado(self):
+        """Información de progreso que se devuelve al cliente"""
+        faltan = self.faltan()
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'tamaño': self.tamaño,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'recibidos': self.rangos_recibidos(),
+            'faltan': faltan,
+            'completa': not faltan
+        }
+
+# Sesiones activas en memoria (se cargan desde disco bajo demanda)
+sesiones = {}
+sesiones_lock = threading.Lock()
+
+def obtener_sesion(sesion_id):
+    """Devuelve la sesión de subida indicada o None si no existe"""
+    if not re.fullmatch(r'[0-9a-f]{32}', sesion_id):
+        return None
+    
+    with sesiones_lock:
+        sesion = sesiones.get(sesion_id)
+        if sesion is None:
+            try:
+                with open(os.path.join(SESIONES_DIR, sesion_id + '.json'), 'r', encoding='utf-8') as f:
+                    sesion = SesionSubida(**json.load(f))
+            except (OSError, ValueError, TypeError):
+                return None
+            if not os.path.exists(sesion.ruta_datos):
+                return None
+            sesiones[sesion_id] = sesion
+        return sesion
+
+def crear_sesion(nombre, tamaño, chunk_size):
+    """Crea una sesión de subida con su archivo de datos reservado (disperso)"""
+    limpiar_sesiones_caducadas()
+    
+    sesion = SesionSubida(uuid.uuid4().hex, nombre, tamaño, chunk_size)
+    with open(sesion.ruta_datos, 'wb') as f:
+        f.truncate(tamaño)
+    sesion.guardar_estado()
+    
+    with sesiones_lock:
+        sesiones[sesion.id] = sesion
+    return sesion
+
+def eliminar_sesion(sesion):
+    """Elimina el estado de una sesión y sus datos si aún existen"""
+    with sesiones_lock:
+        sesiones.pop(sesion.id, None)
+    eliminar_silencioso(sesion.ruta_estado)
+    eliminar_silencioso(sesion.ruta_datos)
+
+def limpiar_sesiones_caducadas():
+    """Elimina las sesiones sin actividad desde hace más de SESION_EXPIRACION"""
+    limite = time.time() - SESION_EXPIRACION
+    for entrada in os.scandir(SESIONES_DIR):
+        if not entrada.name.endswith('.json'):
+            continue
+        try:
+            if entrada.stat().st_mtime >= limite:
+                continue
+        except OSError:
+            continue
+        sesion_id = entrada.name[:-5]
+        with sesiones_lock:
+            sesiones.pop(sesion_id, None)
+        eliminar_silencioso(entrada.path)
+        eliminar_silencioso(os.path.join(SESIONES_DIR, sesion_id + '.part'))
+
+def escribir_chunk(sesion, indice, rfile):
+    """Escribe un trozo en su posición del archivo de la sesión leyendo rfile por bloques"""
+    offset = indice * sesion.chunk_size
+    longitud = sesion.longitud_chunk(indice)
+    
+    with sesion.lock:
+        # Si es justo el siguiente trozo del hash incremental, se hashea al vuelo
+        hashear = (sesion.hashers is not None and not sesion.hasheando
+                   and sesion.hash_offset == offset)
+        if hashear:
+            sesion.hasheando = True
+            hashers = {nombre: hasher.copy() for nombre, hasher in sesion.hashers.items()}
+        elif indice in sesion.recibidos and offset < sesion.hash_offset:
+            # Reescribir datos ya hasheados invalida el hash incremental
+            sesion.hashers = None
+    
+    completado = False
+    try:
+        with open(sesion.ruta_datos, 'r+b') as f:
+            f.seek(offset)
+            restante = longitud
+            while restante > 0:
+                bloque = rfile.read(min(UPLOAD_CHUNK_SIZE, restante))
+                if not bloque:
+                    raise ConnectionError('Conexión cerrada antes de completar el trozo')
+                f.write(bloque)
+                if hashear:
+                    for hasher in hashers.values():
+                        hasher.update(bloque)
+                restante -= len(bloque)
+        completado = True
+    finally:
+        with sesion.lock:
+            if hashear:
+                sesion.hasheando = False
+                if completado and sesion.hashers is not None:
+                    sesion.hashers = hashers
+                    sesion.hash_offset = offset + longitud
+            if completado:
+                sesion.recibidos.add(indice)
+                sesion.actualizada = time.time()
+                sesion.guardar_estado()
+
+def hashes_sesion(sesion):
+    """Completa el hash de la sesión leyendo solo la parte que no se hasheó al recibirla"""
+    with sesion.lock:
+        if sesion.hashers is not None and not sesion.hasheando:
+            hashers, desde = sesion.hashers, sesion.hash_offset
+        else:
+            hashers, desde = crear_hashers(), 0
+    
+    if desde < sesion.tamaño:
+        with open(sesion.ruta_datos, 'rb') as f:
+            f.seek(desde)
+            for bloque in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                for hasher in hashers.values():
+                    hasher.update(bloque)
+    
+    return {nombre: hasher.hexdigest() for nombre, hasher in hashers.items()}
+
+# ------------------ Feed de cambios ------------------
+# Consultas de /cambios esperando novedades en este momento
+esperas_cambios = threading.BoundedSemaphore(CAMBIOS_MAX_ESPERANDO)
+
+def describir_cambio(tipo, nombre, entrada):
+    """Un cambio del catálogo tal como se envía a los clientes"""
+    cambio = {'tipo': tipo, 'nombre': nombre}
+    if entrada is not None:
+        completar_entrada_listado(entrada)
+        cambio['archivo'] = entrada
+    return cambio
+
+# ------------------ Búsqueda ------------------
+ETIQUETA_RE = re.compile(r'<[^>]*>')
+PALABRA_RE = re.compile(r'\w+')
+
+def texto_campo(valor):
+    """Textos de un valor del catálogo (cadenas sueltas o dentro de listas y diccionarios)"""
+    if isinstance(valor, str):
+        yield valor
+    elif isinstance(valor, dict):
+        for v in valor.values():
+            yield from texto_campo(v)
+    elif isinstance(valor, (list, tuple)):
+        for v in valor:
+            yield from texto_campo(v)
+
+def texto_metadatos(entrada):
+    return '\n'.join(texto for campo in CAMPOS_BUSQUEDA for texto in texto_campo(entrada.get(campo)))
+
+def leer_texto(filepath, filename):
+    """Primeros BUSQUEDA_TEXTO_MAX bytes de una subida de texto, sin etiquetas si es marcado"""
+    with open(filepath, 'rb') as f:
+        datos = f.read(BUSQUEDA_TEXTO_MAX)
+    try:
+        texto = datos.decode('utf-8')
+    except UnicodeDecodeError:
+        # Cortado a media secuencia, o en otra codificación
+        texto = datos.decode('utf-8', 'ignore') if len(datos) == BUSQUEDA_TEXTO_MAX else datos.decode('latin-1')
+    if filename.lower().endswith(('.html', '.htm', '.xml', '.ovf')):
+        texto = ETIQUETA_RE.sub(' ', texto)
+    return texto
+
+def consulta_fts(texto):
+    """Expresión MATCH de FTS5 con las palabras de texto (todas obligatorias, la última como prefijo)"""
+    palabras = PALABRA_RE.findall(texto.lower())
+    if not palabras:
+        return None
+    # Entre comillas: lo que escriba el usuario nunca se interpreta como sintaxis de FTS5
+    return ' '.join(f'"{p}"' for p in palabras[:-1]) + f' "{palabras[-1]}"*'
+
+class IndiceBusqueda:
+    """Índice de texto completo (FTS5 de SQLite) del catálogo y del texto de las subidas
+    
+    Un hilo sigue el diario de cambios del catálogo (el mismo de /cambios) y reindexa
+    solo las entradas afectadas. Cada documento guarda una firma de lo indexado, así
+    que al arrancar solo se rehace lo que cambió con el servidor parado.
+    """
+    
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.disponible = True
+        self._lock = threading.Lock()
+        self._cerrando = False
+        try:
+            self._escritura = self._conectar()
+            with self._escritura:
+                self._escritura.executescript("""
+                    CREATE TABLE IF NOT EXISTS documentos (
+                        id INTEGER PRIMARY KEY,
+                        nombre TEXT NOT NULL UNIQUE,
+                        firma TEXT NOT NULL
+                    );
+                    CREATE VIRTUAL TABLE IF NOT EXISTS textos USING fts5(
+                        nombre, metadatos, contenido,
+                        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+                    );
+                """)
+                if self._escritura.execute('PRAGMA user_version').fetchone()[0] != VERSION_BUSQUEDA:
+                    self._escritura.execute('DELETE FROM documentos')
+                    self._escritura.execute('DELETE FROM textos')
+                    self._escritura.execute(f'PRAGMA user_version = {VERSION_BUSQUEDA}')
+                # Relevancia BM25 con el nombre pesando más que los metadatos y estos más que el contenido
+                self._escritura.execute("INSERT INTO textos (textos, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')")
+            # Las búsquedas usan su propia conexión: no esperan a que termine un lote de escritura
+            self._lectura = self._conectar()
+        except sqlite3.OperationalError as e:
+            # SQLite compilado sin FTS5
+            print(f"Búsqueda no disponible: {e}", file=sys.stderr)
+            self.disponible = False
+    
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        return conexion
+    
+    def iniciar(self):
+        if self.disponible:
+            threading.Thread(target=self._bucle, name='busqueda', daemon=True).start()
+    
+    def cerrar(self):
+        self._cerrando = True
+    
+    def _bucle(self):
+        version = None
+        while not self._cerrando:
+            try:
+                if version is None:
+                    # La versión se toma antes de listar: lo que cambie entretanto se reaplica
+                    version = indice.version
+                    self.sincronizar(indice.listar())
+                    continue
+                
+                nueva_version, cambios = indice.cambios_desde(version, CAMBIOS_ESPERA)
+                if cambios is None:
+                    # El diario ya no llega hasta nuestra versión: comparar todo
+                    version = None
+                    continue
+                self.eliminar([nombre for tipo, nombre, _ in cambios if tipo == 'eliminado'])
+                self.actualizar([entrada for tipo, _, entrada in cambios if tipo != 'eliminado'])
+                version = nueva_version
+            except Exception as e:
+                print(f"Error actualizando el índice de búsqueda: {e}", file=sys.stderr)
+                time.sleep(GUARDADO_RETARDO)
+    
+    def _documento(self, entrada):
+        """(firma, metadatos, identidad) de una entrada; el contenido no se lee aquí
+        
+        identidad es 'inodo:tamaño:mtime' si el archivo es de texto y existe (hay
+        contenido que indexar), o '' si no.
+        """
+        nombre = entrada['nombre']
+        metadatos = texto_metadatos(entrada)
+        identidad = ''
+        if nombre.lower().endswith(EXTENSIONES_TEXTO):
+            attrs = atributos.obtener(nombre)
+            if attrs is not None:
+                identidad = f'{attrs.inodo}:{attrs.tamaño}:{attrs.mtime}'
+        firma = hashlib.sha1(f'{nombre}\0{metadatos}\0{identidad}'.encode('utf-8')).hexdigest()
+        return firma, metadatos, identidad
+    
+    def actualizar(self, entradas):
+        """Reindexa las entradas cuya firma ha cambiado"""
+        for inicio in range(0, len(entradas), 500):
+            with self._escritura:
+                for entrada in entradas[inicio:inicio + 500]:
+                    self._actualizar_entrada(entrada)
+    
+    def _actualizar_entrada(self, entrada):
+        nombre = entrada['nombre']
+        firma, metadatos, identidad = self._documento(entrada)
+        fila = self._escritura.execute('SELECT id, firma FROM documentos WHERE nombre = ?', (nombre,)).fetchone()
+        if fila is not None and fila[1] == firma:
+            return
+        
+        contenido = ''
+        if identidad:
+            try:
+                contenido = leer_texto(os.path.join(UPLOAD_DIR, nombre), nombre)
+            except OSError:
+                pass
+        
+        # El nombre se indexa también partido en palabras (informe_final-2023 -> informe final 2023)
+        nombre_texto = ' '.join([nombre] + PALABRA_RE.findall(os.path.splitext(nombre)[0].replace('_', ' ')))
+        if fila is None:
+            id_documento = self._escritura.execute(
+                'INSERT INTO documentos (nombre, firma) VALUES (?, ?)', (nombre, firma)).lastrowid
+        else:
+            id_documento = fila[0]
+            self._escritura.execute('UPDATE documentos SET firma = ? WHERE id = ?', (firma, id_documento))
+            self._escritura.execute('DELETE FROM textos WHERE rowid = ?', (id_documento,))
+        self._escritura.execute(
+            'INSERT INTO textos (rowid, nombre, metadatos, contenido) VALUES (?, ?, ?, ?)',
+            (id_documento, nombre_texto, metadatos, contenido))
+    
+    def eliminar(self, nombres):
+        if not nombres:
+            return
+        with self._escritura:
+            for nombre in nombres:
+                fila = self._escritura.execute('SELECT id FROM documentos WHERE nombre = ?', (nombre,)).fetchone()
+                if fila is not None:
+                    self._escritura.execute('DELETE FROM textos WHERE rowid = ?', fila)
+                    self._escritura.execute('DELETE FROM documentos WHERE id = ?', fila)
+    
+    def sincronizar(self, entradas):
+        """Deja el índice igual que el catálogo: reindexa lo cambiado y quita lo que ya no está"""
+        self.actualizar(entradas)
+        actuales = {entrada['nombre'] for entrada in entradas}
+        sobrantes = [nombre for (nombre,) in self._escritura.execute('SELECT nombre FROM documentos')
+                     if nombre not in actuales]
+        self.eliminar(sobrantes)
+    
+    def buscar(self, texto, limite=BUSQUEDA_LIMITE):
+        """[(nombre, puntuación, fragmento)] ordenados por relevancia (BM25)"""
+        expresion = consulta_fts(texto)
+        if expresion is None:
+            return []
+        with self._lock:
+            # Ordenar por rank deja la ordenación a FTS5, y snippet solo se calcula
+            # para las filas devueltas
+            filas = self._lectura.execute("""
+                SELECT d.nombre, t.rank, t.fragmento
+                FROM (SELECT rowid, rank, snippet(textos, -1, '«', '»', '…', 12) AS fragmento
+                      FROM textos WHERE textos MATCH ? ORDER BY rank LIMIT ?) t
+                JOIN documentos d ON d.id = t.rowid
+                ORDER BY t.rank
+            """, (expresion, limite)).fetchall()
+        return [(nombre, round(-rango, 3), fragmento) for nombre, rango, fragmento in filas]
+
+busqueda = IndiceBusqueda(BUSQUEDA_DB)
+
+# ------------------ Handler ------------------
+class FileHandler(http.server.SimpleHTTPRequestHandler):
+    
+    # Un cliente parado no retiene su hilo indefinidamente
+    timeout = SOCKET_TIMEOUT
+    
+    def _send_response(self, data, status=200, content_type='application/json', etag=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        elif not isinstance(data, bytes):
+            data = json.dumps(data).encode('utf-8')
+        
+        codificacion = None
+        if len(data) >= COMPRESION_MIN_BYTES:
+            codificacion = elegir_codificacion(self.headers.get('Accept-Encoding'))
+            if codificacion:
+                data = comprimir(data, codificacion)
+        
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        if codificacion:
+            self.send_header('Content-Encoding', codificacion)
+        self.send_header('Vary', 'Accept-Encoding')
+        if etag:
+            # Se puede guardar pero hay que revalidarlo: la revalidación cuesta un 304
+            self.send_header('ETag', etag_codificado(etag, codificacion))
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _enviar_archivo(self, f, offset, count):
+        """Envía count bytes de f desde offset; usa sendfile del kernel si está disponible"""
+        self.wfile.flush()
+        if hasattr(os, 'sendfile') and type(self.connection) is socket.socket:
+            # Copia directa disco → socket sin pasar por Python
+            self.connection.sendfile(f, offset, count)
+            return
+        
+        # Alternativa: copia con un buffer grande reutilizado
+        f.seek(offset)
+        buffer = memoryview(bytearray(DOWNLOAD_BUFFER_SIZE))
+        restante = count
+        while restante > 0:
+            leidos = f.readinto(buffer[:min(restante, DOWNLOAD_BUFFER_SIZE)])
+            if not leidos:
+                break
+            self.wfile.write(buffer[:leidos])
+            restante -= leidos
+    
+    def _if_range_valido(self, last_modified, etag=None):
+        """Comprueba la precondición If-Range; si no coincide se ignora la cabecera Range
+        
+        Acepta una fecha o una ETag; la ETag se compara en modo fuerte (nunca W/).
+        """
+        if_range = self.headers.get('If-Range')
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            return etag is not None and if_range == etag
+        return if_range == last_modified
+    
+    def _no_modificado(self, etag, mtime=None):
+        """¿Permiten If-None-Match / If-Modified-Since responder 304?
+        
+        If-None-Match tiene preferencia; If-Modified-Since solo se mira sin él.
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag is not None and coincide_etag(if_none_match, etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is None or mtime is None:
+            return False
+        try:
+            desde = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        return int(mtime) <= desde
+    
+    def _responder_no_modificado(self, etag, last_modified=None):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+    
+    def _servir_descarga(self, filename, solo_cabeceras=False):
+        """Envía un archivo subido, respondiendo 206 a las peticiones Range"""
+        if not es_nombre_valido(filename):
+            self._send_response({'error': 'Ruta inválida'}, 400)
+            return
+            
+        filepath = os.path.join(UPLOAD_DIR, filename)
+        attrs = atributos.obtener(filename)
+        if attrs is None:
+            self._send_response({'error': 'Archivo no encontrado'}, 404)
+            return
+        
+        try:
+            f = open(filepath, 'rb')
+        except FileNotFoundError:
+            self._send_response({'error': 'Archivo no encontrado'}, 404)
+            return
+        
+        with f:
+            mime_type = obtener_tipo_mime(filename)
+            last_modified = self.date_time_string(attrs.mtime)
+            etag = etag_archivo(attrs)
+            if self._no_modificado(etag, attrs.mtime):
+                self._responder_no_modificado(etag, last_modified)
+                return
+            
+            if not es_comprimible(filename):
+                self._enviar_tramo(f, 0, attrs.tamaño, mime_type, filename, last_modified, solo_cabeceras,
+                                   etag=etag)
+                return
+            
+            # Texto: si el cliente lo acepta se envía la variante comprimida (las peticiones
+            # Range se atienden siempre sobre el archivo sin comprimir)
+            variante = self._variante_descarga(filename, attrs, solo_cabeceras)
+            if variante is None:
+                self._enviar_tramo(f, 0, attrs.tamaño, mime_type, filename, last_modified,
+                                   solo_cabeceras, vary=True, etag=etag)
+                return
+        
+        codificacion, f = variante
+        with f:
+            self._enviar_tramo(f, 0, os.fstat(f.fileno()).st_size, mime_type, filename, last_modified,
+                               solo_cabeceras, codificacion=codificacion, vary=True,
+                               etag=etag_codificado(etag, codificacion))
+    
+    def _variante_descarga(self, filename, attrs, solo_cabeceras=False):
+        """(codificación, archivo abierto) de la variante comprimida a enviar, o None
+        
+        Si la variante aún no existe se encarga a cola_variantes (nunca desde un HEAD)
+        y esta respuesta va sin comprimir: la petición no espera ni al hash ni a la compresión.
+        """
+        if self.headers.get('Range') or not COMPRESION_MIN_BYTES <= attrs.tamaño <= VARIANTES_MAX_BYTES:
+            return None
+        codificacion = elegir_codificacion(self.headers.get('Accept-Encoding'))
+        if codificacion is None:
+            return None
+        
+        # El hash lo calcula el análisis en segundo plano encargado al subir
+        hash_sha256 = analisis.hash_conocido(attrs)
+        if not hash_sha256:
+            return None
+        try:
+            f = open(ruta_variante(hash_sha256, codificacion), 'rb')
+        except FileNotFoundError:
+            if not solo_cabeceras:
+                cola_variantes.encargar(os.path.join(UPLOAD_DIR, filename), hash_sha256, codificacion)
+            return None
+        except OSError as e:
+            print(f"No se pudo abrir la variante de {filename}: {e}", file=sys.stderr)
+            return None
+        # Contenido que no se reduce (ya comprimido o aleatorio): mejor enviarlo tal cual
+        if os.fstat(f.fileno()).st_size >= attrs.tamaño:
+            f.close()
+            return None
+        return codificacion, f
+    
+    def _enviar_tramo(self, f, base, file_size, mime_type, nombre, last_modified, solo_cabeceras=False,
+                      codificacion=None, vary=False, etag=None):
+        """Envía file_size bytes de f desde base como un archivo descargable, con soporte de Range
+        
+        Con codificacion, f es la variante comprimida y se envía entera (sin Range).
+        """
+        rangos = None
+        cabecera_range = self.headers.get('Range')
+        if cabecera_range and not codificacion and self._if_range_valido(last_modified, etag):
+            rangos = parsear_rangos(cabecera_range, file_size)
+        
+        if rangos == []:
+            self.send_response(416)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Content-Range', f'bytes */{file_size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        # Un rango: el cuerpo es el fragmento; varios: multipart/byteranges
+        partes = []
+        if not rangos:
+            self.send_response(200)
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Content-Length', str(file_size))
+        elif len(rangos) == 1:
+            inicio, fin = rangos[0]
+            self.send_response(206)
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Content-Range', f'bytes {inicio}-{fin}/{file_size}')
+            self.send_header('Content-Length', str(fin - inicio + 1))
+        else:
+            boundary = uuid.uuid4().hex
+            for inicio, fin in rangos:
+                cabecera = (f'\r\n--{boundary}\r\n'
+                            f'Content-Type: {mime_type}\r\n'
+                            f'Content-Range: bytes {inicio}-{fin}/{file_size}\r\n\r\n').encode('latin-1')
+                partes.append((cabecera, inicio, fin))
+            cierre = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+            longitud = sum(len(cabecera) + fin - inicio + 1 for cabecera, inicio, fin in partes) + len(cierre)
+            self.send_response(206)
+            self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+            self.send_header('Content-Length', str(longitud))
+        
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'Content-Range, Accept-Ranges, Content-Length, ETag')
+        self.send_header('Content-Disposition', disposicion_adjunto(nombre))
+        # Los rangos se cuentan sobre el archivo sin comprimir: no se anuncian para la variante,
+        # o un cliente que reanude sin If-Range mezclaría bytes comprimidos y sin comprimir
+        self.send_header('Accept-Ranges', 'none' if codificacion else 'bytes')
+        self.send_header('Last-Modified', last_modified)
+        if codificacion:
+            self.send_header('Content-Encoding', codificacion)
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        if etag:
+            self.send_header('ETag', etag)
+        
+        # Cache headers para archivos grandes
+        if file_size > 100 * 1024 * 1024:  # > 100MB
+            self.send_header('Cache-Control', 'public, max-age=3600')
+        
+        self.end_headers()
+        if solo_cabeceras:
+            return
+        
+        # Enviar archivo
+        if not rangos:
+            self._enviar_archivo(f, base, file_size)
+        elif not partes:
+            inicio, fin = rangos[0]
+            self._enviar_archivo(f, base + inicio, fin - inicio + 1)
+        else:
+            for cabecera, inicio, fin in partes:
+                self.wfile.write(cabecera)
+                self._enviar_archivo(f, base + inicio, fin - inicio + 1)
+            self.wfile.write(cierre)
+    
+    def _servir_cambios(self):
+        """GET /cambios[?desde=&arranque=&espera=]: cambios del catálogo posteriores a una versión
+        
+        Sin desde solo devuelve la versión actual, con la que el cliente carga /files y
+        empieza a pedir cambios. Con desde espera (long-poll) hasta que haya alguno o pasen
+        espera segundos. reiniciar indica que hay que recargar /files entero.
+        """
+        params = parse_qs(urlsplit(self.path).query)
+        try:
+            desde = int(params['desde'][0]) if 'desde' in params else None
+            espera = min(max(float(params.get('espera', [CAMBIOS_ESPERA])[0]), 0), CAMBIOS_ESPERA_MAX)
+        except ValueError:
+            self._send_response({'error': 'Parámetros inválidos', 'detalle': 'desde y espera deben ser números'}, 400)
+            return
+        
+        respuesta = {'arranque': ARRANQUE}
+        if desde is None or params.get('arranque', [ARRANQUE])[0] != ARRANQUE:
+            # Primera consulta, o el cliente venía de otra ejecución del servidor
+            respuesta.update(version=indice.version, cambios=[], reiniciar=desde is not None)
+            self._send_response(respuesta)
+            return
+        
+        # Cada espera ocupa un hilo: si ya hay demasiadas se contesta sin esperar
+        esperando = espera > 0 and esperas_cambios.acquire(blocking=False)
+        try:
+            version, cambios = indice.cambios_desde(desde, espera if esperando else 0)
+        finally:
+            if esperando:
+                esperas_cambios.release()
+        
+        respuesta['version'] = version
+        respuesta['reiniciar'] = cambios is None
+        respuesta['cambios'] = [describir_cambio(*cambio) for cambio in cambios or []]
+        if espera > 0 and not esperando:
+            respuesta['reintentar'] = CAMBIOS_ESPERA / 5
+        self._send_response(respuesta)
+    
+    def _buscar(self):
+        """GET /search?q=&limit=: archivos que contienen todas las palabras, por relevancia"""
+        if not busqueda.disponible:
+            self._send_response({'error': 'Búsqueda no disponible (SQLite sin FTS5)'}, 503)
+            return
+        
+        params = parse_qs(urlsplit(self.path).query)
+        consulta = params.get('q', [''])[0]
+        try:
+            limite = min(max(int(params.get('limit', [BUSQUEDA_LIMITE])[0]), 1), BUSQUEDA_LIMITE_MAX)
+        except ValueError:
+            self._send_response({'error': 'Parámetros inválidos', 'detalle': 'limit debe ser un número'}, 400)
+            return
+        
+        inicio = time.perf_counter()
+        resultados = []
+        for nombre, puntuacion, fragmento in busqueda.buscar(consulta, limite):
+            entrada = indice.obtener(nombre)
+            if entrada is None:
+                # Borrado hace un instante: el índice aún no se ha enterado
+                continue
+            completar_entrada_listado(entrada)
+            resultados.append({'nombre': nombre, 'puntuacion': puntuacion, 'fragmento': fragmento,
+                               'archivo': entrada})
+        
+        self._send_response({
+            'consulta': consulta,
+            'resultados': resultados,
+            'limit': limite,
+            'tiempo_ms': round((time.perf_counter() - inicio) * 1000, 2)
+        })
+    
+    def _servir_estatico(self):
+        """Archivos estáticos (HTML, CSS, JS): desde memoria los de la raíz de BASE_DIR"""
+        ruta = unquote(urlsplit(self.path).path)
+        if ruta == '/':
+            ruta = '/index.html'
+        nombre = ruta.lstrip('/')
+        
+        estatico = None
+        if nombre and '/' not in nombre and nombre not in ('.', '..'):
+            estatico = estaticos.obtener(nombre)
+        
+        if estatico is not None:
+            if self._no_modificado(estatico.etag, estatico.version[0] / 1e9):
+                self._responder_no_modificado(estatico.etag)
+                return
+            
+            datos, codificacion = estatico.datos, None
+            if len(datos) >= COMPRESION_MIN_BYTES and es_comprimible(nombre):
+                codificacion = elegir_codificacion(self.headers.get('Accept-Encoding'))
+                if codificacion:
+                    datos = estaticos.variante(estatico, codificacion)
+            
+            self.send_response(200)
+            for cabecera, valor in estatico.cabeceras:
+                self.send_header(cabecera, valor)
+            self.send_header('Content-Length', str(len(datos)))
+            self.send_header('ETag', etag_codificado(estatico.etag, codificacion))
+            if codificacion:
+                self.send_header('Content-Encoding', codificacion)
+            self.end_headers()
+            self.wfile.write(datos)
+            return
+        
+        # Permitir solo archivos dentro del directorio base
+        filepath = os.path.normpath(os.path.join(BASE_DIR, nombre))
+        if not filepath.startswith(BASE_DIR + os.sep) or not os.path.isfile(filepath):
+            self._send_response({'error': 'Archivo no encontrado'}, 404)
+            return
+        
+        # Determinar tipo de contenido usando mimetypes
+        mime_type, _ = mimetypes.guess_type(filepath)
+        if not mime_type:
+            mime_type = 'text/plain'
+        
+        with open(filepath, 'rb') as f:
+            tamaño = os.fstat(f.fileno()).st_size
+            self.send_response(200)
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Content-Length', str(tamaño))
+            self.end_headers()
+            self._enviar_archivo(f, 0, tamaño)
+    
+    def _servir_contenido(self, solo_cabeceras=False):
+        """GET /contenido/<archivo>[?prefijo=&cursor=&limit=] lista sus miembros;
+        GET /contenido/<archivo>/<ruta> descarga uno solo"""
+        partes = urlsplit(self.path)
+        filename, _, ruta = partes.path[len('/contenido/'):].partition('/')
+        filename, ruta = unquote(filename), unquote(ruta)
+        if not es_nombre_valido(filename):
+            self._send_response({'error': 'Ruta inválida'}, 400)
+            return
+        
+        attrs = atributos.obtener(filename)
+        if attrs is None:
+            self._send_response({'error': 'Archivo no encontrado'}, 404)
+            return
+        if not es_navegable(filename):
+            self._send_response({'error': 'El contenido de este tipo de archivo no se puede explorar'}, 400)
+            return
+        
+        # El índice de miembros se construye al analizar (normalmente ya hecho al subirlo)
+        datos = analisis.analizar(filename, attrs)
+        if 'members' not in datos:
+            self._send_response({
+                'error': 'No se pudo leer el contenido del archivo',
+                'detalle': datos.get('members_error') or datos.get('analysis_error')
+            }, 422)
+            return
+        
+        if not ruta:
+            params = parse_qs(partes.query)
+            try:
+                limite = min(max(int(params.get('limit', [CONTENIDO_LIMITE])[0]), 1), CONTENIDO_LIMITE_MAX)
+            except ValueError:
+                self._send_response({'error': 'Parámetros inválidos', 'detalle': 'limit debe ser un número'}, 400)
+                return
+            prefijo = params.get('prefijo', [''])[0]
+            cursor = params.get('cursor', [None])[0] or None
+            miembros = analisis.listar_miembros(filename, attrs, prefijo, cursor, limite)
+            self._send_response({
+                'archivo': filename,
+                'miembros': [{'ruta': m.ruta, 'tamaño': m.tamaño, 'comprimido': m.comprimido, 'metodo': m.metodo}
+                             for m in miembros],
+                'siguiente': miembros[-1].ruta if len(miembros) == limite else None,
+                'total': datos['members'],
+                'truncado': datos.get('members_truncated', False),
+                'limit': limite
+            })
+            return
+        
+        miembro = analisis.miembro(filename, attrs, ruta)
+        if miembro is None:
+            self._send_response({'error': 'Miembro no encontrado'}, 404)
+            return
+        
+        try:
+            f = open(os.path.join(UPLOAD_DIR, filename), 'rb')
+        except FileNotFoundError:
+            self._send_response({'error': 'Archivo no encontrado'}, 404)
+            return
+        with f:
+            # Las posiciones del índice son de esta versión del archivo
+            st = os.fstat(f.fileno())
+            if (st.st_ino, st.st_size) != (attrs.inodo, attrs.tamaño):
+                self._send_response({'error': 'El archivo ha cambiado, vuelve a intentarlo'}, 409)
+                return
+            
+            mime_type = mimetypes.guess_type(miembro.ruta)[0] or 'application/octet-stream'
+            nombre = miembro.ruta.rsplit('/', 1)[-1]
+            last_modified = self.date_time_string(attrs.mtime)
+            if miembro.metodo == 'directo':
+                # Guardado sin comprimir: se lee solo su tramo del archivo (y admite Range)
+                self._enviar_tramo(f, miembro.offset, miembro.tamaño, mime_type, nombre,
+                                   last_modified, solo_cabeceras)
+                return
+            
+            self.send_response(200)
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Content-Length', str(miembro.tamaño))
+            self.send_header('Content-Disposition', disposicion_adjunto(nombre))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Accept-Ranges', 'none')
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            if solo_cabeceras:
+                return
+            for bloque in leer_miembro(f, miembro):
+                self.wfile.write(bloque)
+    
+    # GET: /files, /uploads/*, /file-info/*, archivos estáticos
+    def do_GET(self):
+        try:
+            # Listar archivos (con parámetros: paginado, filtrado y ordenado)
+            if self.path == '/files' or self.path.startswith('/files?'):
+                # Sin cambios en el catálogo ni en el directorio basta un 304
+                etag = etag_catalogo()
+                if self._no_modificado(etag):
+                    self._responder_no_modificado(etag)
                     return
                 
-                post_data = self.rfile.read(content_length)
+                query = urlsplit(self.path).query
+                if query:
+                    self._listar_pagina(parse_qs(query), etag)
+                    return
                 
-                # Parsear multipart manualmente
-                boundary = None
-                for part in content_type.split(';'):
-                    part = part.strip()
-                    if part.startswith('boundary='):
-                        boundary = '--' + part[9:]
-                        break
+                metadata = indice.listar()
                 
-                if not boundary:
-                    self._send_response({'error': 'Boundary no encontrado'}, 400)
-                    return
+                # Añadir información adicional para cada archivo
+                for item in metadata:
+                    completar_entrada_listado(item)
                 
-                # Dividir por boundary
-                parts = post_data.split(boundary.encode())
-                filename = None
-                file_data = None
-                
-                for part in parts:
-                    if b'filename="' in part:
-                        # Extraer nombre
-                        start = part.find(b'filename="') + 10
-                        end = part.find(b'"', start)
-                        filename = part[start:end].decode('utf-8')
-                        
-                        # Extraer datos
-                        header_end = part.find(b'\r\n\r\n')
-                        if header_end != -1:
-                            file_data = part[header_end+4:]
-                            # Limpiar CRLF final
-                            if file_data.endswith(b'\r\n'):
-                                file_data = file_data[:-2]
-                            break
+                self._send_response(metadata, etag=etag)
+                return
+            
+            # Información detallada de un archivo
+            elif self.path.startswith('/file-info/'):
+                filename = unquote(self.path[11:])
+                if not es_nombre_valido(filename):
+                    self._send_response({'error': 'Ruta inválida'}, 400)
+                    return
                 
-                if not filename or not file_data:
-                    self._send_response({'error': 'No se encontró archivo'}, 400)
+                attrs = atributos.obtener(filename)
+                if attrs is None:
+                    self._send_response({'error': 'Archivo no encontrado'}, 404)
                     return
                 
-                # Verificar extensión permitida
-                if not es_extension_permitida(filename):
-                    extensiones_permitidas = ', '.join(sorted(ALLOWED_EXTENSIONS.keys()))
-                    self._send_response({
-                        'error': f'Tipo de archivo no permitido',
-                        'detalle': f'Extensiones permitidas: {extensiones_permitidas}'
-                    }, 400)
+                etag = etag_info(attrs)
+                if self._no_modificado(etag):
+                    self._responder_no_modificado(etag)
                     return
                 
-                # Verificar tamaño según tipo de archivo
+                # Obtener metadatos del archivo
+                file_size = attrs.tamaño
                 _, ext = os.path.splitext(filename.lower())
-                max_size = MAX_FILE_SIZES.get(ext, MAX_FILE_SIZES['default'])
-                
-                if len(file_data) > max_size:
-                    max_mb = max_size / (1024 * 1024)
-                    if max_size > 1024 * 1024 * 1024:
-                        max_gb = max_size / (1024 * 1024 * 1024)
-                        self._send_response({
-                            'error': f'Archivo demasiado grande para tipo {ext}',
-                            'detalle': f'Máximo permitido: {max_gb:.1f} GB'
-                        }, 400)
-                    else:
-                        self._send_response({
-                            'error': f'Archivo demasiado grande para tipo {ext}',
-                            'detalle': f'Máximo permitido: {max_mb:.0f} MB'
-                        }, 400)
+                
+                metadata = {
+                    'filename': filename,
+                    'size': file_size,
+                    'size_mb': round(file_size / (1024 * 1024), 2),
+                    'size_gb': round(file_size / (1024 * 1024 * 1024), 2),
+                    'extension': ext,
+                    'type': obtener_tipo_archivo(ext),
+                    'upload_date': datetime.fromtimestamp(attrs.ctime).isoformat(),
+                    'last_modified': datetime.fromtimestamp(attrs.mtime).isoformat()
+                }
+                
+                # Hash y metadatos específicos según tipo (desde la caché si el archivo no ha cambiado)
+                metadata.update(analisis.analizar(filename, attrs))
+                
+                # Un análisis fallido puede ser pasajero: no se deja revalidar
+                self._send_response(metadata, etag=None if 'analysis_error' in metadata else etag)
+                return
+                
+            # Búsqueda de texto completo
+            elif self.path == '/search' or self.path.startswith('/search?'):
+                self._buscar()
+                return
+            
+            # Cambios del catálogo (long-poll) para mantener los listados al día
+            elif self.path == '/cambios' or self.path.startswith('/cambios?'):
+                self._servir_cambios()
+                return
+            
+            # Estado de los análisis en segundo plano
+            elif self.path == '/analisis':
+                self._send_response({'trabajos': cola_analisis.activos()})
+                return
+            
+            elif self.path.startswith('/analisis/'):
+                trabajo = cola_analisis.obtener(self.path[10:])
+                if trabajo is None:
+                    self._send_response({'error': 'Trabajo no encontrado'}, 404)
+                    return
+                self._send_response(trabajo)
+                return
+            
+            # Progreso de una subida por trozos
+            elif self.path.startswith('/upload/sesion/'):
+                ruta = self._ruta_sesion()
+                sesion = obtener_sesion(ruta[0]) if len(ruta) == 1 else None
+                if sesion is None:
+                    self._send_response({'error': 'Sesión no encontrada'}, 404)
                     return
                 
-                # Evitar duplicados
-                base_name, ext = os.path.splitext(filename)
-                counter = 1
-                original_filename = filename
-                while os.path.exists(os.path.join(UPLOAD_DIR, filename)):
-                    filename = f"{base_name}_{counter}{ext}"
-                    counter += 1
+                with sesion.lock:
+                    self._send_response(sesion.estado())
+                return
+            
+            # Descargar archivo (completo o por rangos)
+            elif self.path.startswith('/uploads/'):
+                self._servir_descarga(unquote(self.path[9:]))
+                return
+            
+            # Explorar un archivo comprimido o una imagen y descargar miembros sueltos
+            elif self.path.startswith('/contenido/'):
+                self._servir_contenido()
+                return
                 
-                if original_filename != filename:
-                    print(f"⚠️  Archivo renombrado: {original_filename} → {filename}")
+            else:
+                self._servir_estatico()
+                    
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            # El cliente cortó la descarga: no hay a quién responder
+            self.close_connection = True
+        except Exception as e:
+            print(f"Error en GET: {e}", file=sys.stderr)
+            self._send_response({'error': str(e)}, 500)
+    
+    def _listar_pagina(self, params, etag=None):
+        """GET /files?limit=&cursor=&orden=&tipo=&categoria=&extension=&tamaño_min=&tamaño_max=&desde=&hasta="""
+        def valor(nombre, defecto=None):
+            return params[nombre][0] if nombre in params else defecto
+        
+        def numero(nombre):
+            texto = valor(nombre)
+            return float(texto) if texto not in (None, '') else None
+        
+        def fecha(nombre):
+            texto = valor(nombre)
+            if texto in (None, ''):
+                return None
+            try:
+                return float(texto)
+            except ValueError:
+                return datetime.fromisoformat(texto).timestamp()
+        
+        try:
+            limite = min(max(int(valor('limit', FILES_LIMITE)), 1), FILES_LIMITE_MAX)
+            
+            # orden=fecha, orden=-tamaño (descendente)...
+            orden = valor('orden', 'fecha')
+            descendente = orden.startswith('-')
+            orden = orden.lstrip('-')
+            if orden not in CAMPOS_ORDEN:
+                raise ValueError(f'Orden no soportado: {orden}')
+            
+            # Filtros de igualdad; varios valores separados por comas o repitiendo el parámetro
+            filtros = {}
+            for campo in CAMPOS_FILTRO:
+                if campo in params:
+                    valores = [v.strip() for texto in params[campo] for v in texto.split(',') if v.strip()]
+                    if campo == 'extension':
+                        valores = ['.' + v.lower().lstrip('.') for v in valores]
+                    filtros[campo] = valores
+            
+            rangos = {
+                'tamaño': (numero('tamaño_min'), numero('tamaño_max')),
+                'fecha': (fecha('desde'), fecha('hasta'))
+            }
+            
+            cursor = None
+            if valor('cursor'):
+                cursor = decodificar_cursor(valor('cursor'))
+                tipo_clave = str if orden == 'nombre' else (int, float)
+                if not isinstance(cursor[0], tipo_clave) or not isinstance(cursor[1], str):
+                    raise ValueError('Cursor inválido')
+        except ValueError as e:
+            self._send_response({'error': 'Parámetros inválidos', 'detalle': str(e)}, 400)
+            return
+        
+        items, siguiente, total = indice.consultar(filtros, rangos, orden, descendente, limite, cursor)
+        
+        # Solo se consulta el disco para los elementos de la página
+        for item in items:
+            completar_entrada_listado(item)
+        
+        self._send_response({
+            'archivos': items,
+            'siguiente': siguiente,
+            'total': total,
+            'limit': limite
+        }, etag=etag)
+    
+    def _leer_json(self):
+        """Lee y decodifica el cuerpo JSON de la petición; None si viene vacío"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length == 0:
+            return None
+        return json.loads(self.rfile.read(content_length).decode('utf-8'))
+    
+    def _ruta_sesion(self):
+        """Divide una ruta /upload/sesion/<id>/... en sus segmentos tras 'sesion'"""
+        ruta = self.path[len('/upload/sesion'):].strip('/')
+        return ruta.split('/') if ruta else []
+    
+    def _recibir_lote(self):
+        """Recibe muchos archivos en una petición (multipart o tar) y los cataloga de una vez"""
+        content_type = self.headers.get('Content-Type', '')
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length == 0:
+            self._send_response({'error': 'No se recibió archivo'}, 400)
+            return
+        if content_length > MAX_UPLOAD_SIZE:
+            max_gb = MAX_UPLOAD_SIZE / (1024 * 1024 * 1024)
+            self._send_response({
+                'error': 'Lote demasiado grande',
+                'detalle': f'Máximo permitido: {max_gb:.1f} GB'
+            }, 400)
+            return
+        
+        if 'multipart/form-data' in content_type:
+            boundary = obtener_boundary(content_type)
+            if not boundary:
+                self._send_response({'error': 'Boundary no encontrado'}, 400)
+                return
+            lector = LectorLimitado(self.rfile, content_length)
+            archivos = recibir_lote_multipart(LectorMultipart(lector, boundary, content_length))
+        elif content_type.split(';')[0].strip() in ('application/x-tar', 'application/gzip', 'application/x-gzip'):
+            lector = LectorLimitado(self.rfile, content_length)
+            archivos = recibir_lote_tar(lector)
+        else:
+            self._send_response({'error': 'Formato inválido',
+                                 'detalle': 'Se espera multipart/form-data o un tar'}, 400)
+            return
+        
+        recibidos = []
+        errores = []
+        try:
+            for nombre, resultado in archivos:
+                if isinstance(resultado, dict):
+                    errores.append(dict(resultado, nombre=nombre))
+                    continue
+                tmp_path, file_size, hashes = resultado
+                if file_size == 0:
+                    eliminar_silencioso(tmp_path)
+                    errores.append({'nombre': nombre, 'error': 'Archivo vacío'})
+                    continue
+                recibidos.append((tmp_path, nombre, file_size, hashes))
+                if len(recibidos) > LOTE_MAX_ARCHIVOS:
+                    raise MultipartError(f'Máximo {LOTE_MAX_ARCHIVOS} archivos por lote')
+            lector.descartar()
+        except BaseException as e:
+            # Ningún archivo del lote entra si el cuerpo no llega completo
+            for tmp_path, *_ in recibidos:
+                eliminar_silencioso(tmp_path)
+            if not isinstance(e, (MultipartError, tarfile.TarError, EOFError)):
+                raise
+            self.close_connection = True
+            self._send_response({'error': 'Formato inválido', 'detalle': str(e)}, 400)
+            return
+        
+        # Todas las entradas entran juntas en el catálogo
+        subidos = registrar_subidas(recibidos)
+        self._send_response({
+            'mensaje': f'{len(subidos)} archivos subidos',
+            'subidos': subidos,
+            'errores': errores
+        }, 200 if subidos or not errores else 400)
+    
+    def _comprobar_hashes(self):
+        """POST /upload/comprobar: indica qué contenidos ya están guardados en el servidor"""
+        try:
+            data = self._leer_json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._send_response({'error': 'JSON inválido'}, 400)
+            return
+        
+        archivos = data.get('archivos') if isinstance(data, dict) else None
+        if not isinstance(archivos, list) or not all(isinstance(a, dict) for a in archivos):
+            self._send_response({'error': 'Se espera una lista "archivos" con hash_sha256 y tamaño'}, 400)
+            return
+        if len(archivos) > COMPROBAR_MAX_HASHES:
+            self._send_response({'error': f'Máximo {COMPROBAR_MAX_HASHES} hashes por consulta'}, 400)
+            return
+        
+        resultados = []
+        for archivo in archivos:
+            hash_sha256 = str(archivo.get('hash_sha256', '')).lower()
+            tamaño = archivo.get('tamaño')
+            existe = isinstance(tamaño, int) and buscar_objeto(hash_sha256, tamaño) is not None
+            resultados.append({'hash_sha256': hash_sha256, 'tamaño': tamaño, 'existe': existe})
+        self._send_response({'resultados': resultados})
+    
+    def _crear_desde_hash(self):
+        """POST /upload/referencia: crea una entrada nueva con un contenido que ya está guardado"""
+        try:
+            data = self._leer_json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._send_response({'error': 'JSON inválido'}, 400)
+            return
+        
+        if not isinstance(data, dict) or not all(k in data for k in ('nombre', 'hash_sha256', 'tamaño')):
+            self._send_response({'error': 'Faltan nombre, hash_sha256 o tamaño'}, 400)
+            return
+        
+        file_size = data['tamaño']
+        if not isinstance(file_size, int) or file_size <= 0:
+            self._send_response({'error': 'Tamaño inválido'}, 400)
+            return
+        filename, max_size = validar_archivo_lote(str(data['nombre']), file_size)
+        if filename is None:
+            self._send_response(max_size, 400)
+            return
+        
+        # Un enlace temporal al objeto: si se borra mientras tanto, el contenido sigue disponible
+        hash_sha256 = str(data['hash_sha256']).lower()
+        objeto = buscar_objeto(hash_sha256, file_size)
+        tmp_path = os.path.join(UPLOAD_DIR, f'.subida_{uuid.uuid4().hex}.part')
+        try:
+            if objeto is None:
+                raise FileNotFoundError(hash_sha256)
+            os.link(objeto, tmp_path)
+        except FileNotFoundError:
+            self._send_response({'error': 'Contenido no encontrado', 'hash_sha256': hash_sha256}, 404)
+            return
+        
+        try:
+            self._send_response(registrar_subida(tmp_path, filename, file_size, {'sha256': hash_sha256}))
+        except BaseException:
+            eliminar_silencioso(tmp_path)
+            raise
+    
+    def _crear_sesion_subida(self):
+        """POST /upload/sesion: inicia una subida por trozos"""
+        try:
+            data = self._leer_json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._send_response({'error': 'JSON inválido'}, 400)
+            return
+        
+        if not isinstance(data, dict) or 'nombre' not in data or 'tamaño' not in data:
+            self._send_response({'error': 'Faltan nombre o tamaño'}, 400)
+            return
+        
+        filename = os.path.basename(str(data['nombre']).replace('\\', '/'))
+        try:
+            file_size = int(data['tamaño'])
+            chunk_size = int(data.get('chunk_size', SESION_CHUNK_SIZE))
+        except (TypeError, ValueError):
+            self._send_response({'error': 'Tamaño inválido'}, 400)
+            return
+        
+        if not es_extension_permitida(filename):
+            self._send_response(error_extension_no_permitida(), 400)
+            return
+        
+        if file_size <= 0:
+            self._send_response({'error': 'No se encontró archivo'}, 400)
+            return
+        
+        # Las mismas comprobaciones de tamaño que una subida normal, antes de recibir nada
+        _, ext = os.path.splitext(filename.lower())
+        max_size = min(MAX_FILE_SIZES.get(ext, MAX_FILE_SIZES['default']), MAX_UPLOAD_SIZE)
+        if file_size > max_size:
+            self._send_response(error_tamaño_maximo(ext, max_size), 400)
+            return
+        
+        chunk_size = min(max(chunk_size, SESION_CHUNK_MIN), SESION_CHUNK_MAX)
+        sesion = crear_sesion(filename, file_size, chunk_size)
+        with sesion.lock:
+            self._send_response(sesion.estado())
+    
+    def _recibir_chunk(self, sesion_id, indice):
+        """PUT /upload/sesion/<id>/<n>: recibe un trozo; reenviarlo es seguro"""
+        sesion = obtener_sesion(sesion_id)
+        if sesion is None:
+            self._send_response({'error': 'Sesión no encontrada'}, 404)
+            return
+        
+        if not indice.isdigit() or int(indice) >= sesion.total_chunks:
+            self._send_response({'error': 'Trozo inválido'}, 400)
+            return
+        indice = int(indice)
+        
+        if sesion.finalizando:
+            self._send_response({'error': 'La sesión se está finalizando'}, 409)
+            return
+        
+        longitud = sesion.longitud_chunk(indice)
+        if int(self.headers.get('Content-Length', 0)) != longitud:
+            self.close_connection = True
+            self._send_response({
+                'error': 'Tamaño de trozo incorrecto',
+                'detalle': f'Se esperaban {longitud} bytes'
+            }, 400)
+            return
+        
+        escribir_chunk(sesion, indice, self.rfile)
+        
+        with sesion.lock:
+            recibidos = len(sesion.recibidos)
+        self._send_response({
+            'id': sesion.id,
+            'chunk': indice,
+            'recibidos': recibidos,
+            'total_chunks': sesion.total_chunks,
+            'completa': recibidos == sesion.total_chunks
+        })
+    
+    def _finalizar_sesion_subida(self, sesion_id):
+        """POST /upload/sesion/<id>/finalizar: ensambla el archivo y lo registra"""
+        sesion = obtener_sesion(sesion_id)
+        if sesion is None:
+            self._send_response({'error': 'Sesión no encontrada'}, 404)
+            return
+        
+        with sesion.lock:
+            faltan = sesion.faltan()
+            en_curso = sesion.finalizando
+            if not faltan and not en_curso:
+                sesion.finalizando = True
+        
+        if faltan:
+            self._send_response({'error': 'Faltan trozos por subir', 'faltan': faltan}, 409)
+            return
+        if en_curso:
+            self._send_response({'error': 'La sesión se está finalizando'}, 409)
+            return
+        
+        # El archivo de datos ya está completo: pasa por el mismo registro que /upload
+        try:
+            hashes = hashes_sesion(sesion)
+            response_data = registrar_subida(sesion.ruta_datos, sesion.nombre, sesion.tamaño, hashes)
+        except:
+            sesion.finalizando = False
+            raise
+        
+        eliminar_sesion(sesion)
+        self._send_response(response_data)
+    
+    # HEAD: /uploads/* (tamaño y soporte de rangos para gestores de descargas)
+    def do_HEAD(self):
+        if self.path.startswith('/uploads/'):
+            try:
+                self._servir_descarga(unquote(self.path[9:]), solo_cabeceras=True)
+            except Exception as e:
+                print(f"Error en HEAD: {e}", file=sys.stderr)
+                self._send_response({'error': str(e)}, 500)
+            return
+        
+        if self.path.startswith('/contenido/'):
+            try:
+                self._servir_contenido(solo_cabeceras=True)
+            except Exception as e:
+                print(f"Error en HEAD: {e}", file=sys.stderr)
+                self._send_response({'error': str(e)}, 500)
+            return
+        
+        super().do_HEAD()
+    
+    # POST: /upload
+    def do_POST(self):
+        if self.path == '/upload':
+            try:
+                content_type = self.headers.get('Content-Type', '')
                 
-                # Guardar archivo
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                with open(filepath, 'wb') as f:
-                    f.write(file_data)
+                if 'multipart/form-data' not in content_type:
+                    self._send_response({'error': 'Formato inválido'}, 400)
+                    return
                 
-                # Obtener tipo de archivo para categorización
-                tipo_archivo = obtener_tipo_archivo(ext)
+                content_length = int(self.headers.get('Content-Length', 0))
+                if content_length == 0:
+                    self._send_response({'error': 'No se recibió archivo'}, 400)
+                    return
                 
-                # Obtener metadatos adicionales
-                file_size = len(file_data)
-                metadata_adicional = obtener_metadata_archivo(filepath, filename, file_size)
+                # Verificar tamaño máximo general
+                if content_length > MAX_UPLOAD_SIZE:
+                    max_gb = MAX_UPLOAD_SIZE / (1024 * 1024 * 1024)
+                    self._send_response({
+                        'error': f'Archivo demasiado grande',
+                        'detalle': f'Máximo permitido: {max_gb:.1f} GB'
+                    }, 400)
+                    return
                 
-                # Calcular hash del archivo
-                file_hash = obtener_hash_archivo(filepath)
+                boundary = obtener_boundary(content_type)
+                if not boundary:
+                    self._send_response({'error': 'Boundary no encontrado'}, 400)
+                    return
                 
-                # Actualizar metadata
-                metadata = cargar_metadata()
-                file_metadata = {
-                    'nombre': filename,
-                    'tipo': tipo_archivo,
-                    'extension': ext,
-                    'categoria': 'Sin categoría',
-                    'scroll': 0,
-                    'tamaño': file_size,
-                    'tamaño_mb': round(file_size / (1024 * 1024), 2),
-                    'tamaño_gb': round(file_size / (1024 * 1024 * 1024), 2),
-                    'fecha': datetime.now().isoformat(),
-                    'fecha_timestamp': datetime.now().timestamp(),
-                    'mime_type': obtener_tipo_mime(filename),
-                    'hash_sha256': file_hash
-                }
+                # Leer el cuerpo por bloques: el archivo va directo a un temporal en disco
+                lector = LectorMultipart(self.rfile, boundary, content_length)
+                partes = lector.partes()
+                filename = None
+                tmp_path = None
                 
-                # Añadir metadatos específicos
-                file_metadata.update(metadata_adicional)
-                metadata.append(file_metadata)
-                guardar_metadata(metadata)
-                
-                # Respuesta con información completa
-                response_data = {
-                    'mensaje': 'Archivo subido correctamente',
-                    'nombre': filename,
-                    'nombre_original': original_filename,
-                    'tipo': tipo_archivo,
-                    'tamaño': file_size,
-                    'tamaño_mb': round(file_size / (1024 * 1024), 2),
-                    'tamaño_gb': round(file_size / (1024 * 1024 * 1024), 2),
-                    'metadata': metadata_adicional
-                }
+                try:
+                    for parte in partes:
+                        if parte.filename is None:
+                            continue
+                        
+                        # Algunos navegadores envían la ruta completa del cliente
+                        filename = os.path.basename(parte.filename.replace('\\', '/'))
+                        if not filename:
+                            break
+                        
+                        # Verificar extensión permitida antes de recibir los datos
+                        if not es_extension_permitida(filename):
+                            self.close_connection = True
+                            self._send_response(error_extension_no_permitida(), 400)
+                            return
+                        
+                        # Verificar tamaño según tipo de archivo mientras se escribe
+                        _, ext = os.path.splitext(filename.lower())
+                        max_size = MAX_FILE_SIZES.get(ext, MAX_FILE_SIZES['default'])
+                        try:
+                            tmp_path, file_size, hashes = guardar_parte_en_temporal(parte, max_size)
+                        except ArchivoDemasiadoGrande:
+                            self.close_connection = True
+                            self._send_response(error_tamaño_maximo(ext, max_size), 400)
+                            return
+                        break
+                    
+                    # Consumir el resto del cuerpo
+                    for _ in partes:
+                        pass
+                except MultipartError as e:
+                    if tmp_path:
+                        eliminar_silencioso(tmp_path)
+                    self.close_connection = True
+                    self._send_response({'error': 'Formato inválido', 'detalle': str(e)}, 400)
+                    return
                 
-                if original_filename != filename:
-                    response_data['renombrado'] = True
-                    response_data['nombre_original'] = original_filename
+                if not filename or not tmp_path or file_size == 0:
+                    if tmp_path:
+                        eliminar_silencioso(tmp_path)
+                    self._send_response({'error': 'No se encontró archivo'}, 400)
+                    return
                 
-                self._send_response(response_data)
+                self._send_response(registrar_subida(tmp_path, filename, file_size, hashes))
                 
             except Exception as e:
                 print(f"Error en POST: {e}", file=sys.stderr)
                 self._send_response({'error': str(e)}, 500)
             return
         
+        # Contenidos ya guardados: consultar por hash y crear entradas sin subir nada
+        if self.path in ('/upload/comprobar', '/upload/referencia'):
+            try:
+                if self.path == '/upload/comprobar':
+                    self._comprobar_hashes()
+                else:
+                    self._crear_desde_hash()
+            except Exception as e:
+                print(f"Error en POST: {e}", file=sys.stderr)
+                self._send_response({'error': str(e)}, 500)
+            return
+        
+        # Varios archivos en una sola petición
+        if self.path == '/upload/lote':
+            try:
+                self._recibir_lote()
+            except Exception as e:
+                print(f"Error en POST: {e}", file=sys.stderr)
+                self._send_response({'error': str(e)}, 500)
+            return
+        
+        # Subidas por trozos: crear sesión y finalizarla
+        if self.path == '/upload/sesion' or self.path.startswith('/upload/sesion/'):
+            try:
+                ruta = self._ruta_sesion()
+                if not ruta:
+                    self._crear_sesion_subida()
+                    return
+                if len(ruta) == 2 and ruta[1] == 'finalizar':
+                    self._finalizar_sesion_subida(ruta[0])
+                    return
+            except Exception as e:
+                print(f"Error en POST: {e}", file=sys.stderr)
+                self._send_response({'error': str(e)}, 500)
+                return
+        
         self._send_response({'error': 'Ruta no encontrada'}, 404)
     
     # DELETE: /uploads/filename
@@ -721,29 +4307,32 @@ class FileHandler(http.server.SimpleHTTPRequestHandler):
         if self.path.startswith('/uploads/'):
             try:
                 filename = unquote(self.path[9:])
-                if '..' in filename or '/' in filename:
+                if not es_nombre_valido(filename):
                     self._send_response({'error': 'Ruta inválida'}, 400)
                     return
                 
                 filepath = os.path.join(UPLOAD_DIR, filename)
-                if not os.path.exists(filepath):
+                attrs = atributos.obtener(filename)
+                if attrs is None:
                     self._send_response({'error': 'Archivo no encontrado'}, 404)
                     return
                 
-                # Eliminar archivo
-                os.remove(filepath)
+                # Eliminar archivo (el contenido solo si ninguna otra entrada lo comparte)
+                entrada = indice.obtener(filename) or {}
+                liberado = liberar_objeto(filepath, entrada.get('hash_sha256'))
+                atributos.invalidar(filename)
+                if liberado:
+                    analisis.olvidar(attrs)
                 
                 # Actualizar metadata
-                metadata = cargar_metadata()
-                initial_count = len(metadata)
-                metadata = [m for m in metadata if m['nombre'] != filename]
-                guardar_metadata(metadata)
+                metadata_actualizada = indice.eliminar(filename)
                 
                 response = {
                     'mensaje': 'Archivo eliminado',
                     'archivo': filename,
                     'eliminado': True,
-                    'metadata_actualizada': len(metadata) < initial_count
+                    'contenido_liberado': liberado,
+                    'metadata_actualizada': metadata_actualizada
                 }
                 
                 self._send_response(response)
@@ -753,10 +4342,36 @@ class FileHandler(http.server.SimpleHTTPRequestHandler):
                 self._send_response({'error': str(e)}, 500)
             return
         
+        # Cancelar una subida por trozos
+        if self.path.startswith('/upload/sesion/'):
+            ruta = self._ruta_sesion()
+            sesion = obtener_sesion(ruta[0]) if len(ruta) == 1 else None
+            if sesion is None:
+                self._send_response({'error': 'Sesión no encontrada'}, 404)
+                return
+            
+            eliminar_sesion(sesion)
+            self._send_response({'mensaje': 'Subida cancelada', 'id': sesion.id, 'eliminado': True})
+            return
+        
         self._send_response({'error': 'Ruta no encontrada'}, 404)
     
-    # PUT: /update (para actualizar metadatos)
+    # PUT: /update (para actualizar metadatos), /upload/sesion/<id>/<n> (trozos)
     def do_PUT(self):
+        if self.path.startswith('/upload/sesion/'):
+            ruta = self._ruta_sesion()
+            if len(ruta) == 2:
+                try:
+                    self._recibir_chunk(ruta[0], ruta[1])
+                except (ConnectionError, socket.timeout) as e:
+                    # El trozo queda sin marcar como recibido: el cliente lo reintentará
+                    print(f"Trozo interrumpido: {e}", file=sys.stderr)
+                    self.close_connection = True
+                except Exception as e:
+                    print(f"Error en PUT: {e}", file=sys.stderr)
+                    self._send_response({'error': str(e)}, 500)
+                return
+        
         if self.path == '/update':
             try:
                 content_length = int(self.headers.get('Content-Length', 0))
@@ -770,25 +4385,14 @@ class FileHandler(http.server.SimpleHTTPRequestHandler):
                     self._send_response({'error': 'Falta nombre'}, 400)
                     return
                 
-                metadata = cargar_metadata()
-                encontrado = False
+                # Actualizar campos permitidos
+                campos_permitidos = ['scroll', 'categoria', 'tags', 'descripcion']
+                cambios = {campo: data[campo] for campo in campos_permitidos if campo in data}
                 
-                for item in metadata:
-                    if item['nombre'] == data['nombre']:
-                        # Actualizar campos permitidos
-                        campos_permitidos = ['scroll', 'categoria', 'tags', 'descripcion']
-                        for campo in campos_permitidos:
-                            if campo in data:
-                                item[campo] = data[campo]
-                        
-                        # Actualizar fecha de modificación
-                        item['ultima_modificacion'] = datetime.now().isoformat()
-                        
-                        encontrado = True
-                        break
+                # Actualizar fecha de modificación
+                cambios['ultima_modificacion'] = datetime.now().isoformat()
                 
-                if encontrado:
-                    guardar_metadata(metadata)
+                if indice.actualizar(data['nombre'], cambios):
                     self._send_response({
                         'mensaje': 'Actualizado',
                         'archivo': data['nombre'],
@@ -811,7 +4415,7 @@ class FileHandler(http.server.SimpleHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Requested-With')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Requested-With, Range, If-Range')
         self.send_header('Access-Control-Max-Age', '86400')
         self.end_headers()
     
@@ -821,15 +4425,94 @@ class FileHandler(http.server.SimpleHTTPRequestHandler):
         if '404' not in message:  # No loguear errores 404
             print(f"{self.address_string()} - {message}", file=sys.stderr)
 
+# ------------------ Servidor ------------------
+class ServidorConcurrente(http.server.HTTPServer):
+    """Servidor HTTP que atiende las conexiones en un pool de hilos acotado
+    
+    Los hilos del pool no son daemon y el intérprete los espera al salir: al cerrar
+    el servidor se cortan las conexiones abiertas para que terminen enseguida.
+    """
+    
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, max_workers=MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conexion')
+        # Con todos los hilos ocupados no se aceptan más conexiones: esperan
+        # en la cola de escucha del kernel en lugar de acumularse en memoria
+        self._huecos = threading.BoundedSemaphore(max_workers)
+        # Conexiones que se están atendiendo, para cortarlas al cerrar
+        self._abiertas = set()
+        self._abiertas_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+    
+    def process_request(self, request, client_address):
+        self._huecos.acquire()
+        try:
+            self._pool.submit(self._atender, request, client_address)
+        except:
+            self._huecos.release()
+            self.shutdown_request(request)
+            raise
+    
+    def _atender(self, request, client_address):
+        with self._abiertas_lock:
+            self._abiertas.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._abiertas_lock:
+                self._abiertas.discard(request)
+            self.shutdown_request(request)
+            self._huecos.release()
+    
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        # Un cliente inactivo (keep-alive, long-poll) retendría su hilo hasta SOCKET_TIMEOUT
+        with self._abiertas_lock:
+            abiertas = list(self._abiertas)
+        for request in abiertas:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
 # ------------------ Inicio ------------------
 if __name__ == '__main__':
     # Inicializar mimetypes
     mimetypes.init()
     
     # Inicializar metadata si no existe
-    if not os.path.exists(BIBLIOTECA_JSON):
+    if ALMACEN_CATALOGO == 'json' and not os.path.exists(BIBLIOTECA_JSON):
         guardar_metadata([])
     
+    # Guardado del catálogo por lotes en segundo plano
+    indice.iniciar()
+    
+    # Caché de atributos de UPLOAD_DIR, refrescada con inotify (o sondeo)
+    atributos.iniciar()
+    
+    # Frontend en memoria, recargado al cambiar sus archivos
+    estaticos.iniciar()
+    
+    # Índice de búsqueda: se pone al día en segundo plano y sigue los cambios del catálogo
+    busqueda.iniciar()
+    
+    # Sufijos _N ya usados, para asignar nombres nuevos sin recorrer el directorio
+    nombres.cargar(item['nombre'] for item in indice.listar())
+    
+    # Análisis que quedaron a medias en la ejecución anterior
+    reanudados = cola_analisis.reanudar_pendientes()
+    
+    # Archivos que aún no están en el almacén por contenido
+    if ALMACEN_POR_CONTENIDO:
+        threading.Thread(target=migrar_al_almacen, name='migracion-almacen', daemon=True).start()
+    
+    # Detener con SIGTERM igual que con Ctrl+C, guardando los cambios pendientes
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     print("=" * 60)
     print("🖥️  GESTOR DE ARCHIVOS - SERVIDOR")
     print("=" * 60)
@@ -868,12 +4551,30 @@ if __name__ == '__main__':
     print("   • Análisis automático de metadatos")
     print("   • Streaming para archivos grandes")
     print("   • Hashes SHA256 para verificación")
+    print(f"   • Conexiones concurrentes (hasta {MAX_WORKERS})")
+    print(f"   • Catálogo en memoria ({len(indice)} archivos, almacenamiento {ALMACEN_CATALOGO})")
+    print(f"   • Caché de atributos de archivos ({atributos.modo})")
+    print("   • Frontend servido desde memoria, recargado al editarlo")
+    print(f"   • Análisis en segundo plano ({ANALISIS_WORKERS} hilos, {reanudados} reanudados)")
+    print("   • Feed de cambios del catálogo en /cambios (long-poll)")
+    if busqueda.disponible:
+        print("   • Búsqueda de texto completo en /search")
+    if ALMACEN_POR_CONTENIDO:
+        print("   • Almacén por contenido (archivos idénticos se guardan una vez)")
     print("=" * 60)
     print("🚀 Servidor iniciado. Presiona Ctrl+C para detener.")
     print("=" * 60)
     
-    with socketserver.TCPServer(('', PORT), FileHandler) as httpd:
+    with ServidorConcurrente(('', PORT), FileHandler) as httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\n👋 Servidor detenido")
\ No newline at end of file
+            print("\n👋 Servidor detenido")
+        finally:
+            # Los análisis no empezados siguen 'pendiente' en el catálogo y se reanudan al arrancar
+            cola_analisis.cerrar()
+            cola_variantes.cerrar()
+            busqueda.cerrar()
+            indice.liberar_esperas()
+            # No perder los cambios pendientes de guardar
+            indice.guardar()
\ No newline at end of file
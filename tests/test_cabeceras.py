@@ -0,0 +1,341 @@
+import io
+import struct
+import unittest
+import uuid
+
+from server import (SECTOR_ISO, VDI_FIRMA, VHDX_PARAMETROS, VHDX_REGION_METADATOS, VHDX_SECTOR_FISICO,
+                    VHDX_SECTOR_LOGICO, VHDX_TAMAÑO_VIRTUAL, leer_cabecera_disco, leer_cabecera_dmg,
+                    leer_cabecera_iso, leer_cabecera_vdi, leer_cabecera_vhd, leer_cabecera_vhdx)
+
+class LecturaVigilada(io.BytesIO):
+    """BytesIO que recuerda la mayor lectura pedida"""
+    
+    mayor_lectura = 0
+    
+    def read(self, n=-1):
+        self.mayor_lectura = max(self.mayor_lectura, n)
+        return super().read(n)
+
+def sector(datos):
+    return bytes(datos).ljust(SECTOR_ISO, b'\x00')
+
+def imagen_iso(descriptores, extra=None, sectores=300):
+    """ISO con los descriptores de volumen desde el sector 16 y sectores extra {número: datos}"""
+    imagen = bytearray(SECTOR_ISO * sectores)
+    for i, descriptor in enumerate(descriptores):
+        imagen[(16 + i) * SECTOR_ISO:(17 + i) * SECTOR_ISO] = sector(descriptor)
+    for numero, datos in (extra or {}).items():
+        imagen[numero * SECTOR_ISO:numero * SECTOR_ISO + len(datos)] = datos
+    return bytes(imagen)
+
+def pvd(etiqueta=b'Ubuntu 24.04 LTS amd64', fecha=b'2024042510300000\x00'):
+    d = bytearray(SECTOR_ISO)
+    d[0], d[1:6], d[6] = 1, b'CD001', 1
+    d[8:40] = b'LINUX'.ljust(32)
+    d[40:72] = etiqueta.ljust(32)
+    struct.pack_into('<I', d, 80, 300)
+    struct.pack_into('<H', d, 128, SECTOR_ISO)
+    d[318:446] = b'Canonical'.ljust(128)
+    d[574:702] = b'xorriso'.ljust(128)
+    d[813:830] = fecha
+    return d
+
+def descriptor(tipo, identificador=b'CD001'):
+    d = bytearray(SECTOR_ISO)
+    d[0], d[1:6], d[6] = tipo, identificador, 1
+    return d
+
+def arranque_el_torito(sector_catalogo):
+    d = descriptor(0)
+    d[7:30] = b'EL TORITO SPECIFICATION'
+    struct.pack_into('<I', d, 71, sector_catalogo)
+    return d
+
+def catalogo_el_torito():
+    """Entrada de validación BIOS con una entrada arrancable y una sección UEFI"""
+    c = bytearray(SECTOR_ISO)
+    c[0], c[1], c[30:32] = 0x01, 0x00, b'\x55\xaa'
+    c[32], c[33] = 0x88, 0x00
+    c[64], c[65], c[66] = 0x91, 0xEF, 1
+    c[96] = 0x88
+    return c
+
+def ancla_udf(longitud, ubicacion):
+    a = bytearray(SECTOR_ISO)
+    struct.pack_into('<H', a, 0, 2)
+    struct.pack_into('<II', a, 16, longitud, ubicacion)
+    return a
+
+def volumen_udf(etiqueta):
+    v = bytearray(SECTOR_ISO)
+    struct.pack_into('<H', v, 0, 1)
+    v[24] = 8
+    v[25:25 + len(etiqueta)] = etiqueta
+    v[55] = len(etiqueta) + 1
+    return v
+
+class CabeceraIsoTest(unittest.TestCase):
+    
+    def test_pvd(self):
+        info = leer_cabecera_iso(io.BytesIO(imagen_iso([pvd(), descriptor(255)])))
+        self.assertEqual(info, {
+            'file_system': 'ISO9660', 'system_id': 'LINUX', 'volume_label': 'Ubuntu 24.04 LTS amd64',
+            'volume_size': 300 * SECTOR_ISO, 'publisher': 'Canonical', 'application': 'xorriso',
+            'created': '2024-04-25T10:30:00',
+        })
+    
+    def test_fecha_invalida_se_omite(self):
+        for fecha in (b'0' * 16 + b'\x00', b'2024139910300000\x00', b' ' * 17):
+            with self.subTest(fecha=fecha):
+                info = leer_cabecera_iso(io.BytesIO(imagen_iso([pvd(fecha=fecha), descriptor(255)])))
+                self.assertNotIn('created', info)
+    
+    def test_el_torito_y_joliet(self):
+        joliet = descriptor(2)
+        joliet[88:91] = b'%/E'
+        datos = imagen_iso([pvd(), arranque_el_torito(40), joliet, descriptor(255)], {40: catalogo_el_torito()})
+        info = leer_cabecera_iso(io.BytesIO(datos))
+        self.assertTrue(info['el_torito'])
+        self.assertEqual(info['boot_platforms'], ['BIOS', 'UEFI'])
+        self.assertEqual(info['boot_emulation'], 'no emulation')
+        self.assertTrue(info['joliet'])
+    
+    def test_catalogo_el_torito_fuera_del_archivo(self):
+        datos = imagen_iso([pvd(), arranque_el_torito(0xFFFFFFF0), descriptor(255)])
+        info = leer_cabecera_iso(io.BytesIO(datos))
+        self.assertEqual(info['boot_platforms'], [])
+        self.assertNotIn('boot_emulation', info)
+    
+    def test_catalogo_el_torito_sin_validacion(self):
+        catalogo = catalogo_el_torito()
+        catalogo[30:32] = b'\x00\x00'
+        datos = imagen_iso([pvd(), arranque_el_torito(40), descriptor(255)], {40: catalogo})
+        self.assertEqual(leer_cabecera_iso(io.BytesIO(datos))['boot_platforms'], [])
+    
+    def test_udf_junto_a_iso9660(self):
+        datos = imagen_iso([pvd(etiqueta=b''), descriptor(255), descriptor(0, b'BEA01'), descriptor(0, b'NSR02'),
+                            descriptor(0, b'TEA01')],
+                           {256: ancla_udf(4 * SECTOR_ISO, 257), 257: volumen_udf(b'UDF_VOL')})
+        info = leer_cabecera_iso(io.BytesIO(datos))
+        self.assertEqual(info['file_system'], 'ISO9660/UDF')
+        self.assertEqual(info['volume_label'], 'UDF_VOL')
+    
+    def test_solo_udf(self):
+        datos = imagen_iso([descriptor(0, b'BEA01'), descriptor(0, b'NSR03'), descriptor(0, b'TEA01')],
+                           {256: ancla_udf(SECTOR_ISO, 257), 257: volumen_udf(b'DATOS')})
+        self.assertEqual(leer_cabecera_iso(io.BytesIO(datos)), {'file_system': 'UDF', 'volume_label': 'DATOS'})
+    
+    def test_ancla_udf_hostil(self):
+        # Longitud enorme y ubicación fuera del archivo: se recorre poco y sin etiqueta
+        datos = imagen_iso([descriptor(0, b'BEA01'), descriptor(0, b'NSR02'), descriptor(0, b'TEA01')],
+                           {256: ancla_udf(0xFFFFFFFF, 0xFFFFFF00)})
+        f = LecturaVigilada(datos)
+        self.assertEqual(leer_cabecera_iso(f), {'file_system': 'UDF'})
+        self.assertLessEqual(f.mayor_lectura, SECTOR_ISO)
+    
+    def test_no_es_iso(self):
+        self.assertIsNone(leer_cabecera_iso(io.BytesIO(bytes(SECTOR_ISO * 40))))
+        self.assertIsNone(leer_cabecera_iso(io.BytesIO(b'')))
+    
+    def test_truncada(self):
+        datos = imagen_iso([pvd(), descriptor(255)])
+        self.assertIsNone(leer_cabecera_iso(io.BytesIO(datos[:16 * SECTOR_ISO + 100])))
+
+def mbr(particiones):
+    """Sector 0 con particiones (activa, tipo, sectores)"""
+    s = bytearray(512)
+    for i, (activa, tipo, sectores) in enumerate(particiones):
+        entrada = 446 + i * 16
+        s[entrada] = 0x80 if activa else 0
+        s[entrada + 4] = tipo
+        struct.pack_into('<II', s, entrada + 8, 2048, sectores)
+    s[510:512] = b'\x55\xaa'
+    return s
+
+class CabeceraDiscoTest(unittest.TestCase):
+    
+    def test_mbr(self):
+        datos = bytes(mbr([(True, 0x83, 100000), (False, 0x82, 2048)])) + bytes(4096)
+        info = leer_cabecera_disco(io.BytesIO(datos), len(datos))
+        self.assertEqual(info, {
+            'partition_table': 'MBR', 'bootable': True,
+            'partitions': [{'type': 'Linux', 'size': 100000 * 512, 'bootable': True},
+                           {'type': 'Linux swap', 'size': 2048 * 512, 'bootable': False}],
+        })
+    
+    def test_tipo_desconocido(self):
+        datos = bytes(mbr([(False, 0x42, 10)]))
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(datos), 512)['partitions'][0]['type'], '0x42')
+    
+    def test_gpt(self):
+        datos = bytes(mbr([(False, 0xEE, 0xFFFFFFFF)])) + b'EFI PART' + bytes(504)
+        info = leer_cabecera_disco(io.BytesIO(datos), len(datos))
+        self.assertEqual(info['partition_table'], 'GPT')
+        self.assertTrue(info['bootable'])
+    
+    def test_gpt_protector_sin_cabecera_gpt(self):
+        datos = bytes(mbr([(False, 0xEE, 100)])) + bytes(512)
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(datos), len(datos))['partition_table'], 'MBR')
+    
+    def test_fat32(self):
+        s = bytearray(512)
+        s[71:82] = b'MI_USB     '
+        s[82:87] = b'FAT32'
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(bytes(s)), 512),
+                         {'file_system': 'FAT32', 'volume_label': 'MI_USB'})
+    
+    def test_ext(self):
+        datos = bytearray(4096)
+        datos[1024 + 56:1024 + 58] = b'\x53\xef'
+        datos[1024 + 120:1024 + 125] = b'raiz\x00'
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(bytes(datos)), 4096),
+                         {'file_system': 'ext', 'volume_label': 'raiz'})
+    
+    def test_truncada_o_vacia(self):
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(b'\x55\xaa' * 100), 200), {})
+        self.assertEqual(leer_cabecera_disco(io.BytesIO(bytes(512)), 512), {})
+
+class CabeceraDmgTest(unittest.TestCase):
+    
+    def test_koly(self):
+        trailer = bytearray(512)
+        trailer[:4] = b'koly'
+        struct.pack_into('>Q', trailer, 492, 2048)
+        datos = bytes(10000) + bytes(trailer)
+        self.assertEqual(leer_cabecera_dmg(io.BytesIO(datos), len(datos)),
+                         {'file_system': 'UDIF', 'virtual_size': 2048 * 512})
+    
+    def test_sin_trailer_o_pequeña(self):
+        self.assertIsNone(leer_cabecera_dmg(io.BytesIO(bytes(4096)), 4096))
+        self.assertIsNone(leer_cabecera_dmg(io.BytesIO(b'koly'), 4))
+
+def pie_vhd(tipo=2, tamaño=4 * 1024 * 1024):
+    p = bytearray(512)
+    p[0:8] = b'conectix'
+    struct.pack_into('>I', p, 24, 700000000)
+    p[28:32] = b'qemu'
+    p[36:40] = b'Wi2k'
+    struct.pack_into('>QQ', p, 40, tamaño, tamaño)
+    struct.pack_into('>HBB', p, 56, 120, 16, 63)
+    struct.pack_into('>I', p, 60, tipo)
+    p[68:84] = uuid.UUID(int=1).bytes
+    return bytes(p)
+
+class CabeceraVhdTest(unittest.TestCase):
+    
+    def test_fijo(self):
+        datos = bytes(8192) + pie_vhd()
+        self.assertEqual(leer_cabecera_vhd(io.BytesIO(datos), len(datos)), {
+            'virtual_size': 4 * 1024 * 1024, 'allocation': 'fixed', 'creator': 'qemu', 'creator_os': 'Windows',
+            'geometry': {'cylinders': 120, 'heads': 16, 'sectors': 63},
+            'created': '2022-03-07T20:26:40+00:00', 'uuid': str(uuid.UUID(int=1)),
+        })
+    
+    def test_copia_al_principio(self):
+        # Un dinámico con el pie del final dañado se lee de la copia inicial
+        datos = pie_vhd(tipo=3) + bytes(8192)
+        self.assertEqual(leer_cabecera_vhd(io.BytesIO(datos), len(datos))['allocation'], 'dynamic')
+    
+    def test_no_es_vhd(self):
+        self.assertIsNone(leer_cabecera_vhd(io.BytesIO(bytes(1024)), 1024))
+        self.assertIsNone(leer_cabecera_vhd(io.BytesIO(b''), 0))
+
+def imagen_vhdx(elementos, entradas_region=None, entradas_metadatos=None):
+    """VHDX mínimo: identificador, tabla de regiones y región de metadatos con elementos (guid, offset, longitud, datos)"""
+    offset_metadatos = 1024 * 1024
+    imagen = bytearray(offset_metadatos + 64 * 1024)
+    imagen[0:8] = b'vhdxfile'
+    creador = 'pruebas'.encode('utf-16-le')
+    imagen[8:8 + len(creador)] = creador
+    
+    tabla = bytearray(64 * 1024)
+    tabla[0:4] = b'regi'
+    struct.pack_into('<I', tabla, 8, 1 if entradas_region is None else entradas_region)
+    tabla[16:32] = VHDX_REGION_METADATOS.bytes_le
+    struct.pack_into('<QII', tabla, 32, offset_metadatos, 64 * 1024, 1)
+    imagen[192 * 1024:256 * 1024] = tabla
+    
+    metadatos = bytearray(64 * 1024)
+    metadatos[0:8] = b'metadata'
+    struct.pack_into('<H', metadatos, 10, len(elementos) if entradas_metadatos is None else entradas_metadatos)
+    for i, (guid, offset, longitud, datos) in enumerate(elementos):
+        entrada = 32 + i * 32
+        metadatos[entrada:entrada + 16] = guid.bytes_le
+        struct.pack_into('<II', metadatos, entrada + 16, offset, longitud)
+        if datos and offset + len(datos) <= len(metadatos):
+            metadatos[offset:offset + len(datos)] = datos
+    imagen[offset_metadatos:] = metadatos
+    return bytes(imagen)
+
+ELEMENTOS_VHDX = [
+    (VHDX_PARAMETROS, 0x8000, 8, struct.pack('<II', 32 * 1024 * 1024, 0)),
+    (VHDX_TAMAÑO_VIRTUAL, 0x8040, 8, struct.pack('<Q', 127 * 1024 ** 3)),
+    (VHDX_SECTOR_LOGICO, 0x8080, 4, struct.pack('<I', 512)),
+    (VHDX_SECTOR_FISICO, 0x80C0, 4, struct.pack('<I', 4096)),
+]
+
+class CabeceraVhdxTest(unittest.TestCase):
+    
+    def test_metadatos(self):
+        datos = imagen_vhdx(ELEMENTOS_VHDX)
+        self.assertEqual(leer_cabecera_vhdx(io.BytesIO(datos), len(datos)), {
+            'creator': 'pruebas', 'virtual_size': 127 * 1024 ** 3, 'block_size': 32 * 1024 * 1024,
+            'allocation': 'dynamic', 'logical_sector_size': 512, 'physical_sector_size': 4096,
+        })
+    
+    def test_longitudes_hostiles_no_se_leen_enteras(self):
+        elementos = [(guid, offset, 0xFFFFFFFF, valor) for guid, offset, _, valor in ELEMENTOS_VHDX]
+        # Muchas entradas desconocidas con longitudes enormes
+        elementos += [(uuid.UUID(int=i), 0, 0xFFFFFFFF, b'') for i in range(1, 1000)]
+        datos = imagen_vhdx(elementos, entradas_metadatos=0xFFFF)
+        f = LecturaVigilada(datos)
+        info = leer_cabecera_vhdx(f, len(datos))
+        self.assertEqual(info['virtual_size'], 127 * 1024 ** 3)
+        self.assertLessEqual(f.mayor_lectura, 64 * 1024)
+    
+    def test_elemento_corto_o_fuera_del_archivo(self):
+        elementos = [(VHDX_TAMAÑO_VIRTUAL, 0x8040, 4, b''),  # Más corto de lo necesario
+                     (VHDX_PARAMETROS, 0xFFFFFF00, 8, b'')]  # Fuera del archivo
+        datos = imagen_vhdx(elementos)
+        self.assertEqual(leer_cabecera_vhdx(io.BytesIO(datos), len(datos)), {'creator': 'pruebas'})
+    
+    def test_sin_region_de_metadatos(self):
+        datos = imagen_vhdx(ELEMENTOS_VHDX, entradas_region=0)
+        self.assertEqual(leer_cabecera_vhdx(io.BytesIO(datos), len(datos)), {'creator': 'pruebas'})
+    
+    def test_truncado(self):
+        datos = imagen_vhdx(ELEMENTOS_VHDX)[:200 * 1024]
+        self.assertEqual(leer_cabecera_vhdx(io.BytesIO(datos), len(datos)), {'creator': 'pruebas'})
+        self.assertIsNone(leer_cabecera_vhdx(io.BytesIO(b'vhdx'), 4))
+
+def cabecera_vdi(version=1, tipo=1):
+    h = bytearray(0x200)
+    struct.pack_into('<IHH', h, 0x40, VDI_FIRMA, 1, version)
+    struct.pack_into('<I', h, 0x4C, tipo)
+    h[0x54:0x58] = b'test'
+    struct.pack_into('<Q', h, 0x170, 20 * 1024 ** 3)
+    struct.pack_into('<IIII', h, 0x178, 1024 * 1024, 0, 20480, 37)
+    h[0x188:0x198] = uuid.UUID(int=2).bytes_le
+    return bytes(h)
+
+class CabeceraVdiTest(unittest.TestCase):
+    
+    def test_cabecera(self):
+        datos = cabecera_vdi()
+        self.assertEqual(leer_cabecera_vdi(io.BytesIO(datos), len(datos)), {
+            'virtual_size': 20 * 1024 ** 3, 'allocation': 'dynamic', 'block_size': 1024 * 1024,
+            'blocks': 20480, 'blocks_allocated': 37, 'description': 'test', 'uuid': str(uuid.UUID(int=2)),
+        })
+    
+    def test_otra_version(self):
+        datos = cabecera_vdi(version=2)
+        self.assertEqual(leer_cabecera_vdi(io.BytesIO(datos), len(datos)), {'version': '2.1'})
+    
+    def test_firma_incorrecta_o_truncada(self):
+        datos = bytearray(cabecera_vdi())
+        datos[0x40] ^= 0xFF
+        self.assertIsNone(leer_cabecera_vdi(io.BytesIO(bytes(datos)), len(datos)))
+        self.assertIsNone(leer_cabecera_vdi(io.BytesIO(cabecera_vdi()[:0x100]), 0x100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+from server import IndiceBiblioteca, claves_indice, decodificar_cursor
+
+class AlmacenMemoria:
+    """Almacenamiento del catálogo que no toca el disco"""
+    
+    escritura_completa = True
+    
+    def __init__(self, entradas):
+        self.entradas = entradas
+    
+    def cargar(self):
+        return [dict(item) for item in self.entradas]
+    
+    def guardar(self, modificadas, eliminadas, todas):
+        pass
+
+def entrada(i):
+    extensiones = ('.pdf', '.txt', '.iso', '.zip')
+    return {
+        'nombre': f'Archivo_{i % 7}_{i:03d}{extensiones[i % 4]}',
+        'tamaño': (i * 37) % 50,  # Tamaños repetidos: el nombre deshace el empate
+        'fecha_timestamp': 1700000000 + (i * 13) % 40,
+        'categoria': 'rara' if i % 20 == 0 else 'general'
+    }
+
+class ConsultarTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.indice = IndiceBiblioteca(AlmacenMemoria([entrada(i) for i in range(60)]))
+        self.indice.cargar()
+    
+    def esperado(self, orden, descendente=False, filtros=None, rangos=None):
+        """Nombres que debería devolver consultar, calculados recorriendo todo el catálogo"""
+        filas = []
+        for item in self.indice.listar():
+            claves = claves_indice(item)
+            if any(claves[campo] not in valores for campo, valores in (filtros or {}).items()):
+                continue
+            if any((minimo is not None and claves[campo][0] < minimo)
+                   or (maximo is not None and claves[campo][0] > maximo)
+                   for campo, (minimo, maximo) in (rangos or {}).items()):
+                continue
+            filas.append((claves[orden], item['nombre']))
+        filas.sort(reverse=descendente)
+        return [nombre for _, nombre in filas]
+    
+    def paginar(self, limite, **parametros):
+        """Recorre todas las páginas siguiendo el cursor; devuelve (nombres, totales)"""
+        nombres, totales, cursor = [], set(), None
+        while True:
+            pagina, siguiente, total = self.indice.consultar(limite=limite, cursor=cursor, **parametros)
+            self.assertLessEqual(len(pagina), limite)
+            nombres += [item['nombre'] for item in pagina]
+            totales.add(total)
+            if siguiente is None:
+                return nombres, totales
+            cursor = decodificar_cursor(siguiente)
+    
+    def test_paginas_sin_huecos_ni_repetidos(self):
+        casos = [
+            {},
+            {'filtros': {'extension': ['.txt']}},
+            {'filtros': {'categoria': ['rara']}},  # Pocos candidatos: se ordenan aparte
+            {'filtros': {'extension': ['.pdf', '.iso'], 'categoria': ['general']}},
+            {'rangos': {'tamaño': (10, 30)}},
+            {'rangos': {'fecha': (1700000010, None)}, 'filtros': {'tipo': ['documento']}},
+        ]
+        for orden in ('nombre', 'fecha', 'tamaño'):
+            for descendente in (False, True):
+                for caso in casos:
+                    for limite in (1, 4, 100):
+                        with self.subTest(orden=orden, descendente=descendente, limite=limite, **caso):
+                            nombres, totales = self.paginar(limite, orden=orden, descendente=descendente, **caso)
+                            esperado = self.esperado(orden, descendente, caso.get('filtros'), caso.get('rangos'))
+                            self.assertEqual(nombres, esperado)
+                            totales.discard(None)
+                            self.assertLessEqual(totales, {len(esperado)})
+    
+    def test_pagina_vacia_con_filtro_sin_coincidencias(self):
+        self.assertEqual(self.indice.consultar(filtros={'extension': ['.exe']}), ([], None, 0))
+    
+    def test_cambios_entre_paginas(self):
+        pagina, siguiente, _ = self.indice.consultar(orden='nombre', limite=10)
+        vistos = [item['nombre'] for item in pagina]
+        
+        # Borrar lo ya visto y añadir antes y después del cursor no repite ni salta nada
+        for nombre in vistos[:5]:
+            self.indice.eliminar(nombre)
+        self.indice.agregar({'nombre': 'aaa_antes.txt', 'tamaño': 1})
+        self.indice.agregar({'nombre': 'zzz_despues.txt', 'tamaño': 1})
+        
+        resto, cursor = [], decodificar_cursor(siguiente)
+        while cursor is not None:
+            pagina, siguiente, _ = self.indice.consultar(orden='nombre', limite=10, cursor=cursor)
+            resto += [item['nombre'] for item in pagina]
+            cursor = decodificar_cursor(siguiente) if siguiente else None
+        
+        self.assertNotIn('aaa_antes.txt', resto)
+        self.assertEqual(resto, [nombre for nombre in self.esperado('nombre') if nombre.lower() > vistos[-1].lower()])
+        self.assertEqual(resto[-1], 'zzz_despues.txt')
+    
+    def test_cursor_invalido(self):
+        for cursor in ('no-es-base64!', 'W10=', 'eyJhIjogMX0='):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decodificar_cursor(cursor)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import unittest
+
+from server import LectorMultipart, MultipartError
+
+BOUNDARY = b'----limite123'
+
+def cuerpo(*partes, preambulo=b'', epilogo=b''):
+    """Cuerpo multipart/form-data con las partes (nombre, filename, datos) dadas"""
+    trozos = [preambulo]
+    for nombre, filename, datos in partes:
+        disposicion = f'form-data; name="{nombre}"'
+        if filename is not None:
+            disposicion += f'; filename="{filename}"'
+        trozos.append(b'--' + BOUNDARY + b'\r\n')
+        trozos.append(f'Content-Disposition: {disposicion}\r\n\r\n'.encode('utf-8'))
+        trozos.append(datos + b'\r\n')
+    trozos.append(b'--' + BOUNDARY + b'--\r\n' + epilogo)
+    return b''.join(trozos)
+
+def leer_partes(datos, chunk_size=7, content_length=None):
+    """[(name, filename, datos)] de un cuerpo, leyendo del socket en bloques de chunk_size"""
+    if content_length is None:
+        content_length = len(datos)
+    lector = LectorMultipart(io.BytesIO(datos), BOUNDARY, content_length, chunk_size)
+    return [(parte.name, parte.filename, b''.join(parte.bloques())) for parte in lector.partes()]
+
+class LectorMultipartTest(unittest.TestCase):
+    
+    def test_varias_partes(self):
+        datos = cuerpo(('campo', None, b'valor'), ('file', 'a.txt', b'contenido\r\nde a'))
+        self.assertEqual(leer_partes(datos), [('campo', None, b'valor'), ('file', 'a.txt', b'contenido\r\nde a')])
+    
+    def test_delimitador_partido_entre_lecturas(self):
+        # Con cualquier tamaño de bloque el delimitador cae partido en algún punto
+        contenido = bytes(range(256)) * 3
+        datos = cuerpo(('file', 'b.bin', contenido), ('otro', None, b'x'))
+        for chunk_size in range(1, len(BOUNDARY) + 8):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(leer_partes(datos, chunk_size),
+                                 [('file', 'b.bin', contenido), ('otro', None, b'x')])
+    
+    def test_datos_parecidos_al_delimitador(self):
+        # Prefijos del delimitador dentro de los datos no cortan la parte
+        contenido = b'a\r\n--' + BOUNDARY[:-1] + b'b\r\n-\r\n--' + BOUNDARY[:3]
+        for chunk_size in (1, 5, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(leer_partes(cuerpo(('file', 'c.txt', contenido)), chunk_size),
+                                 [('file', 'c.txt', contenido)])
+    
+    def test_parte_vacia(self):
+        self.assertEqual(leer_partes(cuerpo(('file', 'vacio.txt', b''))), [('file', 'vacio.txt', b'')])
+    
+    def test_preambulo_y_epilogo_se_descartan(self):
+        datos = cuerpo(('file', 'd.txt', b'hola'), preambulo=b'basura inicial\r\n', epilogo=b'basura final')
+        self.assertEqual(leer_partes(datos), [('file', 'd.txt', b'hola')])
+    
+    def test_parte_no_consumida_se_salta(self):
+        datos = cuerpo(('a', 'a.txt', b'1' * 1000), ('b', 'b.txt', b'2'))
+        lector = LectorMultipart(io.BytesIO(datos), BOUNDARY, len(datos), 16)
+        nombres = [parte.name for parte in lector.partes()]
+        self.assertEqual(nombres, ['a', 'b'])
+    
+    def test_no_lee_mas_alla_de_content_length(self):
+        datos = cuerpo(('file', 'e.txt', b'dato'))
+        rfile = io.BytesIO(datos + b'siguiente peticion')
+        lector = LectorMultipart(rfile, BOUNDARY, len(datos), 5)
+        self.assertEqual([b''.join(parte.bloques()) for parte in lector.partes()], [b'dato'])
+        self.assertEqual(rfile.read(), b'siguiente peticion')
+    
+    def test_cuerpo_truncado(self):
+        datos = cuerpo(('file', 'f.txt', b'x' * 100))
+        with self.assertRaises(MultipartError):
+            leer_partes(datos[:60])
+    
+    def test_conexion_cerrada_antes_de_tiempo(self):
+        datos = cuerpo(('file', 'g.txt', b'x' * 100))
+        with self.assertRaises(MultipartError):
+            leer_partes(datos[:60], content_length=len(datos))
+    
+    def test_delimitador_mal_formado(self):
+        datos = b'--' + BOUNDARY + b'XX\r\n\r\ndatos\r\n--' + BOUNDARY + b'--\r\n'
+        with self.assertRaises(MultipartError):
+            leer_partes(datos)
+    
+    def test_cabeceras_demasiado_grandes(self):
+        datos = (b'--' + BOUNDARY + b'\r\nX-Relleno: ' + b'a' * (LectorMultipart.MAX_CABECERAS + 10)
+                 + b'\r\n\r\nx\r\n--' + BOUNDARY + b'--\r\n')
+        with self.assertRaises(MultipartError):
+            leer_partes(datos, chunk_size=4096)
+
+if __name__ == '__main__':
+    unittest.main()
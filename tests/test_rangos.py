@@ -0,0 +1,62 @@
+import unittest
+
+from server import MAX_RANGOS, parsear_rangos
+
+class ParsearRangosTest(unittest.TestCase):
+    
+    def test_rango_simple(self):
+        self.assertEqual(parsear_rangos('bytes=0-99', 1000), [(0, 99)])
+    
+    def test_rango_abierto(self):
+        self.assertEqual(parsear_rangos('bytes=900-', 1000), [(900, 999)])
+    
+    def test_fin_mas_alla_del_archivo_se_recorta(self):
+        self.assertEqual(parsear_rangos('bytes=990-5000', 1000), [(990, 999)])
+    
+    def test_sufijo(self):
+        self.assertEqual(parsear_rangos('bytes=-100', 1000), [(900, 999)])
+    
+    def test_sufijo_mayor_que_el_archivo(self):
+        self.assertEqual(parsear_rangos('bytes=-5000', 1000), [(0, 999)])
+    
+    def test_sufijo_cero_no_es_satisfacible(self):
+        self.assertEqual(parsear_rangos('bytes=-0', 1000), [])
+    
+    def test_archivo_vacio(self):
+        self.assertEqual(parsear_rangos('bytes=-10', 0), [])
+        self.assertEqual(parsear_rangos('bytes=0-', 0), [])
+    
+    def test_inicio_fuera_del_archivo(self):
+        self.assertEqual(parsear_rangos('bytes=1000-1100', 1000), [])
+        self.assertEqual(parsear_rangos('bytes=1000-', 1000), [])
+    
+    def test_fuera_del_archivo_se_ignora_entre_otros(self):
+        self.assertEqual(parsear_rangos('bytes=2000-2100, 0-9', 1000), [(0, 9)])
+    
+    def test_solapados_y_contiguos_se_unen(self):
+        self.assertEqual(parsear_rangos('bytes=0-99, 50-149, 150-199', 1000), [(0, 199)])
+        self.assertEqual(parsear_rangos('bytes=500-599, 0-9, -450', 1000), [(0, 9), (500, 999)])
+    
+    def test_separados_se_mantienen_ordenados(self):
+        self.assertEqual(parsear_rangos('bytes=200-299, 0-9', 1000), [(0, 9), (200, 299)])
+    
+    def test_espacios_y_partes_vacias(self):
+        self.assertEqual(parsear_rangos('bytes= 0-9 ,, 20-29 ', 1000), [(0, 9), (20, 29)])
+    
+    def test_cabeceras_invalidas_se_ignoran(self):
+        for cabecera in ('items=0-9', 'bytes=', 'bytes=abc', 'bytes=5', 'bytes=-', 'bytes=9-0',
+                         'bytes=0-9x', 'bytes=-1-2', 'bytes=+1-2', '0-9'):
+            with self.subTest(cabecera=cabecera):
+                self.assertIsNone(parsear_rangos(cabecera, 1000))
+    
+    def test_unidad_sin_distinguir_mayusculas(self):
+        self.assertEqual(parsear_rangos('Bytes=0-0', 10), [(0, 0)])
+    
+    def test_demasiados_rangos(self):
+        muchos = ', '.join(f'{i * 10}-{i * 10}' for i in range(MAX_RANGOS + 1))
+        self.assertIsNone(parsear_rangos(f'bytes={muchos}', 10000))
+        justos = ', '.join(f'{i * 10}-{i * 10}' for i in range(MAX_RANGOS))
+        self.assertEqual(len(parsear_rangos(f'bytes={justos}', 10000)), MAX_RANGOS)
+
+if __name__ == '__main__':
+    unittest.main()